@@ -0,0 +1,324 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import numpy as np
+
+import config
+
+
+class AttendanceColumns:
+    """Columnar (NumPy) view of attendance records over a date range"""
+    
+    def __init__(self, start_date, num_days, user_ids, user_departments, departments,
+                 user, day, seconds, schedule, schedule_start):
+        self.start_date = start_date
+        self.num_days = num_days
+        
+        # Roster: one entry per user ordinal
+        self.user_ids = np.asarray(user_ids)
+        self.user_departments = np.asarray(user_departments, dtype=np.int32)
+        self.departments = list(departments)
+        self.roster_mask = np.ones(len(self.user_ids), dtype=bool)
+        
+        # One entry per attendance record
+        self.user = np.asarray(user, dtype=np.int32)
+        self.day = np.asarray(day, dtype=np.int32)
+        self.seconds = np.asarray(seconds, dtype=np.int32)
+        self.schedule = np.asarray(schedule, dtype=np.int32)
+        
+        # Schedule start (seconds of day) indexed by schedule id, -1 if unknown
+        self.schedule_start = np.asarray(schedule_start, dtype=np.int32)
+        
+        # Days on which any attendance was taken, before user/department filters
+        self.class_days = np.flatnonzero(np.bincount(self.day, minlength=num_days))
+        self._pairs = None
+    
+    @classmethod
+    def from_database(cls, db, start_date, end_date):
+        """Load attendance for [start_date, end_date] from db_enhanced.DatabaseManager"""
+        roster = db.get_analytics_roster()
+        records = db.get_attendance_columns(start_date, end_date)
+        schedules = db.get_schedule_start_seconds()
+        
+        user_ids = np.array(sorted(row[0] for row in roster), dtype=str)
+        department_by_user = dict(roster)
+        departments, user_departments = np.unique(
+            np.array([department_by_user[uid] or '' for uid in user_ids.tolist()], dtype=str),
+            return_inverse=True
+        )
+        
+        user = np.empty(0, dtype=np.int32)
+        columns = np.empty((0, 3), dtype=np.int64)
+        if records and len(user_ids):
+            # Map user_id strings to roster ordinals, dropping unknown users
+            record_users = np.array([row[0] for row in records], dtype=str)
+            columns = np.array([row[1:] for row in records], dtype=np.int64)
+            user = np.minimum(np.searchsorted(user_ids, record_users), len(user_ids) - 1)
+            known = user_ids[user] == record_users
+            user, columns = user[known], columns[known]
+        
+        schedule_start = np.full(max([sid for sid, _ in schedules] + [0]) + 1, -1, dtype=np.int32)
+        for schedule_id, start_seconds in schedules:
+            if start_seconds is not None:
+                schedule_start[schedule_id] = start_seconds
+        
+        return cls(
+            start_date=start_date,
+            num_days=(end_date - start_date).days + 1,
+            user_ids=user_ids,
+            user_departments=user_departments,
+            departments=departments.tolist(),
+            user=user,
+            day=columns[:, 0],
+            seconds=columns[:, 1],
+            schedule=columns[:, 2],
+            schedule_start=schedule_start
+        )
+    
+    def filter(self, department=None, user_id=None):
+        """Return a copy restricted to one department and/or one user"""
+        roster_mask = self.roster_mask.copy()
+        if department is not None:
+            if department in self.departments:
+                roster_mask &= self.user_departments == self.departments.index(department)
+            else:
+                roster_mask[:] = False
+        if user_id is not None:
+            roster_mask &= self.user_ids == user_id
+        
+        keep = roster_mask[self.user]
+        filtered = AttendanceColumns.__new__(AttendanceColumns)
+        filtered.__dict__.update(self.__dict__)
+        filtered.roster_mask = roster_mask
+        filtered.user = self.user[keep]
+        filtered.day = self.day[keep]
+        filtered.seconds = self.seconds[keep]
+        filtered.schedule = self.schedule[keep]
+        filtered._pairs = None
+        return filtered
+    
+    @property
+    def num_users(self):
+        return len(self.user_ids)
+    
+    def present_pairs(self):
+        """Sorted unique (user, day) keys encoded as user * num_days + day"""
+        if self._pairs is None:
+            keys = self.user.astype(np.int64) * self.num_days + self.day
+            span = self.num_users * self.num_days
+            if span <= config.ANALYTICS_BITMAP_LIMIT:
+                # Dense bitmap is O(n) and already sorted, unlike np.unique
+                seen = np.zeros(span, dtype=bool)
+                seen[keys] = True
+                self._pairs = np.flatnonzero(seen)
+            else:
+                self._pairs = np.unique(keys)
+        return self._pairs
+    
+    def lateness_seconds(self):
+        """Seconds after schedule start for each record (NaN when schedule unknown)"""
+        schedule = np.clip(self.schedule, 0, len(self.schedule_start) - 1)
+        start = self.schedule_start[schedule]
+        known = (self.schedule >= 0) & (self.schedule < len(self.schedule_start)) & (start >= 0)
+        late = np.full(len(self.seconds), np.nan)
+        late[known] = self.seconds[known] - start[known]
+        return late
+
+
+def attendance_rates(columns):
+    """Per-user attendance rate over the class days in range"""
+    pairs = columns.present_pairs()
+    present = np.bincount(pairs // columns.num_days, minlength=columns.num_users)
+    class_days = len(columns.class_days)
+    rates = present / class_days if class_days else np.zeros(columns.num_users)
+    
+    users = np.flatnonzero(columns.roster_mask)
+    return {
+        'class_days': class_days,
+        'users': [
+            {'user_id': uid, 'days_present': int(days), 'rate': round(float(rate), 4)}
+            for uid, days, rate in zip(columns.user_ids[users].tolist(), present[users], rates[users])
+        ]
+    }
+
+
+def attendance_streaks(columns):
+    """Per-user longest and current streak of consecutive class days attended"""
+    pairs = columns.present_pairs()
+    longest = np.zeros(columns.num_users, dtype=np.int64)
+    current = np.zeros(columns.num_users, dtype=np.int64)
+    
+    if len(pairs):
+        pair_user = pairs // columns.num_days
+        day_index = np.searchsorted(columns.class_days, pairs % columns.num_days)
+        
+        # A new run starts where the user changes or a class day was missed
+        starts = np.ones(len(pairs), dtype=bool)
+        starts[1:] = (pair_user[1:] != pair_user[:-1]) | (day_index[1:] != day_index[:-1] + 1)
+        run_id = np.cumsum(starts) - 1
+        run_length = np.bincount(run_id)
+        run_user = pair_user[starts]
+        run_last_day = day_index[np.r_[np.flatnonzero(starts)[1:] - 1, len(pairs) - 1]]
+        
+        np.maximum.at(longest, run_user, run_length)
+        ongoing = run_last_day == len(columns.class_days) - 1
+        current[run_user[ongoing]] = run_length[ongoing]
+    
+    users = np.flatnonzero(columns.roster_mask)
+    return {
+        'class_days': len(columns.class_days),
+        'users': [
+            {'user_id': uid, 'longest_streak': int(best), 'current_streak': int(now)}
+            for uid, best, now in zip(columns.user_ids[users].tolist(), longest[users], current[users])
+        ]
+    }
+
+
+def late_arrivals(columns):
+    """Distribution of arrival lateness relative to schedule start"""
+    grace_minutes = config.ANALYTICS_LATE_GRACE_MINUTES
+    grace = grace_minutes * 60
+    # Only arrivals past the grace period count as late, so the first bucket starts there
+    bounds = [grace_minutes] + [edge for edge in config.ANALYTICS_LATE_BUCKETS_MINUTES if edge > grace_minutes]
+    edges = np.asarray(bounds[1:], dtype=np.float64) * 60
+    
+    lateness = columns.lateness_seconds()
+    known = ~np.isnan(lateness)
+    late = known & (lateness > grace)
+    
+    counts = np.bincount(np.digitize(lateness[late], edges), minlength=len(bounds))
+    labels = [f"{low}-{high}m" for low, high in zip(bounds[:-1], bounds[1:])]
+    labels += [f">={bounds[-1]}m"]
+    
+    per_user = np.bincount(columns.user[late], minlength=columns.num_users)
+    users = np.flatnonzero(columns.roster_mask & (per_user > 0))
+    return {
+        'records': int(known.sum()),
+        'late_records': int(late.sum()),
+        'late_ratio': round(float(late.sum() / known.sum()), 4) if known.any() else 0.0,
+        'median_late_minutes': round(float(np.median(lateness[late]) / 60), 2) if late.any() else 0.0,
+        'histogram': dict(zip(labels, counts.tolist())),
+        'users': [
+            {'user_id': uid, 'late_count': int(count)}
+            for uid, count in zip(columns.user_ids[users].tolist(), per_user[users])
+        ]
+    }
+
+
+def department_comparison(columns):
+    """Attendance and lateness aggregated per department"""
+    pairs = columns.present_pairs()
+    present = np.bincount(pairs // columns.num_days, minlength=columns.num_users)
+    class_days = len(columns.class_days)
+    rates = present / class_days if class_days else np.zeros(columns.num_users)
+    
+    n_departments = len(columns.departments)
+    members = columns.user_departments[columns.roster_mask]
+    member_count = np.bincount(members, minlength=n_departments)
+    rate_sum = np.bincount(members, weights=rates[columns.roster_mask], minlength=n_departments)
+    
+    lateness = columns.lateness_seconds()
+    known = ~np.isnan(lateness)
+    record_department = columns.user_departments[columns.user]
+    records = np.bincount(record_department[known], minlength=n_departments)
+    late = np.bincount(record_department[known & (lateness > config.ANALYTICS_LATE_GRACE_MINUTES * 60)],
+                       minlength=n_departments)
+    
+    result = []
+    for index in np.flatnonzero(member_count):
+        result.append({
+            'department': columns.departments[index] or 'N/A',
+            'users': int(member_count[index]),
+            'average_rate': round(float(rate_sum[index] / member_count[index]), 4),
+            'records': int(records[index]),
+            'late_ratio': round(float(late[index] / records[index]), 4) if records[index] else 0.0
+        })
+    return {'class_days': class_days, 'departments': result}
+
+
+REPORTS = {
+    'rates': attendance_rates,
+    'streaks': attendance_streaks,
+    'late': late_arrivals,
+    'departments': department_comparison
+}
+
+
+class AttendanceAnalytics:
+    """Cached attendance reports backed by columnar arrays"""
+    
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.columns_cache = OrderedDict()
+        self.report_cache = OrderedDict()
+        self.version = None
+    
+    def _check_version(self):
+        """Drop cached results if attendance changed since they were built"""
+        version = getattr(self.db, 'attendance_version', None)
+        if version != self.version:
+            self.columns_cache.clear()
+            self.report_cache.clear()
+            self.version = version
+        return version
+    
+    def _remember(self, cache, key, value, version):
+        """Store a result unless attendance changed while it was computed"""
+        if self._check_version() != version:
+            return
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > config.ANALYTICS_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    def get_columns(self, start_date, end_date):
+        """Get (cached) columns for a date range"""
+        key = (start_date, end_date)
+        with self.lock:
+            version = self._check_version()
+            if key in self.columns_cache:
+                self.columns_cache.move_to_end(key)
+                return self.columns_cache[key]
+        
+        columns = AttendanceColumns.from_database(self.db, start_date, end_date)
+        
+        with self.lock:
+            self._remember(self.columns_cache, key, columns, version)
+        return columns
+    
+    def report(self, name, start_date=None, end_date=None, department=None, user_id=None):
+        """Compute (or return cached) report by name"""
+        if name not in REPORTS:
+            raise ValueError(f"Unknown report: {name}")
+        
+        end_date = end_date or date.today()
+        start_date = start_date or end_date - timedelta(days=config.ANALYTICS_DEFAULT_DAYS - 1)
+        if start_date > end_date:
+            raise ValueError("Start date must not be after end date")
+        
+        key = (name, start_date, end_date, department, user_id)
+        with self.lock:
+            version = self._check_version()
+            if key in self.report_cache:
+                self.report_cache.move_to_end(key)
+                return self.report_cache[key]
+        
+        columns = self.get_columns(start_date, end_date)
+        if department is not None or user_id is not None:
+            columns = columns.filter(department=department, user_id=user_id)
+        
+        result = REPORTS[name](columns)
+        result['start_date'] = start_date.strftime('%Y-%m-%d')
+        result['end_date'] = end_date.strftime('%Y-%m-%d')
+        
+        with self.lock:
+            self._remember(self.report_cache, key, result, version)
+        return result
+    
+    def invalidate(self):
+        """Clear all cached columns and reports"""
+        with self.lock:
+            self.columns_cache.clear()
+            self.report_cache.clear()
\ No newline at end of file
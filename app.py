@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory
 import cv2
 import json
 import os
@@ -9,8 +9,15 @@ import time
 import base64
 
 from camera import CameraManager
-from attendance import AttendanceManager
-from db import DatabaseManager
+from attendance import AttendanceManager, ALREADY_MARKED
+from cooldown import CooldownScheduler
+from db import DatabaseManager, STUDENT_FIELDS
+from events import EventBroker
+from response_cache import ResponseCache
+from image_store import get_image_store
+from tracing import FrameTracer
+from runtime_state import RuntimeState
+import metrics
 import config
 
 app = Flask(__name__)
@@ -18,15 +25,37 @@ app = Flask(__name__)
 # Global instances
 camera = CameraManager()
 attendance_manager = AttendanceManager()
+events = EventBroker()
+response_cache = ResponseCache()
+tracer = FrameTracer()
+cooldown = CooldownScheduler()
 
-# Global state for face recognition simulation
-current_state = {
+# Instrumentation
+frame_seconds = metrics.histogram('frame_processing_seconds', 'Processing time per recognition frame')
+haar_seconds = metrics.stage_timer('haar_detect')
+mark_seconds = metrics.stage_timer('mark')
+frames_processed = metrics.counter('frames_processed_total', 'Frames run through face detection')
+faces_detected = metrics.counter('faces_detected_total', 'Faces found by the detector')
+attendance_marked = metrics.counter('attendance_marked_total', 'Attendance records written by recognition')
+stream_seconds = metrics.histogram('video_feed_frame_seconds', 'Detect, annotate and JPEG-encode time per streamed frame')
+stream_encode_seconds = metrics.histogram('video_feed_encode_seconds', 'JPEG encode time per streamed frame')
+stream_frames = metrics.counter('video_feed_frames_total', 'Frames sent to /video_feed clients')
+stream_clients = metrics.gauge('video_feed_clients', 'Connected /video_feed clients')
+metrics.REGISTRY.register_collector(lambda: {
+    'event_stream_clients': ('Connected Server-Sent Events clients', events.client_count()),
+    'response_cache_hit_ratio': ('Response cache hit ratio', response_cache.stats()['hit_ratio']),
+    'face_image_queue_depth': ('Face images waiting to be written', get_image_store().queue.qsize())
+})
+
+# Global state for face recognition simulation, the status keys are shared between worker
+# processes when RUNTIME_STATE_SHARED_PATH is set
+current_state = RuntimeState({
     'mode': 'recognition',
     'new_user_detected': False,
     'last_recognition': None,
     'registered_faces': {},  # Simple face storage
     'face_cascade': cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-}
+}, shared_keys=('mode', 'new_user_detected', 'last_recognition'))
 
 def process_frame():
     """Continuous frame processing for face detection and recognition"""
@@ -38,14 +67,20 @@ def process_frame():
                 time.sleep(1)
                 continue
             
-            frame = camera.get_frame()
+            frame, capture_time = camera.get_frame_with_timestamp()
             if frame is None:
                 time.sleep(0.1)
                 continue
+            frame_start = time.perf_counter()
+            trace = tracer.start(capture_time)
             
             # Detect faces
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+            with haar_seconds.time(), trace.span('detect') as span:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+                span.attrs['faces'] = len(faces)
+            frames_processed.inc()
+            faces_detected.inc(len(faces))
             
             if len(faces) > 0 and current_state['mode'] == 'recognition':
                 # Check if we have registered faces
@@ -53,46 +88,95 @@ def process_frame():
                     # Simulate recognition by checking face position/size similarity
                     for student_id, face_data in current_state['registered_faces'].items():
                         # Simple recognition simulation
-                        student_details = attendance_manager.get_student_details(student_id)
+                        with trace.span('match', student_id=student_id):
+                            student_details = attendance_manager.get_student_details(student_id)
                         if student_details:
-                            current_state['last_recognition'] = {
+                            previous = current_state['last_recognition']
+                            recognition = {
                                 'student': student_details,
                                 'timestamp': datetime.now().isoformat(),
-                                'face_location': faces[0]
+                                'face_location': faces[0].tolist()
                             }
                             
-                            # Try to mark attendance
-                            success, message = attendance_manager.mark_student_attendance(student_id)
-                            current_state['last_recognition']['attendance_result'] = {
+                            # Try to mark attendance, repeat sightings within the cooldown reuse the first outcome
+                            if cooldown.admit(student_id):
+                                with mark_seconds.time(), trace.span('attendance_write', student_id=student_id) as span:
+                                    success, message = attendance_manager.mark_student_attendance(student_id)
+                                    span.attrs['success'] = success
+                                if success:
+                                    attendance_marked.inc()
+                                    trace.mark_committed()
+                                if success or message == ALREADY_MARKED:
+                                    cooldown.record(student_id, None, (success, message))
+                                else:
+                                    cooldown.release(student_id)  # Window closed or write failed, retry next sighting
+                            else:
+                                success, message = cooldown.last_result(student_id) or (False, ALREADY_MARKED)
+                            recognition['attendance_result'] = {
                                 'success': success,
                                 'message': message
                             }
+                            current_state['last_recognition'] = recognition
+                            
+                            # Push only when the recognized student or outcome changes
+                            if (not previous or previous['student']['student_id'] != student_id
+                                    or previous['attendance_result'] != recognition['attendance_result']):
+                                events.publish('recognition', {'last_recognition': recognition})
+                                if success:
+                                    events.publish('attendance_marked', {'student_id': student_id, 'message': message})
                             break
                 else:
                     # New user detected
                     if not current_state['new_user_detected']:
-                        current_state['new_user_detected'] = True
-                        current_state['mode'] = 'registration'
+                        current_state.update(new_user_detected=True, mode='registration')
                         print("New user detected - Registration required")
+                        events.publish('registration_needed', {
+                            'new_user_detected': True,
+                            'current_state': 'registration'
+                        })
             
             elif len(faces) == 0:
                 # No faces detected, reset recognition after delay
-                if current_state['last_recognition']:
-                    last_time = datetime.fromisoformat(current_state['last_recognition']['timestamp'])
+                last_recognition = current_state['last_recognition']
+                if last_recognition:
+                    last_time = datetime.fromisoformat(last_recognition['timestamp'])
                     if (datetime.now() - last_time).seconds > 3:
                         current_state['last_recognition'] = None
+                        events.publish('recognition_cleared', {'last_recognition': None})
             
+            frame_seconds.observe(time.perf_counter() - frame_start)
+            tracer.finish(trace, frame)
             time.sleep(0.2)  # Reduce CPU usage
             
         except Exception as e:
             print(f"Error in frame processing: {e}")
             time.sleep(1)
 
+def watch_attendance_window():
+    """Push window open/close events instead of letting every client poll"""
+    last_status = None
+    
+    while True:
+        try:
+            attendance_status = attendance_manager.get_attendance_status()
+            if attendance_status['status'] != last_status:
+                if last_status is not None:
+                    event_type = 'window_open' if attendance_status['status'] == 'OPEN' else 'window_close'
+                    events.publish(event_type, {'attendance_status': attendance_status})
+                last_status = attendance_status['status']
+        except Exception as e:
+            print(f"Error watching attendance window: {e}")
+        time.sleep(config.EVENT_WINDOW_CHECK_SECONDS)
+
 # Start background processing
 processing_thread = threading.Thread(target=process_frame)
 processing_thread.daemon = True
 processing_thread.start()
 
+window_thread = threading.Thread(target=watch_attendance_window)
+window_thread.daemon = True
+window_thread.start()
+
 @app.route('/')
 def index():
     """Main student view"""
@@ -107,23 +191,32 @@ def admin():
 def video_feed():
     """Video streaming route with face detection"""
     def generate():
+        stream_clients.inc()
+        try:
+            yield from frames()
+        finally:
+            stream_clients.dec()
+    
+    def frames():
         while True:
             frame = camera.get_frame()
             if frame is not None:
+                frame_start = time.perf_counter()
+                state = current_state.snapshot()
                 # Detect and draw faces
                 gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+                faces = state['face_cascade'].detectMultiScale(gray, 1.1, 4)
                 
                 for (x, y, w, h) in faces:
-                    if current_state['last_recognition']:
+                    if state['last_recognition']:
                         # Green for recognized
                         cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                        student = current_state['last_recognition']['student']
+                        student = state['last_recognition']['student']
                         cv2.putText(frame, f"Student: {student['name']}", (x, y-30), 
                                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                         cv2.putText(frame, f"ID: {student['student_id']}", (x, y-10), 
                                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                    elif current_state['new_user_detected']:
+                    elif state['new_user_detected']:
                         # Red for new user
                         cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
                         cv2.putText(frame, "New User - Registration Required", (x, y-10), 
@@ -135,12 +228,15 @@ def video_feed():
                                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
                 
                 # Add system status
-                status_text = f"Mode: {current_state['mode'].upper()}"
+                status_text = f"Mode: {state['mode'].upper()}"
                 cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
                 
                 # Encode frame
-                ret, buffer = cv2.imencode('.jpg', frame)
+                with stream_encode_seconds.time():
+                    ret, buffer = cv2.imencode('.jpg', frame)
                 frame_bytes = buffer.tobytes()
+                stream_seconds.observe(time.perf_counter() - frame_start)
+                stream_frames.inc()
                 
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -149,19 +245,47 @@ def video_feed():
     
     return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/api/status')
-def get_status():
-    """Get current system status"""
+def build_status():
+    """Current system status as served by /api/status"""
     attendance_status = attendance_manager.get_attendance_status()
+    state = current_state.snapshot()
     
-    return jsonify({
+    return {
         'camera_running': camera.is_running(),
         'attendance_status': attendance_status,
-        'current_state': current_state['mode'],
-        'new_user_detected': current_state['new_user_detected'],
-        'last_recognition': current_state['last_recognition'],
-        'registered_users': len(current_state['registered_faces'])
-    })
+        'current_state': state['mode'],
+        'new_user_detected': state['new_user_detected'],
+        'last_recognition': state['last_recognition'],
+        'registered_users': len(state['registered_faces'])
+    }
+
+@app.route('/face_images/<path:filename>')
+def face_image(filename):
+    """Serve stored face images and thumbnails"""
+    if '/' not in filename:
+        # Legacy {id}.jpg files can be overwritten, so only sharded paths are immutable
+        return send_from_directory(config.FACE_IMAGES_DIR, filename)
+    response = send_from_directory(config.FACE_IMAGES_DIR, filename, max_age=config.FACE_IMAGE_CACHE_SECONDS)
+    response.headers['Cache-Control'] += ', immutable'
+    return response
+
+@app.route('/api/status')
+def get_status():
+    """Get current system status"""
+    return jsonify(build_status())
+
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events stream of status changes"""
+    subscription = events.subscribe()
+    return Response(events.stream(subscription, initial=build_status()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/cooldown')
+def cooldown_stats():
+    """Recognition events absorbed by the per-student cooldown"""
+    return jsonify(cooldown.stats())
 
 @app.route('/api/registration/approve', methods=['POST'])
 def approve_registration():
@@ -184,26 +308,35 @@ def approve_registration():
         if frame is None:
             return jsonify({'success': False, 'message': 'No camera frame available'})
         
-        # Save face image
-        face_image_path = f"face_images/{student_id}.jpg"
-        cv2.imwrite(face_image_path, frame)
+        # Queue face crop and thumbnail; written by the image store thread
+        paths = get_image_store().submit(frame)
+        if paths is None:
+            return jsonify({'success': False, 'message': 'Image store busy, please try again'})
+        face_image_path = paths['image']
         
         # Store in database (without face encoding)
         db = DatabaseManager()
         success = db.add_student(name, student_id, class_name, department, roll_no, face_image_path, "opencv_detection")
         db.close()
+        if success:
+            response_cache.bump('students')
         
         if success:
             # Add to registered faces (simple storage)
-            current_state['registered_faces'][student_id] = {
+            registered_faces = dict(current_state['registered_faces'])
+            registered_faces[student_id] = {
                 'name': name,
                 'image_path': face_image_path,
                 'registered_at': datetime.now().isoformat()
             }
             
             # Reset state
-            current_state['new_user_detected'] = False
-            current_state['mode'] = 'recognition'
+            current_state.update(registered_faces=registered_faces, new_user_detected=False, mode='recognition')
+            events.publish('registration_resolved', {
+                'new_user_detected': False,
+                'current_state': 'recognition',
+                'registered_users': len(current_state['registered_faces'])
+            })
             
             return jsonify({'success': True, 'message': 'Student registered successfully'})
         else:
@@ -218,8 +351,11 @@ def reject_registration():
     """Reject new user registration"""
     global current_state
     
-    current_state['new_user_detected'] = False
-    current_state['mode'] = 'recognition'
+    current_state.update(new_user_detected=False, mode='recognition')
+    events.publish('registration_resolved', {
+        'new_user_detected': False,
+        'current_state': 'recognition'
+    })
     
     return jsonify({'success': True, 'message': 'Registration rejected'})
 
@@ -236,6 +372,8 @@ def attendance_settings():
         end_time = data.get('end_time')
         
         success, message = attendance_manager.update_attendance_window(start_time, end_time)
+        if success:
+            events.publish('window_updated', {'attendance_status': attendance_manager.get_attendance_status()})
         return jsonify({'success': success, 'message': message})
 
 @app.route('/api/attendance/records')
@@ -262,20 +400,63 @@ def attendance_records():
 @app.route('/api/students')
 def get_students():
     """Get all registered students"""
-    try:
+    fields = request.args.get('fields')
+    fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    unknown = [field for field in fields or [] if field not in STUDENT_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    def load_students():
         db = DatabaseManager()
-        students = db.get_approved_students()
+        students = db.get_approved_students(fields)
         db.close()
-        
-        return jsonify(students)
+        return students
+    
+    try:
+        return response_cache.respond('students', load_students)
     except Exception as e:
         print(f"Error fetching students: {e}")
         return jsonify([])
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics')
+def metrics_summary():
+    """Metrics as JSON for the admin dashboard"""
+    return jsonify(metrics.REGISTRY.snapshot())
+
+@app.route('/api/traces')
+def recent_traces():
+    """Most recent per-frame traces"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(tracer.recent(limit))
+
+@app.route('/api/traces/slow')
+def slow_traces():
+    """Frames over the slow-frame threshold with their span breakdown"""
+    return jsonify({'threshold_ms': tracer.slow_ms, 'frames': tracer.slow_frames()})
+
+@app.route('/api/traces/slow/<int:frame_id>/thumbnail')
+def slow_trace_thumbnail(frame_id):
+    """Thumbnail of a slow frame"""
+    thumbnail = tracer.thumbnail(frame_id)
+    if thumbnail is None:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    return Response(thumbnail, mimetype='image/jpeg')
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Response cache hit ratio and bytes saved"""
+    return jsonify(response_cache.stats())
+
 @app.route('/api/camera/start', methods=['POST'])
 def start_camera():
     """Start camera"""
     if camera.start():
+        events.publish('camera', {'camera_running': True})
         return jsonify({'success': True, 'message': 'Camera started'})
     else:
         return jsonify({'success': False, 'message': 'Failed to start camera'})
@@ -284,6 +465,7 @@ def start_camera():
 def stop_camera():
     """Stop camera"""
     camera.stop()
+    events.publish('camera', {'camera_running': False})
     return jsonify({'success': True, 'message': 'Camera stopped'})
 
 @app.route('/api/simulate_attendance/<student_id>', methods=['POST'])
@@ -304,14 +486,20 @@ if __name__ == '__main__':
         db.create_database()
         print("✅ Database initialized")
         
+        # Monthly attendance partitions: create upcoming months and archive old ones daily
+        if attendance_manager.db.archive is not None:
+            attendance_manager.db.archive.start()
+        
         # Load existing registered faces
         students = db.get_approved_students()
-        for student in students:
-            current_state['registered_faces'][student['student_id']] = {
+        current_state['registered_faces'] = {
+            student['student_id']: {
                 'name': student['name'],
                 'image_path': student.get('face_image_path', ''),
                 'registered_at': student.get('created_at', datetime.now()).isoformat()
             }
+            for student in students
+        }
         print(f"✅ Loaded {len(current_state['registered_faces'])} registered students")
         
         db.close()
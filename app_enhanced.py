@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory
 import cv2
 import json
 import os
@@ -9,17 +9,77 @@ import time as time_module
 import base64
 
 from camera import CameraManager
-from db_enhanced import DatabaseManager
+from db_enhanced import USER_FIELDS, open_database
+from analytics import AttendanceAnalytics
+from events import EventBroker
+from response_cache import ResponseCache
+from image_store import get_image_store
+from bulk_enroll import BulkEnrollment, parse_workers, read_manifest, resolve_import_path, scan_directory
+from tracing import FrameTracer
+from gallery import ENCODING_SIZE, FaceGallery, pack_encoding, roster_scope
+from gallery_service import GalleryClient, GalleryServiceError
+from runtime_state import RuntimeState
+from cooldown import CooldownScheduler
+from sync_agent import SyncAgent
+from journal import AttendanceJournal, JournalReplayer
+from ingest import BatchIngest, IngestError, parse_json_lines, schedule_open, unpack_events
+from enrollment import FINISHED, EnrollmentPipeline
+from remote_recognition import RecognizeError, decode_crops, parse_embeddings, parse_json, recognize_seconds, remote_faces
+from unknown_faces import UnknownFaceStore
+import metrics
 import config
 
+try:
+    from face_utils import FaceRecognitionEngine
+except ImportError:  # face_recognition/dlib not installed, recognition is simulated
+    FaceRecognitionEngine = None
+
 app = Flask(__name__)
 
 # Global instances
 camera = CameraManager()
-db = DatabaseManager()
+# Marks are journaled to disk before the MySQL write so an outage doesn't lose them
+journal = AttendanceJournal() if config.ATTENDANCE_JOURNAL_DIR and config.DB_BACKEND == 'mysql' else None
+db = open_database(journal)
+journal_replayer = JournalReplayer(journal, db) if journal is not None else None
+batch_ingest = BatchIngest(db)
+analytics = AttendanceAnalytics(db)
+events = EventBroker()
+response_cache = ResponseCache()
+tracer = FrameTracer()
+cooldown = CooldownScheduler()
+# With a gallery service every worker shares its gallery and models instead of loading its own
+gallery_client = GalleryClient(config.GALLERY_SERVICE_SOCKET) if config.GALLERY_SERVICE_SOCKET else None
+face_engine = FaceRecognitionEngine(db=db) if FaceRecognitionEngine is not None and gallery_client is None else None
+# Without face_recognition a bare gallery still matches embeddings posted by thin clients
+face_gallery = FaceGallery() if FaceRecognitionEngine is None and gallery_client is None else None
+model_lock = threading.Lock()  # dlib models are not safe to call concurrently
+# Unrecognized faces are clustered so the same stranger isn't prompted for all day
+unknown_faces = UnknownFaceStore()
 
-# Global state
-current_state = {
+# Instrumentation
+frame_seconds = metrics.histogram('frame_processing_seconds', 'Processing time per recognition frame')
+haar_seconds = metrics.stage_timer('haar_detect')
+match_seconds = metrics.stage_timer('match')
+mark_seconds = metrics.stage_timer('mark')
+frames_processed = metrics.counter('frames_processed_total', 'Frames run through face detection')
+faces_detected = metrics.counter('faces_detected_total', 'Faces found by the detector')
+attendance_marked = metrics.counter('attendance_marked_total', 'Attendance records written by recognition')
+stream_seconds = metrics.histogram('video_feed_frame_seconds', 'Detect, annotate and JPEG-encode time per streamed frame')
+stream_encode_seconds = metrics.histogram('video_feed_encode_seconds', 'JPEG encode time per streamed frame')
+stream_frames = metrics.counter('video_feed_frames_total', 'Frames sent to /video_feed clients')
+stream_clients = metrics.gauge('video_feed_clients', 'Connected /video_feed clients')
+metrics.REGISTRY.register_collector(lambda: {
+    'event_stream_clients': ('Connected Server-Sent Events clients', events.client_count()),
+    'response_cache_hit_ratio': ('Response cache hit ratio', response_cache.stats()['hit_ratio']),
+    'face_image_queue_depth': ('Face images waiting to be written', get_image_store().queue.qsize()),
+    'unknown_face_clusters': ('Clusters in the unknown-face store', len(unknown_faces)),
+    'bulk_enroll_jobs_running': ('Bulk enrollment jobs in progress',
+                                 sum(1 for job in list(bulk_jobs.values()) if job.status == 'running'))
+})
+
+# Global state, the status keys are shared between worker processes when RUNTIME_STATE_SHARED_PATH is set
+current_state = RuntimeState({
     'camera_always_on': True,
     'capture_mode': 'continuous',  # continuous or scheduled
     'new_user_detected': False,
@@ -27,8 +87,12 @@ current_state = {
     'registered_faces': {},
     'active_schedules': [],
     'face_cascade': None,
+    'recognition_scopes': set(),
     'recognition_active': True
-}
+}, shared_keys=('camera_always_on', 'capture_mode', 'new_user_detected', 'last_recognition', 'recognition_active'))
+
+# Bulk enrollment jobs by id
+bulk_jobs = {}
 
 # Initialize face detection
 try:
@@ -41,10 +105,15 @@ def load_registered_users():
     """Load all registered users from database"""
     try:
         users = db.get_all_users()
-        current_state['registered_faces'] = {}
-        for user in users:
-            current_state['registered_faces'][user['user_id']] = user
+        current_state['registered_faces'] = {user['user_id']: user for user in users}
         print(f"✅ Loaded {len(current_state['registered_faces'])} registered users")
+        if gallery_client is not None:
+            gallery_client.reload()
+        elif face_engine is not None:
+            face_engine.reload_faces()
+        else:
+            face_gallery.load(db.get_face_samples())
+        load_recognition_scopes()
     except Exception as e:
         print(f"❌ Error loading users: {e}")
 
@@ -54,38 +123,220 @@ def load_active_schedules():
         schedules = db.get_all_schedules()
         current_state['active_schedules'] = schedules
         print(f"✅ Loaded {len(schedules)} active schedules")
+        load_recognition_scopes()
     except Exception as e:
         print(f"❌ Error loading schedules: {e}")
 
+def load_recognition_scopes():
+    """Pre-build sub-galleries for scoped schedules and this camera's roster"""
+    try:
+        roster = db.get_user_scopes()
+        scopes = {}
+        for schedule in current_state['active_schedules']:
+            if schedule.get('departments') or schedule.get('class_sections'):
+                scopes[f"schedule:{schedule['id']}"] = roster_scope(
+                    roster, schedule.get('departments'), schedule.get('class_sections'))
+        if config.CAMERA_SCOPE:
+            scopes['camera'] = roster_scope(roster, **config.CAMERA_SCOPE)
+        
+        if gallery_client is not None:
+            gallery_client.set_scopes(scopes)
+        else:
+            gallery = face_engine.gallery if face_engine is not None else face_gallery
+            gallery.clear_scopes()
+            for name, identities in scopes.items():
+                gallery.set_scope(name, identities)
+                gallery.scoped(name)  # Build now rather than on the first frame
+        current_state['recognition_scopes'] = set(scopes)
+        print(f"✅ Loaded {len(scopes)} recognition scopes")
+    except Exception as e:
+        print(f"❌ Error loading recognition scopes: {e}")
+
+def sync_pulled(counts):
+    """Refresh in-memory users and schedules after the edge sync pulled central changes"""
+    if counts['users_pulled'] or counts['face_samples_pulled']:
+        response_cache.bump('users')
+        load_registered_users()
+    if counts['schedules_pulled']:
+        response_cache.bump('schedules')
+        load_active_schedules()
+
+# Edge nodes (DB_BACKEND = 'sqlite') sync their local database with the central one
+sync_agent = SyncAgent(db, on_pull=sync_pulled) if config.DB_BACKEND == 'sqlite' else None
+
+def recognition_scope(schedule):
+    """Gallery scope searched first: the active schedule's roster, else this camera's"""
+    scopes = current_state['recognition_scopes']
+    if schedule and f"schedule:{schedule['id']}" in scopes:
+        return f"schedule:{schedule['id']}"
+    return 'camera' if 'camera' in scopes else None
+
 def is_attendance_time():
     """Check if current time matches any active schedule"""
     current_time = datetime.now()
-    current_weekday = str(current_time.weekday() + 1)  # 1=Monday, 7=Sunday
-    
     for schedule in current_state['active_schedules']:
-        if not schedule['is_active']:
-            continue
-            
-        # Check days of week
-        if schedule['days_of_week'] and current_weekday not in schedule['days_of_week']:
-            continue
-            
-        # Check time range
-        if schedule['start_time'] and schedule['end_time']:
-            start_time = schedule['start_time']
-            end_time = schedule['end_time']
-            
-            # Convert to datetime.time if needed
-            if isinstance(start_time, str):
-                start_time = datetime.strptime(start_time, '%H:%M:%S').time()
-            if isinstance(end_time, str):
-                end_time = datetime.strptime(end_time, '%H:%M:%S').time()
-            
-            if start_time <= current_time.time() <= end_time:
-                return True, schedule
-    
+        if schedule_open(schedule, current_time):
+            return True, schedule
     return False, None
 
+def detect_and_identify(frame, trace):
+    """Face boxes [x, y, w, h] in the frame, the (user_id, distance) match for each (user_id None if
+    unknown) and their encodings (None when detection didn't encode)"""
+    if gallery_client is not None:
+        is_time, schedule = is_attendance_time()
+        scope = recognition_scope(schedule)
+        with trace.span('recognize', scope=scope) as span:
+            boxes, matches = gallery_client.recognize(frame, scope)
+            span.attrs['faces'] = len(boxes)
+        return boxes, matches, None
+    
+    if face_engine is not None:
+        is_time, schedule = is_attendance_time()
+        scope = recognition_scope(schedule)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with model_lock:
+            with trace.span('detect') as span:
+                face_locations = face_engine.detect(rgb_frame)
+                span.attrs['faces'] = len(face_locations)
+            face_locations, _ = face_engine.filter_quality(rgb_frame, face_locations)
+            with trace.span('encode', faces=len(face_locations)):
+                face_encodings = face_engine.encode(rgb_frame, face_locations)
+        with trace.span('match', scope=scope):
+            matches = face_engine.match(face_encodings, scope=scope)
+        boxes = [[left, top, right - left, bottom - top] for top, right, bottom, left in face_locations]
+        return boxes, matches, face_encodings
+    
+    if current_state['face_cascade'] is None:
+        return [], [], None
+    with haar_seconds.time(), trace.span('detect') as span:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+        span.attrs['faces'] = len(faces)
+    # Simple recognition simulation: without face_recognition, the first registered user is recognized
+    first_user = next(iter(current_state['registered_faces']), None)
+    return [face.tolist() for face in faces], [(first_user, None)] * len(faces), None
+
+def observe_unknown(frame, faces, face_encodings):
+    """Add unrecognized faces to the unknown-face store, returns their cluster ids (None without an encoder)"""
+    if face_encodings is None:
+        if gallery_client is None:
+            return None
+        # The gallery service only returns matches, so encode the unknown faces separately
+        face_encodings = gallery_client.encode_crops([frame[y:y + h, x:x + w] for x, y, w, h in faces])
+    return [unknown_faces.observe(encoding, frame, (y, x + w, y + h, x))
+            for encoding, (x, y, w, h) in zip(face_encodings, faces)]
+
+def encode_crops(crops):
+    """Encoding of each BGR face crop posted by a thin client"""
+    if gallery_client is not None:
+        return gallery_client.encode_crops(crops)
+    with model_lock:
+        return face_engine.encode_crops(crops)
+
+def match_faces(face_encodings, scope):
+    """Best user_id (or None) and distance for each encoding, in one vectorized gallery call"""
+    if gallery_client is not None:
+        return gallery_client.match(face_encodings, scope)
+    if face_engine is not None:
+        return face_engine.match(face_encodings, scope=scope)
+    with match_seconds.time():
+        if scope is not None:
+            return face_gallery.match_scoped(face_encodings, scope)
+        return face_gallery.match(face_encodings)
+
+def enrollment_detect(frame):
+    """Face locations (top, right, bottom, left) in a BGR frame for the enrollment pipeline"""
+    if gallery_client is not None:
+        boxes, _ = gallery_client.recognize(frame)
+        return [(y, x + w, y + h, x) for x, y, w, h in boxes]
+    with model_lock:
+        return face_engine.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def enrollment_encode(frame, face_locations):
+    if gallery_client is not None:
+        return gallery_client.encode_crops([frame[top:bottom, left:right] for top, right, bottom, left in face_locations])
+    with model_lock:
+        return face_engine.encode(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), face_locations)
+
+def register_enrolled(details, samples, image_path):
+    """Store an enrolled user's template and add it to the live matcher without a gallery reload"""
+    user_id = details['user_id']
+    success = db.create_user(
+        name=details.get('name'),
+        user_id=user_id,
+        role=details.get('role', 'student'),
+        department=details.get('department', ''),
+        class_section=details.get('class_section', ''),
+        phone=details.get('phone', ''),
+        email=details.get('email', ''),
+        face_image_path=image_path or '',
+        face_encoding=','.join(map(str, np.mean(samples, axis=0)))
+    )
+    if not success:
+        return False
+    db.add_face_samples(user_id, [pack_encoding(sample) for sample in samples])
+    if gallery_client is not None:
+        gallery_client.add(user_id, samples)
+    else:
+        for sample in samples:
+            face_engine.add_new_face(user_id, sample)
+    
+    registered_faces = dict(current_state['registered_faces'])
+    registered_faces[user_id] = db.get_user_by_id(user_id) or dict(details)
+    current_state.update(registered_faces=registered_faces, new_user_detected=False)
+    response_cache.bump('users')
+    events.publish('registration_resolved', {
+        'new_user_detected': False,
+        'registered_users': len(registered_faces)
+    })
+    return True
+
+def enrollment_updated(job):
+    events.publish('enrollment', job.to_dict())
+    source, _, cluster_id = job.source.partition(':')
+    if source == 'unknown' and job.status in FINISHED:
+        unknown_faces.finish_enrollment(int(cluster_id), job.status == 'completed')
+
+# Registrations capture and encode several frames in the background (needs face_recognition)
+enrollments = EnrollmentPipeline(camera, enrollment_detect, enrollment_encode,
+                                 match=lambda samples: match_faces(samples, None), register=register_enrolled,
+                                 on_update=enrollment_updated)
+
+def attendance_outcome(user_id, is_time, schedule, trace):
+    """Attendance result for a recognized user (None in scheduled capture mode) and whether it was just written"""
+    if not is_time:
+        return {'success': False, 'message': 'Outside attendance hours', 'schedule': None}, False
+    if current_state['capture_mode'] != 'continuous':
+        return None, False
+    
+    # Mark attendance once per cooldown window, repeat sightings reuse the outcome
+    if not cooldown.admit(user_id, schedule['id']):
+        # No result yet: the admitted write is still in flight, don't claim it succeeded
+        return cooldown.last_result(user_id, schedule['id']) or {
+            'success': False,
+            'message': 'Attendance already being processed',
+            'schedule': schedule['name']
+        }, False
+    try:
+        with mark_seconds.time(), trace.span('attendance_write', user_id=user_id) as span:
+            success = db.mark_attendance(user_id, schedule['id'])
+            span.attrs['success'] = success
+    except Exception:
+        cooldown.release(user_id, schedule['id'])  # Nothing was stored, retry on the next sighting
+        raise
+    attendance_result = {
+        'success': success,
+        'message': 'Attendance marked successfully!' if success else 'Failed to mark attendance',
+        'schedule': schedule['name']
+    }
+    if success:
+        attendance_marked.inc()
+        trace.mark_committed()
+        cooldown.record(user_id, schedule['id'], attendance_result)
+    else:
+        cooldown.release(user_id, schedule['id'])  # Retry on the next sighting
+    return attendance_result, success
+
 def process_frame():
     """Continuous frame processing for face detection and recognition"""
     global current_state
@@ -96,69 +347,122 @@ def process_frame():
                 time_module.sleep(1)
                 continue
             
-            frame = camera.get_frame()
+            frame, capture_time = camera.get_frame_with_timestamp()
             if frame is None:
                 time_module.sleep(0.1)
                 continue
+            frame_start = time_module.perf_counter()
+            trace = tracer.start(capture_time)
             
-            # Detect faces
-            if current_state['face_cascade'] is not None:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
-                
-                if len(faces) > 0:
-                    # Check if we have registered users
-                    if current_state['registered_faces']:
-                        # Simple recognition simulation based on face detection
-                        for user_id, user_data in current_state['registered_faces'].items():
-                            # In a real system, this would be actual face recognition
-                            # For demo, we'll recognize the first registered user
-                            current_state['last_recognition'] = {
-                                'user': user_data,
-                                'timestamp': datetime.now().isoformat(),
-                                'face_location': faces[0]
-                            }
-                            
-                            # Check if it's attendance time
-                            is_time, schedule = is_attendance_time()
-                            if is_time and current_state['capture_mode'] == 'continuous':
-                                # Mark attendance
-                                success = db.mark_attendance(user_id, schedule['id'])
-                                current_state['last_recognition']['attendance_result'] = {
-                                    'success': success,
-                                    'message': 'Attendance marked successfully!' if success else 'Failed to mark attendance',
-                                    'schedule': schedule['name']
-                                }
-                            elif not is_time:
-                                current_state['last_recognition']['attendance_result'] = {
-                                    'success': False,
-                                    'message': 'Outside attendance hours',
-                                    'schedule': None
-                                }
-                            break
-                    else:
-                        # New user detected
-                        if not current_state['new_user_detected']:
+            # Detect and identify faces
+            faces, matches, face_encodings = detect_and_identify(frame, trace)
+            frames_processed.inc()
+            faces_detected.inc(len(faces))
+            
+            if len(faces) > 0:
+                recognized = [index for index, (user_id, _) in enumerate(matches)
+                              if user_id in current_state['registered_faces']]
+                # Every unmatched face is clustered, also when it stands next to a recognized user
+                unknown = [index for index in range(len(faces)) if index not in recognized]
+                if unknown:
+                    cluster_ids = observe_unknown(frame, [faces[index] for index in unknown],
+                                                  None if face_encodings is None else
+                                                  [face_encodings[index] for index in unknown])
+                if recognized:
+                    face = faces[recognized[0]]
+                    user_id, distance = matches[recognized[0]]
+                    user_data = current_state['registered_faces'][user_id]
+                    previous = current_state['last_recognition']
+                    recognition = {
+                        'user': user_data,
+                        'timestamp': datetime.now().isoformat(),
+                        'face_location': face
+                    }
+                    
+                    # Check if it's attendance time
+                    is_time, schedule = is_attendance_time()
+                    attendance_result, written = attendance_outcome(user_id, is_time, schedule, trace)
+                    if written and face_engine is not None:
+                        face_engine.refresh_template(user_id, face_encodings[recognized[0]], distance)
+                    if attendance_result is not None:
+                        recognition['attendance_result'] = attendance_result
+                    
+                    current_state['last_recognition'] = recognition
+                    
+                    # Push only when the recognized user or outcome changes
+                    result = recognition.get('attendance_result')
+                    if (not previous or previous['user']['user_id'] != user_id
+                            or previous.get('attendance_result') != result):
+                        events.publish('recognition', {'last_recognition': recognition})
+                        if result and result['success']:
+                            events.publish('attendance_marked', {'user_id': user_id, 'schedule': result['schedule']})
+                else:
+                    # New user detected, prompted for once per unknown-face cluster
+                    if not current_state['new_user_detected']:
+                        cluster_id = unknown_faces.claim_prompt(cluster_ids) if cluster_ids is not None else None
+                        if cluster_ids is None or cluster_id is not None:
                             current_state['new_user_detected'] = True
                             print("New user detected - Registration required")
-                else:
-                    # No faces detected, reset recognition after delay
-                    if current_state['last_recognition']:
-                        last_time = datetime.fromisoformat(current_state['last_recognition']['timestamp'])
-                        if (datetime.now() - last_time).seconds > 5:
-                            current_state['last_recognition'] = None
+                            events.publish('registration_needed', {'new_user_detected': True,
+                                                                   'unknown_cluster': cluster_id})
+            else:
+                # No faces detected, reset recognition after delay
+                last_recognition = current_state['last_recognition']
+                if last_recognition:
+                    last_time = datetime.fromisoformat(last_recognition['timestamp'])
+                    if (datetime.now() - last_time).seconds > 5:
+                        current_state['last_recognition'] = None
+                        events.publish('recognition_cleared', {'last_recognition': None})
             
+            frame_seconds.observe(time_module.perf_counter() - frame_start)
+            tracer.finish(trace, frame)
             time_module.sleep(0.2)  # Reduce CPU usage
             
         except Exception as e:
             print(f"Error in frame processing: {e}")
             time_module.sleep(1)
 
+def watch_attendance_window():
+    """Push window open/close events instead of letting every client poll"""
+    last_schedule = None
+    
+    while True:
+        try:
+            is_time, schedule = is_attendance_time()
+            schedule_id = schedule['id'] if schedule else None
+            if schedule_id != last_schedule:
+                events.publish('window_open' if is_time else 'window_close', {
+                    'attendance_time': is_time,
+                    'active_schedule': schedule['name'] if schedule else None
+                })
+                last_schedule = schedule_id
+        except Exception as e:
+            print(f"Error watching attendance window: {e}")
+        time_module.sleep(config.EVENT_WINDOW_CHECK_SECONDS)
+
+def flush_templates():
+    """Write templates refreshed by recognitions in batches, off the frame loop"""
+    while True:
+        time_module.sleep(config.GALLERY_REFRESH_FLUSH_SECONDS)
+        try:
+            face_engine.flush_templates()
+        except Exception as e:
+            print(f"Error writing refreshed templates: {e}")
+
 # Start background processing
 processing_thread = threading.Thread(target=process_frame)
 processing_thread.daemon = True
 processing_thread.start()
 
+window_thread = threading.Thread(target=watch_attendance_window)
+window_thread.daemon = True
+window_thread.start()
+
+if face_engine is not None:
+    template_thread = threading.Thread(target=flush_templates)
+    template_thread.daemon = True
+    template_thread.start()
+
 @app.route('/')
 def index():
     """Main student view"""
@@ -173,24 +477,33 @@ def admin():
 def video_feed():
     """Video streaming route with face detection"""
     def generate():
+        stream_clients.inc()
+        try:
+            yield from frames()
+        finally:
+            stream_clients.dec()
+    
+    def frames():
         while True:
             frame = camera.get_frame()
             if frame is not None:
+                frame_start = time_module.perf_counter()
+                state = current_state.snapshot()
                 # Detect and draw faces
-                if current_state['face_cascade'] is not None:
+                if state['face_cascade'] is not None:
                     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+                    faces = state['face_cascade'].detectMultiScale(gray, 1.1, 4)
                     
                     for (x, y, w, h) in faces:
-                        if current_state['last_recognition']:
+                        if state['last_recognition']:
                             # Green for recognized user
                             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                            user = current_state['last_recognition']['user']
+                            user = state['last_recognition']['user']
                             cv2.putText(frame, f"{user['name']}", (x, y-30), 
                                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                             cv2.putText(frame, f"ID: {user['user_id']}", (x, y-10), 
                                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        elif current_state['new_user_detected']:
+                        elif state['new_user_detected']:
                             # Red for new user
                             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
                             cv2.putText(frame, "New User - Registration Required", (x, y-10), 
@@ -202,10 +515,10 @@ def video_feed():
                                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
                 
                 # Add system status
-                status_text = f"Camera: {'ON' if current_state['camera_always_on'] else 'OFF'}"
+                status_text = f"Camera: {'ON' if state['camera_always_on'] else 'OFF'}"
                 cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
                 
-                mode_text = f"Mode: {current_state['capture_mode'].upper()}"
+                mode_text = f"Mode: {state['capture_mode'].upper()}"
                 cv2.putText(frame, mode_text, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
                 
                 # Add timestamp
@@ -213,8 +526,11 @@ def video_feed():
                 cv2.putText(frame, timestamp, (10, frame.shape[0] - 10), 
                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
                 
-                ret, buffer = cv2.imencode('.jpg', frame)
+                with stream_encode_seconds.time():
+                    ret, buffer = cv2.imencode('.jpg', frame)
                 frame_bytes = buffer.tobytes()
+                stream_seconds.observe(time_module.perf_counter() - frame_start)
+                stream_frames.inc()
                 
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
@@ -233,33 +549,68 @@ def video_feed():
     
     return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/api/status')
-def get_status():
-    """Get current system status"""
+def build_status():
+    """Current system status as served by /api/status"""
     is_time, active_schedule = is_attendance_time()
+    state = current_state.snapshot()
     
-    return jsonify({
+    return {
         'camera_running': camera.is_running(),
-        'camera_always_on': current_state['camera_always_on'],
-        'capture_mode': current_state['capture_mode'],
-        'recognition_active': current_state['recognition_active'],
+        'camera_always_on': state['camera_always_on'],
+        'capture_mode': state['capture_mode'],
+        'recognition_active': state['recognition_active'],
         'attendance_time': is_time,
         'active_schedule': active_schedule['name'] if active_schedule else None,
-        'new_user_detected': current_state['new_user_detected'],
-        'last_recognition': current_state['last_recognition'],
-        'registered_users': len(current_state['registered_faces']),
-        'active_schedules': len(current_state['active_schedules'])
-    })
+        'new_user_detected': state['new_user_detected'],
+        'last_recognition': state['last_recognition'],
+        'registered_users': len(state['registered_faces']),
+        'active_schedules': len(state['active_schedules'])
+    }
+
+@app.route('/face_images/<path:filename>')
+def face_image(filename):
+    """Serve stored face images and thumbnails"""
+    if '/' not in filename:
+        # Legacy {id}.jpg files can be overwritten, so only sharded paths are immutable
+        return send_from_directory(config.FACE_IMAGES_DIR, filename)
+    response = send_from_directory(config.FACE_IMAGES_DIR, filename, max_age=config.FACE_IMAGE_CACHE_SECONDS)
+    response.headers['Cache-Control'] += ', immutable'
+    return response
+
+@app.route('/api/status')
+def get_status():
+    """Get current system status"""
+    return jsonify(build_status())
+
+@app.route('/api/events')
+def event_stream():
+    """Server-Sent Events stream of status changes"""
+    subscription = events.subscribe()
+    return Response(events.stream(subscription, initial=build_status()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 # CRUD API Routes for Users
 @app.route('/api/users', methods=['GET', 'POST'])
 def users_api():
     if request.method == 'GET':
-        users = db.get_all_users()
-        return jsonify(users)
+        fields = request.args.get('fields')
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        unknown = [field for field in fields or [] if field not in USER_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        return response_cache.respond('users', lambda: db.get_all_users(fields))
     
     elif request.method == 'POST':
         data = request.json
+        if face_engine is not None or gallery_client is not None:
+            if not data.get('user_id') or not data.get('name'):
+                return jsonify({'success': False, 'message': 'Name and user ID are required'}), 400
+            job = enrollments.submit(data, force=bool(data.get('force')))
+            return jsonify({'success': True, 'job_id': job.job_id, 'status': job.status,
+                            'message': 'Enrollment started, look at the camera'}), 202
+        
+        # Without face_recognition nothing can be encoded; store the details and the current frame
         success = db.create_user(
             name=data.get('name'),
             user_id=data.get('user_id'),
@@ -272,19 +623,124 @@ def users_api():
         )
         
         if success:
-            # Capture face image
+            # Capture face image; crop and thumbnail are written by the image store thread
             frame = camera.get_frame()
             if frame is not None:
-                face_image_path = f"face_images/{data.get('user_id')}.jpg"
-                cv2.imwrite(face_image_path, frame)
-                db.update_user(data.get('user_id'), face_image_path=face_image_path)
+                paths = get_image_store().submit(frame)
+                if paths:
+                    db.update_user(data.get('user_id'), face_image_path=paths['image'])
             
+            response_cache.bump('users')
             load_registered_users()  # Reload users
             current_state['new_user_detected'] = False
+            events.publish('registration_resolved', {
+                'new_user_detected': False,
+                'registered_users': len(current_state['registered_faces'])
+            })
             return jsonify({'success': True, 'message': 'User registered successfully'})
         else:
             return jsonify({'success': False, 'message': 'Failed to register user'})
 
+@app.route('/api/users/bulk', methods=['POST'])
+def bulk_users_api():
+    """Start a bulk enrollment job from a CSV manifest or image directory"""
+    data = request.json or {}
+    workers = parse_workers(data.get('workers'))
+    if workers is None:
+        return jsonify({'success': False, 'message': 'workers must be an integer'}), 400
+    
+    # Only files under BULK_ENROLL_IMPORT_ROOT can be read, paths are relative to it
+    manifest = resolve_import_path(data['manifest']) if isinstance(data.get('manifest'), str) else None
+    directory = resolve_import_path(data['directory']) if isinstance(data.get('directory'), str) else None
+    if manifest and os.path.isfile(manifest):
+        entries, source = read_manifest(manifest), manifest
+        outside = [entry['user_id'] for entry in entries if resolve_import_path(entry['image_path']) is None]
+        if outside:
+            return jsonify({'success': False, 'message': f"{len(outside)} manifest images are outside the import "
+                                                         f"directory", 'user_ids': outside[:20]}), 400
+    elif directory and os.path.isdir(directory):
+        entries, source = scan_directory(directory, data.get('department', '')), directory
+    else:
+        return jsonify({'success': False, 'message': 'A manifest or directory under the import directory is required'}), 400
+    
+    job_id = f"bulk-{int(time_module.time() * 1000)}"
+    enrollment = BulkEnrollment(entries, source, workers=workers)
+    bulk_jobs[job_id] = enrollment
+    
+    def run():
+        job_db = open_database()
+        try:
+            enrollment.run(job_db)
+        finally:
+            job_db.close()
+        response_cache.bump('users')
+        load_registered_users()
+    
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'job_id': job_id, 'total': len(entries)})
+
+@app.route('/api/users/bulk/<job_id>', methods=['GET'])
+def bulk_job_api(job_id):
+    """Progress and throughput of a bulk enrollment job"""
+    enrollment = bulk_jobs.get(job_id)
+    if not enrollment:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(enrollment.report())
+
+@app.route('/api/enrollments', methods=['GET'])
+def enrollments_api():
+    """Recent enrollment jobs, newest first"""
+    return jsonify(enrollments.recent())
+
+@app.route('/api/enrollments/<job_id>', methods=['GET'])
+def enrollment_api(job_id):
+    """Progress of one enrollment job (also pushed as 'enrollment' events on /api/events)"""
+    job = enrollments.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/unknown', methods=['GET'])
+def unknown_faces_api():
+    """Clusters of unrecognized faces, most recently seen first"""
+    return jsonify(unknown_faces.list())
+
+@app.route('/api/unknown/<int:cluster_id>/crops/<int:index>', methods=['GET'])
+def unknown_face_crop(cluster_id, index):
+    """One of a cluster's best face crops, 0 being the sharpest"""
+    crop = unknown_faces.crop(cluster_id, index)
+    if crop is None:
+        return jsonify({'error': 'Crop not found'}), 404
+    return Response(crop, mimetype='image/jpeg', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/unknown/<int:cluster_id>/enroll', methods=['POST'])
+def enroll_unknown_api(cluster_id):
+    """Register everyone in a cluster as one user from its stored sightings, no camera needed"""
+    data = request.json or {}
+    if not data.get('user_id') or not data.get('name'):
+        return jsonify({'success': False, 'message': 'Name and user ID are required'}), 400
+    if unknown_faces.get(cluster_id) is None:
+        return jsonify({'success': False, 'message': 'Cluster not found'}), 404
+    template = unknown_faces.start_enrollment(cluster_id)
+    if template is None:
+        return jsonify({'success': False, 'message': 'Cluster is already being enrolled'}), 409
+    encodings, image = template
+    job = enrollments.submit(data, force=bool(data.get('force')), source=f"unknown:{cluster_id}",
+                             encodings=encodings, image=image)
+    return jsonify({'success': True, 'job_id': job.job_id, 'status': job.status}), 202
+
+@app.route('/api/unknown/<int:cluster_id>/dismiss', methods=['POST'])
+def dismiss_unknown_api(cluster_id):
+    """Stop prompting for a cluster (e.g. a visitor) and clear its pending registration prompt"""
+    if not unknown_faces.dismiss(cluster_id):
+        return jsonify({'success': False, 'message': 'Cluster not found'}), 404
+    current_state['new_user_detected'] = False
+    events.publish('registration_resolved', {
+        'new_user_detected': False,
+        'registered_users': len(current_state['registered_faces'])
+    })
+    return jsonify({'success': True, 'message': 'Cluster dismissed'})
+
 @app.route('/api/users/<user_id>', methods=['GET', 'PUT', 'DELETE'])
 def user_api(user_id):
     if request.method == 'GET':
@@ -295,6 +751,7 @@ def user_api(user_id):
         data = request.json
         success = db.update_user(user_id, **data)
         if success:
+            response_cache.bump('users')
             load_registered_users()  # Reload users
             return jsonify({'success': True, 'message': 'User updated successfully'})
         else:
@@ -303,6 +760,7 @@ def user_api(user_id):
     elif request.method == 'DELETE':
         success = db.delete_user(user_id)
         if success:
+            response_cache.bump('users')
             load_registered_users()  # Reload users
             return jsonify({'success': True, 'message': 'User deleted successfully'})
         else:
@@ -312,8 +770,7 @@ def user_api(user_id):
 @app.route('/api/schedules', methods=['GET', 'POST'])
 def schedules_api():
     if request.method == 'GET':
-        schedules = db.get_all_schedules()
-        return jsonify(schedules)
+        return response_cache.respond('schedules', db.get_all_schedules)
     
     elif request.method == 'POST':
         data = request.json
@@ -323,10 +780,13 @@ def schedules_api():
             start_time=data.get('start_time'),
             end_time=data.get('end_time'),
             days_of_week=data.get('days_of_week'),
-            interval_minutes=data.get('interval_minutes', 60)
+            interval_minutes=data.get('interval_minutes', 60),
+            departments=data.get('departments'),
+            class_sections=data.get('class_sections')
         )
         
         if schedule_id:
+            response_cache.bump('schedules')
             load_active_schedules()  # Reload schedules
             return jsonify({'success': True, 'message': 'Schedule created successfully', 'id': schedule_id})
         else:
@@ -338,6 +798,7 @@ def schedule_api(schedule_id):
         data = request.json
         success = db.update_schedule(schedule_id, **data)
         if success:
+            response_cache.bump('schedules')
             load_active_schedules()  # Reload schedules
             return jsonify({'success': True, 'message': 'Schedule updated successfully'})
         else:
@@ -346,6 +807,7 @@ def schedule_api(schedule_id):
     elif request.method == 'DELETE':
         success = db.delete_schedule(schedule_id)
         if success:
+            response_cache.bump('schedules')
             load_active_schedules()  # Reload schedules
             return jsonify({'success': True, 'message': 'Schedule deleted successfully'})
         else:
@@ -368,6 +830,92 @@ def attendance_api():
     
     return jsonify(records)
 
+@app.route('/api/attendance/batch', methods=['POST'])
+def attendance_batch():
+    """Bulk attendance from kiosks: JSON lines or packed binary events (see ingest.py), per-event results"""
+    try:
+        if request.mimetype == 'application/octet-stream':
+            batch = unpack_events(request.get_data())
+        else:
+            batch = parse_json_lines(request.get_data(as_text=True))
+    except IngestError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if len(batch) > config.ATTENDANCE_BATCH_MAX_EVENTS:
+        return jsonify({'success': False,
+                        'message': f"At most {config.ATTENDANCE_BATCH_MAX_EVENTS} events per request"}), 413
+    
+    state = current_state.snapshot()
+    schedules = {schedule['id']: schedule for schedule in state['active_schedules']}
+    results, summary = batch_ingest.ingest(batch, state['registered_faces'], schedules)
+    
+    if summary.get('marked'):
+        attendance_marked.inc(summary['marked'])
+        events.publish('attendance_batch', {'marked': summary['marked'], 'cameras': summary['cameras']})
+    return jsonify({'success': True, 'summary': summary, 'results': results})
+
+@app.route('/api/recognize', methods=['POST'])
+def recognize_api():
+    """Identify faces a thin client detected itself: packed embeddings or JPEG crops (see remote_recognition.py)"""
+    try:
+        if request.mimetype == 'application/octet-stream':
+            encodings, crops = parse_embeddings(request.get_data()), []
+        elif request.mimetype == 'multipart/form-data':
+            encodings = np.empty((0, ENCODING_SIZE), dtype=np.float32)
+            crops = [upload.read() for upload in request.files.getlist('crops')]
+        else:
+            encodings, crops = parse_json(request.get_json(silent=True))
+    except RecognizeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if len(encodings) + len(crops) > config.REMOTE_RECOGNIZE_MAX_FACES:
+        return jsonify({'success': False,
+                        'message': f"At most {config.REMOTE_RECOGNIZE_MAX_FACES} faces per request"}), 413
+    if crops and face_engine is None and gallery_client is None:
+        return jsonify({'success': False,
+                        'message': 'face_recognition is not installed on the server, send embeddings instead'}), 501
+    remote_faces('embedding').inc(len(encodings))
+    remote_faces('crop').inc(len(crops))
+    
+    with recognize_seconds.time():
+        trace = tracer.start()
+        faces = [{'source': 'embedding', 'index': index} for index in range(len(encodings))]
+        images = decode_crops(crops)
+        for index, image in enumerate(images):
+            faces.append({'source': 'crop', 'index': index} if image is not None else
+                         {'source': 'crop', 'index': index, 'error': 'Not a decodable image'})
+        is_time, schedule = is_attendance_time()
+        scope = recognition_scope(schedule)
+        try:
+            decoded = [image for image in images if image is not None]
+            if decoded:
+                with trace.span('encode', faces=len(decoded)):
+                    crop_encodings = np.asarray(encode_crops(decoded), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+                encodings = np.vstack([encodings, crop_encodings])
+            with trace.span('match', scope=scope, faces=len(encodings)):
+                matches = match_faces(encodings, scope)
+        except (GalleryServiceError, OSError) as e:
+            tracer.finish(trace)
+            return jsonify({'success': False, 'message': f"Gallery unavailable: {e}"}), 503
+        
+        registered_faces = current_state['registered_faces']
+        # Read-only for templates: client vectors and whole-crop encodings never refresh a stored template
+        for face, (user_id, distance) in zip([face for face in faces if 'error' not in face], matches):
+            user = registered_faces.get(user_id) if user_id else None
+            face['user_id'] = user_id if user else None
+            face['name'] = user['name'] if user else None
+            face['distance'] = None if distance is None else round(float(distance), 4)
+            if user:
+                face['attendance'], written = attendance_outcome(user_id, is_time, schedule, trace)
+                if written:
+                    events.publish('attendance_marked', {'user_id': user_id, 'schedule': schedule['name']})
+        tracer.finish(trace)
+    
+    return jsonify({
+        'success': True,
+        'attendance_time': is_time,
+        'schedule': schedule['name'] if schedule else None,
+        'faces': faces
+    })
+
 @app.route('/api/attendance/<int:record_id>', methods=['DELETE'])
 def delete_attendance_api(record_id):
     success = db.delete_attendance_record(record_id)
@@ -376,15 +924,38 @@ def delete_attendance_api(record_id):
     else:
         return jsonify({'success': False, 'message': 'Failed to delete record'})
 
+# Analytics API
+@app.route('/api/analytics/<report>', methods=['GET'])
+def analytics_api(report):
+    """Attendance analytics report (rates, streaks, late, departments)"""
+    try:
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+        end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+    
+    try:
+        result = analytics.report(
+            report,
+            start_date=start_date,
+            end_date=end_date,
+            department=request.args.get('department'),
+            user_id=request.args.get('user_id')
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
 # System Settings API
 @app.route('/api/settings', methods=['GET', 'POST'])
 def settings_api():
     if request.method == 'GET':
-        settings = {
+        return response_cache.respond('settings', lambda: {
             'camera_always_on': db.get_setting('camera_always_on') == 'true',
             'capture_mode': db.get_setting('capture_mode') or 'continuous'
-        }
-        return jsonify(settings)
+        })
     
     elif request.method == 'POST':
         data = request.json
@@ -394,8 +965,72 @@ def settings_api():
                 db.update_setting(key, str(value).lower() if isinstance(value, bool) else value)
                 current_state[key] = value
         
+        response_cache.bump('settings')
         return jsonify({'success': True, 'message': 'Settings updated'})
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.REGISTRY.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/metrics')
+def metrics_summary():
+    """Metrics as JSON for the admin dashboard"""
+    return jsonify(metrics.REGISTRY.snapshot())
+
+@app.route('/api/traces')
+def recent_traces():
+    """Most recent per-frame traces"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(tracer.recent(limit))
+
+@app.route('/api/traces/slow')
+def slow_traces():
+    """Frames over the slow-frame threshold with their span breakdown"""
+    return jsonify({'threshold_ms': tracer.slow_ms, 'frames': tracer.slow_frames()})
+
+@app.route('/api/traces/slow/<int:frame_id>/thumbnail')
+def slow_trace_thumbnail(frame_id):
+    """Thumbnail of a slow frame"""
+    thumbnail = tracer.thumbnail(frame_id)
+    if thumbnail is None:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    return Response(thumbnail, mimetype='image/jpeg')
+
+@app.route('/api/cooldown')
+def cooldown_stats():
+    """Recognition events absorbed by the per-user cooldown"""
+    return jsonify(cooldown.stats())
+
+@app.route('/api/sync', methods=['GET', 'POST'])
+def sync_api():
+    """Edge sync status; POST runs a sync round now"""
+    if sync_agent is None:
+        return jsonify({'enabled': False, 'backend': config.DB_BACKEND})
+    if request.method == 'POST':
+        counts = sync_agent.sync_once()
+        return jsonify({'success': counts is not None, 'round': counts, 'last_error': sync_agent.last_error})
+    return jsonify(dict(sync_agent.status(), enabled=True, backend=config.DB_BACKEND))
+
+@app.route('/api/attendance/archive')
+def attendance_archive_api():
+    """Archived attendance months and their size on disk"""
+    if db.archive is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(db.archive.stats(), enabled=True))
+
+@app.route('/api/journal')
+def journal_api():
+    """Attendance journal depth, oldest unsynced mark and replay throughput"""
+    if journal is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(journal.stats(), enabled=True, replay_rows_per_second=journal_replayer.rows_per_second))
+
+@app.route('/api/cache/stats')
+def cache_stats_api():
+    """Response cache hit ratio and bytes saved"""
+    return jsonify(response_cache.stats())
+
 @app.route('/api/camera/control', methods=['POST'])
 def camera_control():
     """Control camera on/off"""
@@ -406,6 +1041,8 @@ def camera_control():
         if camera.start():
             current_state['camera_always_on'] = True
             db.update_setting('camera_always_on', 'true')
+            response_cache.bump('settings')
+            events.publish('camera', {'camera_running': True, 'camera_always_on': True})
             return jsonify({'success': True, 'message': 'Camera started'})
         else:
             return jsonify({'success': False, 'message': 'Failed to start camera'})
@@ -414,6 +1051,8 @@ def camera_control():
         camera.stop()
         current_state['camera_always_on'] = False
         db.update_setting('camera_always_on', 'false')
+        response_cache.bump('settings')
+        events.publish('camera', {'camera_running': False, 'camera_always_on': False})
         return jsonify({'success': True, 'message': 'Camera stopped'})
     
     return jsonify({'success': False, 'message': 'Invalid action'})
@@ -432,8 +1071,21 @@ if __name__ == '__main__':
     camera_always_on = db.get_setting('camera_always_on') == 'true'
     capture_mode = db.get_setting('capture_mode') or 'continuous'
     
-    current_state['camera_always_on'] = camera_always_on
-    current_state['capture_mode'] = capture_mode
+    current_state.update(camera_always_on=camera_always_on, capture_mode=capture_mode)
+    
+    # Monthly attendance partitions: create upcoming months and archive old ones daily
+    if db.archive is not None:
+        db.archive.start()
+    
+    # Replay marks journaled while MySQL was unreachable (including before a restart)
+    if journal_replayer is not None:
+        journal_replayer.start()
+        print(f"✅ Attendance journal ready ({journal.stats()['depth']} marks to replay)")
+    
+    # Edge node: marks go to the local database, the agent uploads them and pulls roster changes
+    if sync_agent is not None:
+        sync_agent.start()
+        print(f"✅ Edge sync started (every {config.SYNC_INTERVAL_SECONDS}s)")
     
     # Start camera if always on
     if camera_always_on:
@@ -7,17 +7,21 @@ from datetime import datetime, date, time
 import threading
 import time as time_module
 
+from runtime_state import RuntimeState
+
 app = Flask(__name__)
 
-# Global state
-current_state = {
+# Global state, shared between worker processes when RUNTIME_STATE_SHARED_PATH is set.
+# registered_faces grows with every registration, so it stays per process instead of
+# filling the fixed-size shared file
+current_state = RuntimeState({
     'mode': 'recognition',
     'new_user_detected': False,
     'last_recognition': None,
     'registered_faces': {},
     'camera_running': False,
     'face_cascade': None
-}
+}, shared_keys=('mode', 'new_user_detected', 'last_recognition'))
 
 # Initialize face cascade
 try:
@@ -80,18 +84,19 @@ def video_feed():
         while True:
             frame = camera.get_frame()
             if frame is not None:
+                state = current_state.snapshot()
                 # Detect faces
-                if current_state['face_cascade'] is not None:
+                if state['face_cascade'] is not None:
                     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    faces = current_state['face_cascade'].detectMultiScale(gray, 1.1, 4)
+                    faces = state['face_cascade'].detectMultiScale(gray, 1.1, 4)
                     
                     for (x, y, w, h) in faces:
-                        if current_state['registered_faces']:
+                        if state['registered_faces']:
                             # Green for registered users
                             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
                             cv2.putText(frame, "Registered User", (x, y-10), 
                                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-                        elif current_state['new_user_detected']:
+                        elif state['new_user_detected']:
                             # Red for new user
                             cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 0, 255), 2)
                             cv2.putText(frame, "New User - Admin Approval Required", (x, y-10), 
@@ -102,7 +107,8 @@ def video_feed():
                             cv2.putText(frame, "Face Detected", (x, y-10), 
                                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
                             # Set new user detected
-                            current_state['new_user_detected'] = True
+                            if not current_state['new_user_detected']:
+                                current_state['new_user_detected'] = True
                 
                 # Add timestamp
                 timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -143,13 +149,14 @@ def get_status():
         'current_time': current_time.strftime('%H:%M:%S')
     }
     
+    state = current_state.snapshot()
     return jsonify({
-        'camera_running': current_state['camera_running'],
+        'camera_running': state['camera_running'],
         'attendance_status': attendance_status,
-        'current_state': current_state['mode'],
-        'new_user_detected': current_state['new_user_detected'],
-        'last_recognition': current_state['last_recognition'],
-        'registered_users': len(current_state['registered_faces'])
+        'current_state': state['mode'],
+        'new_user_detected': state['new_user_detected'],
+        'last_recognition': state['last_recognition'],
+        'registered_users': len(state['registered_faces'])
     })
 
 @app.route('/api/registration/approve', methods=['POST'])
@@ -167,7 +174,7 @@ def approve_registration():
             return jsonify({'success': False, 'message': 'All fields are required'})
         
         # Store in memory (simple storage)
-        current_state['registered_faces'][student_id] = {
+        student = {
             'name': name,
             'student_id': student_id,
             'class': class_name,
@@ -176,20 +183,23 @@ def approve_registration():
             'registered_at': datetime.now().isoformat(),
             'attendance_today': False
         }
+        registered_faces = dict(current_state['registered_faces'])
+        registered_faces[student_id] = student
         
-        # Reset state
-        current_state['new_user_detected'] = False
-        current_state['mode'] = 'recognition'
-        
-        # Set last recognition to show the new student
-        current_state['last_recognition'] = {
-            'student': current_state['registered_faces'][student_id],
-            'timestamp': datetime.now().isoformat(),
-            'attendance_result': {
-                'success': True,
-                'message': 'Student registered successfully!'
+        # Reset state and set last recognition to show the new student
+        current_state.update(
+            registered_faces=registered_faces,
+            new_user_detected=False,
+            mode='recognition',
+            last_recognition={
+                'student': student,
+                'timestamp': datetime.now().isoformat(),
+                'attendance_result': {
+                    'success': True,
+                    'message': 'Student registered successfully!'
+                }
             }
-        }
+        )
         
         return jsonify({'success': True, 'message': 'Student registered successfully'})
         
@@ -200,8 +210,7 @@ def approve_registration():
 @app.route('/api/registration/reject', methods=['POST'])
 def reject_registration():
     """Reject new user registration"""
-    current_state['new_user_detected'] = False
-    current_state['mode'] = 'recognition'
+    current_state.update(new_user_detected=False, mode='recognition')
     return jsonify({'success': True, 'message': 'Registration rejected'})
 
 @app.route('/api/attendance/settings', methods=['GET', 'POST'])
@@ -1,26 +1,32 @@
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from db import DatabaseManager
 
+ALREADY_MARKED = "Attendance already marked today"
+
 class AttendanceManager:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
     
-    def is_attendance_time(self):
-        """Check if current time is within attendance window"""
+    def is_attendance_time(self, at=None):
+        """Check if current time (or the given datetime) is within attendance window"""
         try:
             settings = self.db.get_attendance_settings()
             if not settings:
                 return False, "Attendance settings not configured"
             
-            current_time = datetime.now().time()
+            current_time = (at or datetime.now()).time()
             start_time = settings['start_time']
             end_time = settings['end_time']
             
-            # Convert to datetime.time objects if they're not already
+            # Convert to datetime.time objects if they're not already (MySQL TIME columns come back as timedelta)
             if isinstance(start_time, str):
                 start_time = datetime.strptime(start_time, '%H:%M').time()
+            elif isinstance(start_time, timedelta):
+                start_time = (datetime.min + start_time).time()
             if isinstance(end_time, str):
                 end_time = datetime.strptime(end_time, '%H:%M').time()
+            elif isinstance(end_time, timedelta):
+                end_time = (datetime.min + end_time).time()
             
             if start_time <= current_time <= end_time:
                 return True, "Attendance window is open"
@@ -31,11 +37,11 @@ class AttendanceManager:
             print(f"Error checking attendance time: {e}")
             return False, "Error checking attendance time"
     
-    def mark_student_attendance(self, student_id):
-        """Mark attendance for a student with all validations"""
+    def mark_student_attendance(self, student_id, at=None):
+        """Mark attendance for a student with all validations (at: datetime of the sighting, default now)"""
         try:
             # Check if attendance window is open
-            is_open, message = self.is_attendance_time()
+            is_open, message = self.is_attendance_time(at)
             if not is_open:
                 return False, message
             
@@ -48,11 +54,11 @@ class AttendanceManager:
                 return False, "Student not approved"
             
             # Check if already marked attendance today
-            if self.db.check_attendance_today(student_id):
-                return False, "Attendance already marked today"
+            if self.db.check_attendance_today(student_id, at.date() if at else None):
+                return False, ALREADY_MARKED
             
             # Mark attendance
-            if self.db.mark_attendance(student_id):
+            if self.db.mark_attendance(student_id, at):
                 return True, "Attendance marked successfully"
             else:
                 return False, "Failed to mark attendance"
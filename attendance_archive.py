@@ -0,0 +1,345 @@
+"""
+Time-partitioned attendance storage with a cold archive
+Attendance tables are RANGE COLUMNS partitioned by month on their date column, with partitions
+created ATTENDANCE_PARTITIONS_AHEAD months in advance. Months older than ATTENDANCE_HOT_MONTHS are
+exported to compressed columnar archive files (one .npz per month, one deflated member per
+column) and their partition dropped, so the live table only ever holds recent months.
+Reads that reach into archived months merge both sources.
+Converting an existing plain table is a one-off, explicit step (it drops foreign keys and rewrites
+the primary key); running apps only maintain tables that are already partitioned.
+Usage:
+    python attendance_archive.py --partition [--enhanced]    # Convert, then create and archive months
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from mysql.connector import Error
+
+import config
+import metrics
+
+# (key column, columns exported) per attendance table
+TABLE_COLUMNS = {
+    'attendance_records': ('user_id', ['id', 'user_id', 'date', 'time', 'status', 'schedule_id', 'created_at']),
+    'attendance': ('student_id', ['id', 'student_id', 'date', 'time', 'status', 'created_at'])
+}
+
+MAINTENANCE_LOCK = 'attendance_maintenance'  # MySQL named lock prefix, one maintenance run per table at a time
+
+archived_rows = metrics.counter('attendance_archived_rows_total', 'Attendance rows moved to archive files')
+archive_reads = metrics.histogram('attendance_archive_read_seconds', 'Archive lookups merged into attendance queries')
+
+
+def month_start(day, months=0):
+    """First day of day's month, shifted by months"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def as_date(value):
+    return value if isinstance(value, date) else datetime.strptime(str(value), '%Y-%m-%d').date()
+
+
+def encode_column(name, values):
+    """Column of database values as a compact numpy array"""
+    if name == 'id':
+        return np.array(values, dtype=np.int64)
+    if name == 'date':
+        return np.array([str(value) for value in values], dtype='datetime64[D]')
+    if name == 'time':  # TIME comes back from MySQL as timedelta
+        return np.array([int(value.total_seconds()) if isinstance(value, timedelta) else
+                         value.hour * 3600 + value.minute * 60 + value.second for value in values], dtype=np.int32)
+    if name == 'schedule_id':
+        return np.array([-1 if value is None else value for value in values], dtype=np.int32)
+    if name == 'created_at':
+        return np.array([value.isoformat() if value else 'NaT' for value in values], dtype='datetime64[s]')
+    return np.array([value or '' for value in values], dtype=str)
+
+
+def decode_value(name, value):
+    """Archived numpy value back to the type the MySQL driver returns"""
+    if name in ('date', 'created_at'):
+        return value.item()
+    if name == 'time':
+        return timedelta(seconds=int(value))
+    if name == 'schedule_id':
+        return None if value < 0 else int(value)
+    if name == 'id':
+        return int(value)
+    return str(value)
+
+
+class AttendanceArchive:
+    """Monthly partitions and cold archive files for one attendance table of a DatabaseManager"""
+    
+    def __init__(self, db, table, columns=None, directory=None, hot_months=config.ATTENDANCE_HOT_MONTHS,
+                 months_ahead=config.ATTENDANCE_PARTITIONS_AHEAD):
+        self.db = db
+        self.table = table
+        self.key_column, self.columns = columns or TABLE_COLUMNS[table]
+        self.directory = os.path.join(directory or config.ATTENDANCE_ARCHIVE_DIR, table)
+        self.hot_months = hot_months
+        self.months_ahead = months_ahead
+        self.cache = {}  # path -> (mtime, columns), most recently used last
+        self.lock = threading.Lock()
+        self.maintenance_lock = threading.Lock()  # Named locks are reentrant within the shared connection
+        self.thread = None
+        os.makedirs(self.directory, exist_ok=True)
+    
+    # Partition maintenance
+    def partitions(self, cursor):
+        """[(name, upper bound date or None for MAXVALUE)], empty if the table isn't partitioned"""
+        cursor.execute("""
+            SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND table_name = %s
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """, (self.table,))
+        rows = cursor.fetchall()
+        if not rows or rows[0][0] is None:
+            return []
+        return [(name, None if bound == 'MAXVALUE' else as_date(bound.strip("'"))) for name, bound in rows]
+    
+    def partition_clause(self, bounds):
+        """Partition definitions for the given upper bounds plus the catch-all pmax"""
+        parts = [f"PARTITION p{month_start(bound, -1):%Y%m} VALUES LESS THAN ('{bound}')" for bound in bounds]
+        return ', '.join(parts + ["PARTITION pmax VALUES LESS THAN (MAXVALUE)"])
+    
+    def ensure_partitioned(self, cursor, today):
+        """One-off conversion of the plain table into monthly partitions"""
+        # InnoDB partitioning allows no foreign keys, and every unique key must contain the date
+        cursor.execute("""
+            SELECT CONSTRAINT_NAME FROM information_schema.table_constraints
+            WHERE table_schema = DATABASE() AND table_name = %s AND constraint_type = 'FOREIGN KEY'
+        """, (self.table,))
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {self.table} DROP FOREIGN KEY {constraint}")
+        cursor.execute(f"ALTER TABLE {self.table} DROP PRIMARY KEY, ADD PRIMARY KEY (id, date)")
+        
+        cursor.execute(f"SELECT MIN(date) FROM {self.table}")
+        oldest = cursor.fetchone()[0] or today
+        first, last = month_start(oldest, 1), month_start(today, self.months_ahead + 1)
+        bounds = []
+        while first <= last:
+            bounds.append(first)
+            first = month_start(first, 1)
+        cursor.execute(f"ALTER TABLE {self.table} PARTITION BY RANGE COLUMNS(date) ({self.partition_clause(bounds)})")
+        print(f"Table {self.table} partitioned into {len(bounds)} months")
+    
+    def ensure_upcoming(self, cursor, partitions, today):
+        """Split pmax so every month up to months_ahead has its own partition"""
+        last = max((bound for _, bound in partitions if bound is not None), default=month_start(today))
+        wanted = month_start(today, self.months_ahead + 1)
+        bounds = []
+        while last < wanted:
+            last = month_start(last, 1)
+            bounds.append(last)
+        if bounds:
+            cursor.execute(f"ALTER TABLE {self.table} REORGANIZE PARTITION pmax INTO ({self.partition_clause(bounds)})")
+            print(f"Created {len(bounds)} upcoming {self.table} partitions")
+        return len(bounds)
+    
+    def archive_expired(self, cursor, partitions, today):
+        """Export partitions wholly before the hot horizon to archive files, then drop them"""
+        if self.hot_months is None:
+            return 0
+        horizon = month_start(today, -self.hot_months)
+        moved = 0
+        for name, bound in partitions:
+            if bound is None or bound > horizon:
+                break
+            cursor.execute(f"SELECT {', '.join(self.columns)} FROM {self.table} PARTITION ({name})")
+            rows = cursor.fetchall()
+            # Late inserts for dropped months land in the oldest partition, so group by month
+            months = {}
+            for row in rows:
+                months.setdefault(month_start(row[self.columns.index('date')]), []).append(row)
+            for month, month_rows in months.items():
+                self.write_month(month, month_rows)
+            # Written and fsynced before the drop: a crash in between only repeats the export
+            cursor.execute(f"ALTER TABLE {self.table} DROP PARTITION {name}")
+            archived_rows.inc(len(rows))
+            moved += len(rows)
+            print(f"Archived {len(rows)} rows from {self.table} partition {name}")
+        return moved
+    
+    def maintain(self, today=None, convert=False):
+        """Create upcoming months and archive expired ones; convert=True first partitions a plain table
+        
+        Runs in other threads or processes at the same time are skipped, returns None when nothing ran
+        """
+        today = today or date.today()
+        if not self.maintenance_lock.acquire(blocking=False):
+            return None
+        try:
+            self.db.connect()
+            cursor = self.db.connection.cursor()
+            lock_name = f"{MAINTENANCE_LOCK}:{self.table}"
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (lock_name,))
+            if cursor.fetchone()[0] != 1:
+                cursor.close()
+                print(f"{self.table} maintenance is running in another process, skipped")
+                return None
+            try:
+                partitions = self.partitions(cursor)
+                if not partitions:
+                    if not convert:
+                        enhanced = ' --enhanced' if self.table == 'attendance_records' else ''
+                        print(f"Table {self.table} is not partitioned, convert it with: "
+                              f"python attendance_archive.py --partition{enhanced}")
+                        return None
+                    self.ensure_partitioned(cursor, today)
+                    partitions = self.partitions(cursor)
+                created = self.ensure_upcoming(cursor, partitions, today)
+                moved = self.archive_expired(cursor, self.partitions(cursor), today)
+                return {'partitions_created': created, 'rows_archived': moved}
+            finally:
+                cursor.execute("DO RELEASE_LOCK(%s)", (lock_name,))
+                cursor.close()
+        except (Error, OSError, AttributeError) as e:  # AttributeError: no connection
+            print(f"Error maintaining {self.table} partitions: {e}")
+            return None
+        finally:
+            self.maintenance_lock.release()
+    
+    def start(self, interval_hours=config.ATTENDANCE_MAINTENANCE_HOURS):
+        """Run maintain() now, then in the background every interval_hours (app startup only)"""
+        def run():
+            while True:
+                time.sleep(interval_hours * 3600)
+                self.maintain()
+        
+        if self.thread is None:
+            self.maintain()
+            self.thread = threading.Thread(target=run, name=f'{self.table}-maintenance', daemon=True)
+            self.thread.start()
+    
+    # Archive files
+    def month_path(self, month):
+        return os.path.join(self.directory, f"{month:%Y-%m}.npz")
+    
+    def archived_months(self):
+        return sorted(as_date(os.path.basename(path)[:7] + '-01')
+                      for path in glob.glob(os.path.join(self.directory, '*.npz')))
+    
+    def write_month(self, month, rows):
+        """Merge rows into a month's archive file (rows with a known id replace the archived copy)"""
+        columns = {name: encode_column(name, [row[index] for row in rows]) for index, name in enumerate(self.columns)}
+        existing = self.load_month(month)
+        if existing is not None:
+            merged = {name: np.concatenate([existing[name], columns[name]]) for name in self.columns}
+            # Keep the last copy of each id, i.e. the newer export
+            _, last = np.unique(merged['id'][::-1], return_index=True)
+            keep = np.sort(len(merged['id']) - 1 - last)
+            columns = {name: values[keep] for name, values in merged.items()}
+        self._save(month, columns)
+    
+    def _save(self, month, columns):
+        path = self.month_path(month)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, **columns)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+    
+    def load_month(self, month):
+        """Column arrays of an archived month, or None"""
+        path = self.month_path(month)
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            cached = self.cache.pop(path, None)
+            if cached is None or cached[0] != mtime:
+                with np.load(path) as data:
+                    cached = (mtime, {name: data[name] for name in data.files})
+            self.cache[path] = cached
+            while len(self.cache) > config.ATTENDANCE_ARCHIVE_CACHE_MONTHS:
+                self.cache.pop(next(iter(self.cache)))
+        return cached[1]
+    
+    def read_columns(self, start=None, end=None, key=None):
+        """Archived columns (numpy arrays) for dates in [start, end] and optionally one key"""
+        start = as_date(start) if start else None
+        end = as_date(end) if end else None
+        parts = []
+        with archive_reads.time():
+            for month in self.archived_months():
+                if (start and month_start(month, 1) <= start) or (end and month > end):
+                    continue
+                columns = self.load_month(month)
+                mask = np.ones(len(columns['id']), dtype=bool)
+                if start:
+                    mask &= columns['date'] >= np.datetime64(start)
+                if end:
+                    mask &= columns['date'] <= np.datetime64(end)
+                if key is not None:
+                    mask &= columns[self.key_column] == key
+                if mask.any():
+                    parts.append({name: values[mask] for name, values in columns.items()})
+        if not parts:
+            return None
+        return {name: np.concatenate([part[name] for part in parts]) for name in self.columns}
+    
+    def read_rows(self, start=None, end=None, key=None):
+        """Archived rows as dicts typed like the MySQL driver's"""
+        columns = self.read_columns(start, end, key)
+        if columns is None:
+            return []
+        return [{name: decode_value(name, columns[name][index]) for name in self.columns}
+                for index in range(len(columns['id']))]
+    
+    def delete_ids(self, ids):
+        """Remove archived rows by id, returns how many were removed"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        removed = 0
+        for month in self.archived_months():
+            columns = self.load_month(month)
+            keep = ~np.isin(columns['id'], ids)
+            if not keep.all():
+                removed += int((~keep).sum())
+                self._save(month, {name: values[keep] for name, values in columns.items()})
+        return removed
+    
+    def stats(self):
+        months = self.archived_months()
+        return {
+            'table': self.table,
+            'archived_months': [f"{month:%Y-%m}" for month in months],
+            'archive_bytes': sum(os.path.getsize(self.month_path(month)) for month in months),
+            'hot_months': self.hot_months
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition the attendance table by month and archive old months")
+    parser.add_argument('--partition', action='store_true', required=True,
+                        help="Convert a plain table (drops its foreign keys, primary key becomes (id, date))")
+    parser.add_argument('--enhanced', action='store_true', help="Use attendance_records (app_enhanced)")
+    args = parser.parse_args()
+    
+    if args.enhanced:
+        from db_enhanced import DatabaseManager
+        table = 'attendance_records'
+    else:
+        from db import DatabaseManager
+        table = 'attendance'
+    
+    db = DatabaseManager()
+    try:
+        result = AttendanceArchive(db, table).maintain(convert=True)
+        if result is None:
+            raise SystemExit(f"{table} was not maintained, see the messages above")
+        print(f"{table}: {result['partitions_created']} partitions created, {result['rows_archived']} rows archived")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Attendance analytics benchmark
+Builds a synthetic columnar dataset and times every report
+Usage: python -m benchmarks.analytics --records 10000000
+"""
+
+import argparse
+import json
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from analytics import AttendanceAnalytics, AttendanceColumns, REPORTS
+
+
+def build_columns(records, users, days, departments, seed=0):
+    """Generate synthetic attendance columns"""
+    rng = np.random.default_rng(seed)
+    start_date = date.today() - timedelta(days=days - 1)
+    
+    # Weekdays only, 09:00 start with a skewed arrival distribution
+    weekdays = np.array([d for d in range(days) if (start_date + timedelta(days=d)).weekday() < 5])
+    arrival = 9 * 3600 + rng.gamma(shape=2.0, scale=240.0, size=records) - 600
+    
+    return AttendanceColumns(
+        start_date=start_date,
+        num_days=days,
+        user_ids=np.array([f"U{i:07d}" for i in range(users)]),
+        user_departments=rng.integers(0, departments, users),
+        departments=[f"Department {i}" for i in range(departments)],
+        user=rng.integers(0, users, records),
+        day=rng.choice(weekdays, records),
+        seconds=np.clip(arrival, 0, 86399),
+        schedule=np.ones(records, dtype=np.int32),
+        schedule_start=np.array([-1, 9 * 3600])
+    )
+
+
+def time_call(func, repeat):
+    """Best wall time over several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark attendance analytics reports")
+    parser.add_argument('--records', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--days', type=int, default=180)
+    parser.add_argument('--departments', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    start = time.perf_counter()
+    columns = build_columns(args.records, args.users, args.days, args.departments)
+    print(f"Generated {args.records:,} records for {args.users:,} users in {time.perf_counter() - start:.2f}s")
+    
+    results = {'records': args.records, 'users': args.users, 'days': args.days, 'reports': {}}
+    department = columns.departments[0]
+    for name, report in REPORTS.items():
+        full = time_call(lambda: report(columns), args.repeat)
+        filtered = time_call(lambda: report(columns.filter(department=department)), args.repeat)
+        results['reports'][name] = {'full_seconds': full, 'department_seconds': filtered}
+        print(f"{name:<12} full: {full * 1000:8.1f} ms   one department: {filtered * 1000:8.1f} ms")
+    
+    # Cached path: columns are already loaded, second call is a dictionary hit
+    end_date = columns.start_date + timedelta(days=args.days - 1)
+    engine = AttendanceAnalytics(db=None)
+    engine.columns_cache[(columns.start_date, end_date)] = columns
+    cold = time_call(lambda: engine.report('rates', columns.start_date, end_date), 1)
+    warm = time_call(lambda: engine.report('rates', columns.start_date, end_date), args.repeat)
+    results['cache'] = {'cold_seconds': cold, 'warm_seconds': warm}
+    print(f"cache        cold: {cold * 1000:8.1f} ms   warm: {warm * 1e6:8.1f} us")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Attendance history benchmark
+Loads growing amounts of synthetic attendance history into a plain table and a monthly
+partitioned table with a cold archive (attendance_archive.py), then times the queries the
+dashboard makes: one day's records, a user's last 30 days and a day from the archived range
+Needs the MySQL server from config.DB_CONFIG; scratch tables bench_attendance_* are dropped afterwards
+Usage:
+    python -m benchmarks.attendance_history --users 500 --years 1,2,4,8 [--json results/attendance_history.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+import numpy as np
+
+import config
+from attendance_archive import TABLE_COLUMNS, AttendanceArchive
+
+TABLE_SCHEMA = """
+    CREATE TABLE {table} (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id VARCHAR(50),
+        date DATE NOT NULL,
+        time TIME NOT NULL,
+        status ENUM('Present', 'Absent') DEFAULT 'Present',
+        schedule_id INT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE KEY unique_attendance (user_id, date, schedule_id)
+    )
+"""
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 4), 'p95_ms': round(float(p95), 4), 'p99_ms': round(float(p99), 4)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+class ScratchDatabase:
+    """Just enough of a DatabaseManager for AttendanceArchive"""
+    
+    def __init__(self):
+        self.connection = mysql.connector.connect(**config.DB_CONFIG)
+    
+    def connect(self):
+        pass
+
+
+def load_history(cursor, table, users, days, today, batch=5000):
+    """One mark per user per weekday for the last `days` days"""
+    rows = []
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        for user in range(users):
+            rows.append((f"U{user:05d}", day, f"09:{user % 60:02d}:00", 1))
+            if len(rows) >= batch:
+                cursor.executemany(f"INSERT INTO {table} (user_id, date, time, schedule_id) VALUES (%s, %s, %s, %s)", rows)
+                rows = []
+    if rows:
+        cursor.executemany(f"INSERT INTO {table} (user_id, date, time, schedule_id) VALUES (%s, %s, %s, %s)", rows)
+
+
+def time_queries(cursor, table, users, today, queries, seed=0):
+    """Latency of the day and per-user queries against one table"""
+    rng = np.random.default_rng(seed)
+    day_samples, user_samples = [], []
+    for _ in range(queries):
+        day = today - timedelta(days=int(rng.integers(0, 28)))
+        start = time.perf_counter()
+        cursor.execute(f"SELECT * FROM {table} WHERE date = %s ORDER BY time DESC", (day,))
+        cursor.fetchall()
+        day_samples.append(time.perf_counter() - start)
+        
+        user_id = f"U{int(rng.integers(0, users)):05d}"
+        start = time.perf_counter()
+        cursor.execute(f"SELECT * FROM {table} WHERE user_id = %s AND date BETWEEN %s AND %s",
+                       (user_id, today - timedelta(days=30), today))
+        cursor.fetchall()
+        user_samples.append(time.perf_counter() - start)
+    return {'day_query': percentiles(day_samples), 'user_30_days_query': percentiles(user_samples)}
+
+
+def run_history(db, years, users, queries, hot_months, archive_dir):
+    cursor = db.connection.cursor()
+    today = date.today()
+    run = {'years': years}
+    for layout in ('flat', 'partitioned'):
+        table = f"bench_attendance_{layout}"
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(TABLE_SCHEMA.format(table=table))
+        start = time.perf_counter()
+        load_history(cursor, table, users, int(years * 365), today)
+        db.connection.commit()
+        run[f'{layout}_load_seconds'] = round(time.perf_counter() - start, 2)
+        
+        archive = None
+        if layout == 'partitioned':
+            archive = AttendanceArchive(db, table, columns=TABLE_COLUMNS['attendance_records'],
+                                        directory=archive_dir, hot_months=hot_months)
+            start = time.perf_counter()
+            archive.maintain(today, convert=True)
+            run['maintain_seconds'] = round(time.perf_counter() - start, 2)
+            run['archive'] = archive.stats()
+        
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        run[f'{layout}_rows'] = cursor.fetchone()[0]
+        run[layout] = time_queries(cursor, table, users, today, queries)
+        
+        if archive is not None and archive.archived_months():
+            samples = []
+            oldest = archive.archived_months()[0]
+            for index in range(queries):
+                start = time.perf_counter()
+                archive.read_rows(oldest + timedelta(days=index % 28), oldest + timedelta(days=index % 28))
+                samples.append(time.perf_counter() - start)
+            run['archived_day_query'] = percentiles(samples)
+        cursor.execute(f"DROP TABLE {table}")
+    cursor.close()
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query latency as attendance history grows")
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--years', default='1,2,4,8', help="Comma-separated history lengths")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--hot-months', type=int, default=config.ATTENDANCE_HOT_MONTHS or 12)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    db = ScratchDatabase()
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'users': args.users,
+        'hot_months': args.hot_months,
+        'runs': []
+    }
+    for years in [float(value) for value in args.years.split(',')]:
+        archive_dir = tempfile.mkdtemp(prefix='bench_archive_')
+        try:
+            run = run_history(db, years, args.users, args.queries, args.hot_months, archive_dir)
+        finally:
+            shutil.rmtree(archive_dir, ignore_errors=True)
+        results['runs'].append(run)
+        print(f"{years:4g} years: flat {run['flat_rows']} rows day p95 {run['flat']['day_query']['p95_ms']:.2f}ms   "
+              f"partitioned {run['partitioned_rows']} hot rows day p95 {run['partitioned']['day_query']['p95_ms']:.2f}ms   "
+              f"archived day p95 {run.get('archived_day_query', {}).get('p95_ms', '-')}ms")
+    db.connection.close()
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Attendance ingestion load test
+Posts synthetic marks to a running app_enhanced server, one event per request (the single-mark
+path) and in batches through /api/attendance/batch, and reports events/sec and request latency
+The marks are written to the server's database, so point it at a test deployment
+Usage:
+    python -m benchmarks.attendance_ingest --url http://localhost:5000 --events 5000 --batches 1,100,1000 [--binary] [--json results/attendance_ingest.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from ingest import pack_events, schedule_open
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 4), 'p95_ms': round(float(p95), 4), 'p99_ms': round(float(p99), 4)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+def open_window(schedules, now):
+    """(schedule_id, datetime) a minute into the most recent schedule window that has started"""
+    for days_back in range(7):
+        day = date.today() - timedelta(days=days_back)
+        for schedule in schedules:
+            if not schedule.get('start_time'):
+                continue
+            start = datetime.combine(day, datetime.strptime(str(schedule['start_time']), '%H:%M:%S').time())
+            candidate = start + timedelta(minutes=1)
+            if candidate <= now and schedule_open(schedule, candidate):
+                return schedule['id'], candidate
+    return None, None
+
+
+def build_events(user_ids, schedule_id, base, count):
+    return [{'user_id': user_ids[index % len(user_ids)], 'timestamp': base.timestamp() + index % 30,
+             'schedule_id': schedule_id, 'camera_id': f"bench-{index % 4}"} for index in range(count)]
+
+
+def post_batch(url, batch, binary):
+    if binary:
+        body, content_type = pack_events(batch), 'application/octet-stream'
+    else:
+        body, content_type = '\n'.join(json.dumps(event) for event in batch).encode('utf-8'), 'application/x-ndjson'
+    request = urllib.request.Request(f"{url}/api/attendance/batch", data=body, method='POST',
+                                     headers={'Content-Type': content_type})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        summary = json.loads(response.read())['summary']
+    return time.perf_counter() - start, summary
+
+
+def run_batch_size(url, events, batch_size, concurrency, binary):
+    batches = [events[start:start + batch_size] for start in range(0, len(events), batch_size)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        outcomes = list(pool.map(lambda batch: post_batch(url, batch, binary), batches))
+    seconds = time.perf_counter() - start
+    
+    totals = {}
+    for _, summary in outcomes:
+        for status, count in summary.items():
+            if isinstance(count, int) and status != 'received':
+                totals[status] = totals.get(status, 0) + count
+    return {
+        'batch_size': batch_size,
+        'requests': len(batches),
+        'seconds': round(seconds, 3),
+        'events_per_sec': round(len(events) / seconds, 1),
+        'request_latency': percentiles([latency for latency, _ in outcomes]),
+        'outcomes': totals
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the batch attendance endpoint")
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--events', type=int, default=5000)
+    parser.add_argument('--batches', default='1,100,1000', help="Events per request; 1 is the single-mark baseline")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--binary', action='store_true', help="Send the packed binary format instead of JSON lines")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    user_ids = [user['user_id'] for user in get_json(f"{args.url}/api/users?fields=user_id")]
+    schedule_id, base = open_window(get_json(f"{args.url}/api/schedules"), datetime.now())
+    if not user_ids or schedule_id is None:
+        raise SystemExit("The server needs registered users and a schedule window in the last week")
+    events = build_events(user_ids, schedule_id, base, args.events)
+    
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'url': args.url,
+        'events': args.events,
+        'users': len(user_ids),
+        'concurrency': args.concurrency,
+        'format': 'binary' if args.binary else 'jsonl',
+        'runs': []
+    }
+    for batch_size in [int(value) for value in args.batches.split(',')]:
+        run = run_batch_size(args.url, events, batch_size, args.concurrency, args.binary)
+        results['runs'].append(run)
+        print(f"batch {batch_size:>6}: {run['events_per_sec']:>10} events/s   "
+              f"request p95 {run['request_latency']['p95_ms']:.1f}ms   {run['outcomes']}")
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Gallery duplicate scan benchmark
+Builds a synthetic gallery with planted duplicate registrations (the same face under a second ID)
+and look-alike pairs, runs gallery_dedupe.find_duplicates over it and reports scan time and how
+many planted pairs were found
+Usage:
+    python -m benchmarks.gallery_dedupe --identities 10000,100000 --workers 1,4 [--json results/gallery_dedupe.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, pack_encoding
+from gallery_dedupe import find_duplicates
+
+PERSON_SPREAD = 0.055   # Component spread between people: ~0.9 apart, like dlib encodings
+SAMPLE_NOISE = 0.015    # Within one person: samples ~0.25 apart
+LOOKALIKE_SHIFT = 0.03  # Planted look-alikes: ~0.5 from the original
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def synthetic_gallery(identities, samples, planted, seed=0):
+    """(identity, packed encoding) rows plus the planted duplicate and look-alike pairs"""
+    rng = np.random.default_rng(seed)
+    people = rng.normal(0, PERSON_SPREAD, (identities, ENCODING_SIZE)).astype(np.float32)
+    names = [f"U{index:06d}" for index in range(identities)]
+    duplicates, lookalikes = set(), set()
+    originals = rng.choice(identities, 2 * planted, replace=False)
+    for number, original in enumerate(originals):
+        if number < planted:
+            people = np.vstack([people, people[original]])
+            names.append(f"D{number:06d}")
+            duplicates.add(frozenset((names[original], names[-1])))
+        else:
+            people = np.vstack([people, people[original] + rng.normal(0, LOOKALIKE_SHIFT, ENCODING_SIZE)])
+            names.append(f"L{number:06d}")
+            lookalikes.add(frozenset((names[original], names[-1])))
+    
+    rows = []
+    for name, person in zip(names, people):
+        for _ in range(samples):
+            rows.append((name, pack_encoding(person + rng.normal(0, SAMPLE_NOISE, ENCODING_SIZE))))
+    return rows, duplicates, lookalikes
+
+
+def recall(planted, pairs):
+    found = {frozenset((pair['a'], pair['b'])) for pair in pairs}
+    return round(len(planted & found) / len(planted), 4) if planted else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Duplicate and look-alike scan time on synthetic galleries")
+    parser.add_argument('--identities', default='10000,100000', help="Comma-separated gallery sizes")
+    parser.add_argument('--samples', type=int, default=2, help="Samples per identity")
+    parser.add_argument('--planted', type=int, default=100, help="Duplicate and look-alike pairs planted each")
+    parser.add_argument('--workers', default='1', help="Comma-separated process counts")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'samples': args.samples,
+        'runs': []
+    }
+    for identities in [int(value) for value in args.identities.split(',')]:
+        rows, duplicates, lookalikes = synthetic_gallery(identities, args.samples, args.planted)
+        for workers in [int(value) for value in args.workers.split(',')]:
+            start = time.perf_counter()
+            report = find_duplicates(rows, workers=workers)
+            run = {
+                'identities': report['identities'],
+                'workers': workers,
+                'seconds': round(time.perf_counter() - start, 2),
+                'stages': report['seconds'],
+                'pairs_per_second': round(report['pairs_compared'] / max(report['seconds']['scan'], 1e-9)),
+                'duplicates_found': report['duplicates_found'],
+                'lookalikes_found': report['lookalikes_found'],
+                'duplicate_recall': recall(duplicates, report['duplicates']),
+                'lookalike_recall': recall(lookalikes, report['lookalikes'])
+            }
+            results['runs'].append(run)
+            print(f"{run['identities']:>7} identities, {workers} workers: {run['seconds']:>7}s "
+                  f"({run['pairs_per_second']:.3g} pairs/s)   duplicates {run['duplicates_found']} "
+                  f"(recall {run['duplicate_recall']})   look-alikes {run['lookalikes_found']} "
+                  f"(recall {run['lookalike_recall']})")
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
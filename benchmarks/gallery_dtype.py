@@ -0,0 +1,136 @@
+"""
+Gallery storage mode benchmark
+Compares float32, float16 and int8 galleries on a synthetic population for
+memory, match latency and agreement with the float32 decisions and distances
+Usage:
+    python -m benchmarks.gallery_dtype --identities 10000 --samples 3 [--json results/gallery_dtype.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from gallery import GALLERY_DTYPES, FaceGallery
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 4), 'p95_ms': round(float(p95), 4), 'p99_ms': round(float(p99), 4)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def synthetic_population(identities, samples, seed=0):
+    """Per-identity base encodings and (identity, sample) rows scattered around them"""
+    rng = np.random.default_rng(seed)
+    # Real encodings have components of roughly +-0.1; samples of one person sit ~0.2 apart
+    bases = rng.normal(0.0, 0.09, (identities, 128)).astype(np.float32)
+    rows = []
+    for index, base in enumerate(bases):
+        for sample in base + rng.normal(0.0, 0.015, (samples, 128)):
+            rows.append((f"ID{index:06d}", sample.astype(np.float32).tobytes()))
+    return bases, rows
+
+
+def build_queries(bases, count, seed=1):
+    """Genuine queries (a known identity plus noise) and impostors (new random faces)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(bases), count)
+    genuine = bases[picks] + rng.normal(0.0, 0.03, (count, 128)).astype(np.float32)
+    impostors = rng.normal(0.0, 0.09, (count, 128)).astype(np.float32)
+    return [f"ID{index:06d}" for index in picks], genuine, impostors
+
+
+def run_mode(dtype, rows, expected, genuine, impostors, reference, repeat):
+    """Memory, latency and accuracy of one storage mode"""
+    start = time.perf_counter()
+    gallery = FaceGallery(dtype=dtype)
+    gallery.load(rows)
+    build_seconds = time.perf_counter() - start
+    
+    samples = []
+    for _ in range(repeat):
+        for query in genuine:
+            start = time.perf_counter()
+            gallery.match([query])
+            samples.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    genuine_results = gallery.match(genuine)
+    impostor_results = gallery.match(impostors)
+    batch_seconds = time.perf_counter() - start
+    
+    results = genuine_results + impostor_results
+    run = {
+        'dtype': dtype,
+        'gallery_mb': round(gallery.nbytes() / (1024 * 1024), 3),
+        'bytes_per_sample': round(gallery.sample_matrix.nbytes / max(1, gallery.sample_count()), 1),
+        'build_seconds': round(build_seconds, 3),
+        'match_latency': percentiles(samples),
+        'batch_queries_per_sec': round(len(results) / batch_seconds, 1) if batch_seconds else None,
+        'true_accept_rate': round(np.mean([identity == want for (identity, _), want in zip(genuine_results, expected)]), 4),
+        'false_accept_rate': round(np.mean([identity is not None for identity, _ in impostor_results]), 4)
+    }
+    if reference is not None:
+        distances = np.array([distance for _, distance in results])
+        reference_distances = np.array([distance for _, distance in reference])
+        errors = np.abs(distances - reference_distances)
+        run['decision_agreement'] = round(np.mean([a[0] == b[0] for a, b in zip(results, reference)]), 4)
+        run['distance_error_mean'] = round(float(errors.mean()), 6)
+        run['distance_error_max'] = round(float(errors.max()), 6)
+    return run, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare gallery storage modes")
+    parser.add_argument('--identities', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=3, help="Samples per identity")
+    parser.add_argument('--queries', type=int, default=500, help="Genuine and impostor queries each")
+    parser.add_argument('--repeat', type=int, default=1, help="Passes over the queries for single-query latency")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    bases, rows = synthetic_population(args.identities, args.samples)
+    expected, genuine, impostors = build_queries(bases, args.queries)
+    
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'identities': args.identities,
+        'samples_per_identity': args.samples,
+        'queries': args.queries,
+        'runs': []
+    }
+    reference = None
+    for dtype in GALLERY_DTYPES:  # float32 first, it is the reference for the others
+        run, outcome = run_mode(dtype, rows, expected, genuine, impostors, reference, args.repeat)
+        reference = reference or outcome
+        results['runs'].append(run)
+        print(f"{dtype:>8}: {run['gallery_mb']:8.2f} MB   match p95 {run['match_latency']['p95_ms']:.3f}ms   "
+              f"batch {run['batch_queries_per_sec']} q/s   TAR {run['true_accept_rate']}   "
+              f"FAR {run['false_accept_rate']}   max distance error {run.get('distance_error_max', 0.0)}")
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,274 @@
+"""
+End-to-end recognition pipeline benchmark
+Drives capture -> detect -> encode -> match -> mark through CameraManager,
+FaceRecognitionEngine and AttendanceManager, with the camera replaced by a
+video file and the database by an in-memory stand-in
+Usage:
+    python -m benchmarks.pipeline --faces-dir known_faces/ --galleries 100,1000,10000,100000
+    python -m benchmarks.pipeline --video clip.mp4 --json results/pipeline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import cv2
+import numpy as np
+
+from attendance import AttendanceManager
+from camera import CameraManager
+from config import FRAME_WIDTH, FRAME_HEIGHT
+from face_utils import FaceRecognitionEngine
+from pipeline import PIPELINE_STAGES, RecognitionPipeline
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class InMemoryDatabase:
+    """Stand-in for db.DatabaseManager holding students and attendance in dicts"""
+    
+    def __init__(self, encodings):
+        self.students = {}
+        self.encodings = []
+        for student_id, encoding in encodings:
+            self.students[student_id] = {'student_id': student_id, 'name': student_id, 'status': 'approved'}
+            self.encodings.append((student_id, encoding))
+        self.marked = set()
+    
+    def get_face_encodings(self):
+        return self.encodings
+    
+    def get_attendance_settings(self):
+        return {'start_time': '00:00', 'end_time': '23:59'}
+    
+    def get_student_by_id(self, student_id, fields=None):
+        return self.students.get(student_id)
+    
+    def check_attendance_today(self, student_id, day=None):
+        return (student_id, day or date.today()) in self.marked
+    
+    def mark_attendance(self, student_id, at=None):
+        self.marked.add((student_id, at.date() if at else date.today()))
+        return True
+    
+    def close(self):
+        pass
+
+
+def load_faces(faces_dir):
+    """Face images named <student_id>.<ext> and their encodings"""
+    import face_recognition
+    
+    faces = []
+    for filename in sorted(os.listdir(faces_dir)):
+        student_id, extension = os.path.splitext(filename)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        image = cv2.imread(os.path.join(faces_dir, filename))
+        if image is None:
+            continue
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        locations = face_recognition.face_locations(rgb_image)
+        if len(locations) != 1:
+            print(f"Skipping {filename}: expected one face, found {len(locations)}")
+            continue
+        top, right, bottom, left = locations[0]
+        encoding = face_recognition.face_encodings(rgb_image, locations)[0]
+        faces.append((student_id, image, (top, right, bottom, left), encoding))
+    return faces
+
+
+def write_synthetic_video(path, frames, faces, faces_per_frame, fps=30, seed=0):
+    """Noise background with face crops pasted at random positions"""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (FRAME_WIDTH, FRAME_HEIGHT))
+    background = cv2.GaussianBlur(rng.integers(0, 256, (FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8), (0, 0), 8)
+    
+    for _ in range(frames):
+        frame = background.copy()
+        if faces:
+            for index in rng.choice(len(faces), size=min(faces_per_frame, len(faces)), replace=False):
+                _, image, (top, right, bottom, left), _ = faces[index]
+                pad = (bottom - top) // 2
+                crop = image[max(0, top - pad):bottom + pad, max(0, left - pad):right + pad]
+                scale = min(1.0, (FRAME_HEIGHT / 2) / crop.shape[0], (FRAME_WIDTH / 3) / crop.shape[1])
+                crop = cv2.resize(crop, (int(crop.shape[1] * scale), int(crop.shape[0] * scale)))
+                y = rng.integers(0, FRAME_HEIGHT - crop.shape[0] + 1)
+                x = rng.integers(0, FRAME_WIDTH - crop.shape[1] + 1)
+                frame[y:y + crop.shape[0], x:x + crop.shape[1]] = crop
+        writer.write(frame)
+    writer.release()
+
+
+def synthetic_gallery(size, faces, seed=0):
+    """Random unit-scale encodings padded around the real face encodings"""
+    rng = np.random.default_rng(seed)
+    encodings = [(student_id, ','.join(map(str, encoding))) for student_id, _, _, encoding in faces]
+    count = max(0, size - len(encodings))
+    # Real encodings sit around norm ~1, with components of roughly +-0.1
+    random_encodings = rng.normal(0.0, 0.09, (count, 128))
+    encodings.extend((f"SYN{i:06d}", ','.join(map(str, encoding))) for i, encoding in enumerate(random_encodings))
+    return encodings
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None}
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 3), 'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3), 'mean_ms': round(float(values.mean()), 3)}
+
+
+def max_rss_mb():
+    """Peak resident set size of this process"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_pipeline(video_path, gallery, max_frames, warmup):
+    """Play the video through the full pipeline against one gallery"""
+    db = InMemoryDatabase(gallery)
+    rss_before = max_rss_mb()
+    engine = FaceRecognitionEngine(db=db)
+    pipeline = RecognitionPipeline(engine, AttendanceManager(db=db))
+    
+    camera = CameraManager(source=video_path)
+    if not camera.open():
+        raise RuntimeError(f"Cannot open video {video_path}")
+    
+    samples = {stage: [] for stage in PIPELINE_STAGES}
+    samples['total'] = []
+    faces = recognized = marked = frames = 0
+    start = None
+    try:
+        while max_frames is None or frames < max_frames + warmup:
+            capture_start = time.perf_counter()
+            frame, _ = camera.read()
+            if frame is None:
+                break
+            timings = {'capture': time.perf_counter() - capture_start}
+            results = pipeline.process(frame, timings)
+            
+            frames += 1
+            if frames == warmup:
+                start = time.perf_counter()
+            if frames <= warmup:
+                continue
+            for stage in PIPELINE_STAGES:
+                samples[stage].append(timings.get(stage, 0.0))
+            samples['total'].append(sum(timings.values()))
+            faces += len(results)
+            recognized += sum(1 for result in results if result['student_id'])
+            marked += sum(1 for result in results if result.get('marked'))
+    finally:
+        camera.cap.release()
+    
+    measured = frames - warmup
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    return {
+        'gallery_size': len(engine.gallery),
+        'frames': max(0, measured),
+        'fps': round(measured / elapsed, 2) if elapsed and measured > 0 else None,
+        'faces': faces,
+        'recognized': recognized,
+        'marked': marked,
+        'latency': {stage: percentiles(values) for stage, values in samples.items()},
+        'memory': {
+            'gallery_mb': round(engine.gallery.nbytes() / (1024 * 1024), 2),
+            'peak_rss_mb': max_rss_mb(),
+            'peak_rss_growth_mb': round(max_rss_mb() - rss_before, 1)
+        }
+    }
+
+
+def run_match(gallery, queries, repeat):
+    """Match-only latency for a batch of query encodings, isolates gallery size"""
+    engine = FaceRecognitionEngine(db=InMemoryDatabase(gallery))
+    samples = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            engine.match([query])
+            samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recognition pipeline end to end")
+    parser.add_argument('--video', help="Video clip to play instead of a synthetic one")
+    parser.add_argument('--faces-dir', help="Directory of <student_id>.jpg images pasted into synthetic frames")
+    parser.add_argument('--frames', type=int, default=300, help="Synthetic video length / frames to measure")
+    parser.add_argument('--faces-per-frame', type=int, default=2)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--galleries', default='100,1000,10000,100000',
+                        help="Comma-separated gallery sizes")
+    parser.add_argument('--match-queries', type=int, default=200)
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    faces = load_faces(args.faces_dir) if args.faces_dir else []
+    gallery_sizes = [int(size) for size in args.galleries.split(',') if size]
+    
+    temp_dir = None
+    video_path = args.video
+    if video_path is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        video_path = os.path.join(temp_dir.name, 'synthetic.avi')
+        write_synthetic_video(video_path, args.frames + args.warmup, faces, args.faces_per_frame)
+        print(f"Generated {args.frames + args.warmup} synthetic frames with {len(faces)} known faces")
+    
+    rng = np.random.default_rng(1)
+    queries = rng.normal(0.0, 0.09, (args.match_queries, 128))
+    
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'video': args.video or 'synthetic',
+        'frame_size': [FRAME_WIDTH, FRAME_HEIGHT],
+        'known_faces': len(faces),
+        'runs': []
+    }
+    try:
+        for size in gallery_sizes:
+            gallery = synthetic_gallery(size, faces)
+            run = run_pipeline(video_path, gallery, args.frames, args.warmup)
+            run['match_only'] = run_match(gallery, queries, repeat=1)
+            results['runs'].append(run)
+            
+            latency = run['latency']
+            print(f"gallery {size:>7}: {run['fps'] or 0:7.2f} fps   "
+                  + '   '.join(f"{stage} p95 {latency[stage]['p95_ms'] or 0:.2f}ms" for stage in PIPELINE_STAGES)
+                  + f"   match-only p99 {run['match_only']['p99_ms']:.3f}ms   rss {run['memory']['peak_rss_mb']} MB")
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
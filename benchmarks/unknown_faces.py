@@ -0,0 +1,102 @@
+"""
+Unknown-face store benchmark
+Fills an UnknownFaceStore with a day's worth of synthetic strangers (each seen several times) and
+reports per-sighting observe latency as the store grows, and how many clusters each stranger ended
+up in
+Usage:
+    python -m benchmarks.unknown_faces --strangers 100,1000,5000 [--capacity 1000] [--json results/unknown_faces.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from gallery import ENCODING_SIZE
+from unknown_faces import UnknownFaceStore
+
+PERSON_SPREAD = 0.055   # Component spread between people: ~0.9 apart, like dlib encodings
+SAMPLE_NOISE = 0.015    # Within one person: sightings ~0.25 apart
+
+
+def percentiles(samples):
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 4), 'p95_ms': round(float(p95), 4), 'p99_ms': round(float(p99), 4)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(strangers, sightings, capacity, seed=0):
+    rng = np.random.default_rng(seed)
+    people = rng.normal(0, PERSON_SPREAD, (strangers, ENCODING_SIZE)).astype(np.float32)
+    # Strangers come and go through the day, each seen a few times while around
+    order = np.repeat(np.arange(strangers), sightings)
+    order = order[np.argsort(order + rng.uniform(0, 3, len(order)), kind='stable')]
+    
+    store = UnknownFaceStore(max_clusters=capacity)
+    clusters = {}
+    latencies = []
+    for person in order:
+        encoding = people[person] + rng.normal(0, SAMPLE_NOISE, ENCODING_SIZE)
+        start = time.perf_counter()
+        cluster_id = store.observe(encoding)
+        latencies.append(time.perf_counter() - start)
+        clusters.setdefault(person, set()).add(cluster_id)
+    
+    return {
+        'strangers': strangers,
+        'sightings': len(order),
+        'capacity': capacity,
+        'clusters_kept': len(store),
+        'clusters_per_stranger': round(float(np.mean([len(ids) for ids in clusters.values()])), 3),
+        'observe': percentiles(latencies),
+        'first_quarter': percentiles(latencies[:len(latencies) // 4]),
+        'last_quarter': percentiles(latencies[-(len(latencies) // 4):])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Unknown-face clustering latency as the store fills up")
+    parser.add_argument('--strangers', default='100,1000,5000', help="Comma-separated stranger counts")
+    parser.add_argument('--sightings', type=int, default=5, help="Sightings per stranger")
+    parser.add_argument('--capacity', type=int, default=1000, help="Store capacity (UNKNOWN_MAX_CLUSTERS)")
+    parser.add_argument('--json', help="Write results to this file")
+    args = parser.parse_args()
+    
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'runs': []
+    }
+    for strangers in [int(value) for value in args.strangers.split(',')]:
+        result = run(strangers, args.sightings, args.capacity)
+        results['runs'].append(result)
+        print(f"{strangers:>6} strangers, {result['sightings']:>6} sightings: observe p50 "
+              f"{result['observe']['p50_ms']}ms p99 {result['observe']['p99_ms']}ms   "
+              f"(first quarter p50 {result['first_quarter']['p50_ms']}ms, last {result['last_quarter']['p50_ms']}ms)   "
+              f"{result['clusters_per_stranger']} clusters per stranger, {result['clusters_kept']} kept")
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
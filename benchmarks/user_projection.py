@@ -0,0 +1,95 @@
+"""
+User listing payload benchmark
+Compares /api/users payloads with and without the face_encoding column on a synthetic roster
+Usage: python -m benchmarks.user_projection --users 10000 [--live]
+"""
+
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+
+from db_enhanced import USER_DEFAULT_FIELDS, USER_FIELDS
+
+
+def build_roster(users, seed=0):
+    """Synthetic user rows shaped like SELECT * FROM users"""
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+    rows = []
+    for i in range(users):
+        encoding = rng.normal(0, 0.1, 128)
+        rows.append({
+            'id': i + 1,
+            'name': f"Student {i}",
+            'user_id': f"U{i:06d}",
+            'role': 'student',
+            'department': f"Department {i % 12}",
+            'class_section': f"S{i % 40}",
+            'phone': f"+1555{i:07d}",
+            'email': f"student{i}@example.edu",
+            'face_image_path': f"face_images/U{i:06d}.jpg",
+            'face_encoding': ','.join(map(str, encoding)),
+            'status': 'active',
+            'created_at': now.isoformat(),
+            'updated_at': now.isoformat()
+        })
+    return rows
+
+
+def measure(rows, fields, repeat):
+    """Serialized size and best serialization time for a projection"""
+    projected = [{field: row[field] for field in fields} for row in rows]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = json.dumps(projected).encode('utf-8')
+        best = min(best, time.perf_counter() - start)
+    return {
+        'bytes': len(body),
+        'gzip_bytes': len(gzip.compress(body, compresslevel=6)),
+        'serialize_ms': best * 1000
+    }
+
+
+def measure_live(fields, repeat):
+    """Query latency against the configured MySQL database"""
+    from db_enhanced import DatabaseManager
+    db = DatabaseManager()
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        users = db.get_all_users(fields)
+        best = min(best, time.perf_counter() - start)
+    db.close()
+    return {'rows': len(users), 'query_ms': best * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark user listing projections")
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--live', action='store_true', help="Also time queries against MySQL")
+    args = parser.parse_args()
+    
+    rows = build_roster(args.users)
+    results = {
+        'before': measure(rows, USER_FIELDS, args.repeat),
+        'after': measure(rows, USER_DEFAULT_FIELDS, args.repeat)
+    }
+    if args.live:
+        results['before'].update(measure_live(USER_FIELDS, args.repeat))
+        results['after'].update(measure_live(USER_DEFAULT_FIELDS, args.repeat))
+    
+    for label, result in results.items():
+        print(f"{label:<7} " + '  '.join(f"{key}: {value:,.1f}" if isinstance(value, float) else f"{key}: {value:,}"
+                                           for key, value in result.items()))
+    print(f"Payload reduced {results['before']['bytes'] / results['after']['bytes']:.1f}x")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
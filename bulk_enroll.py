@@ -0,0 +1,304 @@
+"""
+Bulk enrollment of users from an image directory or CSV manifest
+Usage:
+    python bulk_enroll.py --manifest intake.csv [--workers 8]
+    python bulk_enroll.py --directory photos/ --department Physics
+
+Manifest columns: user_id (or id), name, department, image_path
+Optional columns: role, class_section, phone, email
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _encode_image(entry):
+    """Worker: decode one image, encode its single face and store the face crop
+    
+    Returns (user_id, status, encoding or reason, stored image path, decode seconds, encode seconds)
+    """
+    import cv2
+    import face_recognition
+    from image_store import get_image_store
+    
+    user_id, image_path = entry
+    start = time.perf_counter()
+    try:
+        image = face_recognition.load_image_file(image_path)
+    except Exception as e:
+        return user_id, 'error', f"Cannot read image: {e}", None, time.perf_counter() - start, 0.0
+    decoded = time.perf_counter()
+    
+    locations = face_recognition.face_locations(image, model=config.FACE_LOCATIONS_MODEL)
+    if len(locations) != 1:
+        reason = 'no_face' if not locations else 'multiple_faces'
+        return user_id, 'rejected', reason, None, decoded - start, time.perf_counter() - decoded
+    
+    encoding = face_recognition.face_encodings(image, locations)[0]
+    encoded = time.perf_counter()
+    # Written here while the decoded image is at hand, rather than pointing at the source file
+    try:
+        image_path = get_image_store().save(cv2.cvtColor(image, cv2.COLOR_RGB2BGR), locations[0])['image']
+    except Exception as e:
+        return user_id, 'error', f"Cannot store face image: {e}", None, decoded - start, encoded - decoded
+    return user_id, 'ok', ','.join(map(str, encoding)), image_path, decoded - start, encoded - decoded
+
+
+def resolve_import_path(path, root=None):
+    """Real path of a server-side import file or directory, None if it lies outside the import root"""
+    root = os.path.realpath(root or config.BULK_ENROLL_IMPORT_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    return resolved if os.path.commonpath([root, resolved]) == root else None
+
+
+def parse_workers(value):
+    """Worker count from an API request, clamped to [1, cpu count]; None if not an integer"""
+    if value is None:
+        return os.cpu_count() or 1
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return max(1, min(value, os.cpu_count() or 1))
+
+
+def read_manifest(path):
+    """Read enrollment entries from a CSV manifest"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            user_id = (row.get('user_id') or row.get('id') or '').strip()
+            image_path = (row.get('image_path') or '').strip()
+            if not user_id or not image_path:
+                continue
+            entries.append({
+                'user_id': user_id,
+                'name': (row.get('name') or user_id).strip(),
+                'role': (row.get('role') or 'student').strip(),
+                'department': (row.get('department') or '').strip(),
+                'class_section': (row.get('class_section') or '').strip(),
+                'phone': (row.get('phone') or '').strip(),
+                'email': (row.get('email') or '').strip(),
+                'image_path': image_path if os.path.isabs(image_path) else os.path.join(base_dir, image_path)
+            })
+    return entries
+
+
+def scan_directory(path, department=''):
+    """Build enrollment entries from image files named <user_id>.<ext>"""
+    entries = []
+    for filename in sorted(os.listdir(path)):
+        user_id, extension = os.path.splitext(filename)
+        if extension.lower() in IMAGE_EXTENSIONS:
+            entries.append({
+                'user_id': user_id,
+                'name': user_id,
+                'role': 'student',
+                'department': department,
+                'class_section': '',
+                'phone': '',
+                'email': '',
+                'image_path': os.path.join(path, filename)
+            })
+    return entries
+
+
+class BulkEnrollment:
+    """Parallel, resumable enrollment of many users"""
+    
+    def __init__(self, entries, source, workers=None, batch_size=None, state_dir=None):
+        self.entries = entries
+        self.image_paths = {entry['user_id']: entry['image_path'] for entry in entries}
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size or config.BULK_ENROLL_BATCH_SIZE
+        state_dir = state_dir or config.BULK_ENROLL_STATE_DIR
+        os.makedirs(state_dir, exist_ok=True)
+        
+        # One progress log per source, so an interrupted run can resume
+        source_key = hashlib.sha1(os.path.abspath(source).encode('utf-8')).hexdigest()[:16]
+        self.state_path = os.path.join(state_dir, f"{source_key}.jsonl")
+        
+        self.lock = threading.Lock()
+        self.status = 'pending'
+        self.stats = {
+            'total': len(entries),
+            'skipped': 0,
+            'enrolled': 0,
+            'rejected': 0,
+            'errors': 0,
+            'rejections': {},
+            'decode_seconds': 0.0,
+            'encode_seconds': 0.0,
+            'insert_seconds': 0.0,
+            'wall_seconds': 0.0
+        }
+    
+    def image_mtime(self, user_id):
+        """Modification time (ns) of a user's image, None if it can't be read"""
+        try:
+            return os.stat(self.image_paths[user_id]).st_mtime_ns
+        except (KeyError, OSError):
+            return None
+    
+    def load_completed(self):
+        """User IDs a previous run finished: enrolled, or rejected for an image that hasn't changed since
+        
+        Errors (unreadable or half-copied files) are always retried
+        """
+        latest = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        latest[record['user_id']] = record
+                    except (ValueError, KeyError):
+                        continue  # Partially written last line
+        return {user_id for user_id, record in latest.items()
+                if record.get('status') == 'enrolled'
+                or (record.get('status') == 'rejected' and record.get('mtime') is not None
+                    and record['mtime'] == self.image_mtime(user_id))}
+    
+    def _record(self, state_file, results):
+        """Append finished entries to the progress log"""
+        for user_id, status, detail in results:
+            record = {'user_id': user_id, 'status': status, 'detail': detail}
+            if status == 'rejected':
+                record['mtime'] = self.image_mtime(user_id)  # Retried once the image is replaced
+            state_file.write(json.dumps(record) + '\n')
+        state_file.flush()
+        os.fsync(state_file.fileno())
+    
+    def _flush(self, db, state_file, pending):
+        """Insert a batch of encoded users and mark them done"""
+        if not pending:
+            return True
+        rows = [(entry['name'], entry['user_id'], entry['role'], entry['department'], entry['class_section'],
+                 entry['phone'], entry['email'], face_image_path, encoding)
+                for entry, encoding, face_image_path in pending]
+        
+        start = time.perf_counter()
+        success = db.create_users_bulk(rows)
+        elapsed = time.perf_counter() - start
+        
+        with self.lock:
+            self.stats['insert_seconds'] += elapsed
+            if success:
+                self.stats['enrolled'] += len(pending)
+            else:
+                self.stats['errors'] += len(pending)
+        if success:
+            self._record(state_file, [(entry['user_id'], 'enrolled', None) for entry, _, _ in pending])
+        pending.clear()
+        return success
+    
+    def run(self, db):
+        """Encode all remaining entries across a process pool and insert them in batches"""
+        self.status = 'running'
+        start = time.perf_counter()
+        
+        completed = self.load_completed()
+        remaining = [entry for entry in self.entries if entry['user_id'] not in completed]
+        by_user = {entry['user_id']: entry for entry in remaining}
+        with self.lock:
+            self.stats['skipped'] = len(self.entries) - len(remaining)
+        
+        pending = []
+        jobs = [(entry['user_id'], entry['image_path']) for entry in remaining]
+        chunksize = max(1, min(32, len(jobs) // (self.workers * 4) or 1))
+        
+        try:
+            # spawn: safe to use from inside the threaded web server
+            context = multiprocessing.get_context('spawn')
+            with open(self.state_path, 'a', encoding='utf-8') as state_file, \
+                    ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+                for user_id, status, detail, face_image_path, decode_s, encode_s in pool.map(_encode_image, jobs,
+                                                                                             chunksize=chunksize):
+                    with self.lock:
+                        self.stats['decode_seconds'] += decode_s
+                        self.stats['encode_seconds'] += encode_s
+                    
+                    if status == 'ok':
+                        pending.append((by_user[user_id], detail, face_image_path))
+                        if len(pending) >= self.batch_size:
+                            self._flush(db, state_file, pending)
+                    else:
+                        with self.lock:
+                            if status == 'rejected':
+                                self.stats['rejected'] += 1
+                                self.stats['rejections'][detail] = self.stats['rejections'].get(detail, 0) + 1
+                            else:
+                                self.stats['errors'] += 1
+                        self._record(state_file, [(user_id, status, detail)])
+                
+                self._flush(db, state_file, pending)
+            self.status = 'completed'
+        except Exception as e:
+            print(f"Error in bulk enrollment: {e}")
+            self.status = 'failed'
+        finally:
+            with self.lock:
+                self.stats['wall_seconds'] = time.perf_counter() - start
+        return self.report()
+    
+    def report(self):
+        """Progress and per-stage throughput"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['rejections'] = dict(self.stats['rejections'])
+        processed = stats['enrolled'] + stats['rejected'] + stats['errors']
+        
+        def rate(count, seconds):
+            return round(count / seconds, 2) if seconds else 0.0
+        
+        stats['status'] = self.status
+        stats['processed'] = processed
+        stats['throughput'] = {
+            'decode_per_worker_sec': rate(processed, stats['decode_seconds']),
+            'encode_per_worker_sec': rate(processed, stats['encode_seconds']),
+            'insert_rows_per_sec': rate(stats['enrolled'], stats['insert_seconds']),
+            'overall_per_sec': rate(processed, stats['wall_seconds'])
+        }
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk enroll users from images")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="CSV with user_id, name, department, image_path")
+    source.add_argument('--directory', help="Directory of <user_id>.jpg images")
+    parser.add_argument('--department', default='', help="Department for --directory enrollments")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args()
+    
+    from db_enhanced import DatabaseManager
+    
+    if args.manifest:
+        entries, source_path = read_manifest(args.manifest), args.manifest
+    else:
+        entries, source_path = scan_directory(args.directory, args.department), args.directory
+    
+    enrollment = BulkEnrollment(entries, source_path, workers=args.workers, batch_size=args.batch_size)
+    print(f"Enrolling {len(entries)} users with {enrollment.workers} workers...")
+    
+    db = DatabaseManager()
+    try:
+        report = enrollment.run(db)
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
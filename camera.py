@@ -2,29 +2,66 @@ import cv2
 import threading
 import time
 from config import CAMERA_INDEX, FRAME_WIDTH, FRAME_HEIGHT
+import metrics
+
+capture_seconds = metrics.histogram('camera_read_seconds', 'Time blocked reading a frame from the capture device')
+frames_captured = metrics.counter('camera_frames_total', 'Frames read from the capture device')
+read_failures = metrics.counter('camera_read_failures_total', 'Failed frame reads')
+camera_running = metrics.gauge('camera_running', '1 while the capture thread is running')
 
 class CameraManager:
-    def __init__(self):
+    def __init__(self, source=CAMERA_INDEX, loop=False):
+        """source: camera index, or a video file path (played back at its own frame rate)"""
+        self.source = source
+        self.loop = loop
+        self.is_file = isinstance(source, str)
         self.cap = None
         self.frame = None
+        self.frame_time = None
         self.running = False
         self.thread = None
         self.lock = threading.Lock()
         
-    def start(self):
-        """Start camera capture"""
-        try:
-            self.cap = cv2.VideoCapture(CAMERA_INDEX)
-            if not self.cap.isOpened():
-                print("Error: Could not open camera")
-                return False
-            
+    def open(self):
+        """Open the capture device without starting the capture thread"""
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            print("Error: Could not open camera")
+            return False
+        
+        if not self.is_file:
             # Set camera properties
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
             self.cap.set(cv2.CAP_PROP_FPS, 30)
+        return True
+    
+    def read(self):
+        """Read one frame synchronously, returns (frame, capture timestamp) or (None, None)"""
+        start = time.perf_counter()
+        ret, frame = self.cap.read()
+        if not ret and self.is_file and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        capture_seconds.observe(time.perf_counter() - start)
+        if not ret:
+            read_failures.inc()
+            return None, None
+        frames_captured.inc()
+        return frame, time.time()
+    
+    def grab(self):
+        """Advance one frame without decoding it"""
+        return self.cap.grab()
+    
+    def start(self):
+        """Start camera capture"""
+        try:
+            if not self.open():
+                return False
             
             self.running = True
+            camera_running.set(1)
             self.thread = threading.Thread(target=self._capture_frames)
             self.thread.daemon = True
             self.thread.start()
@@ -38,12 +75,18 @@ class CameraManager:
     
     def _capture_frames(self):
         """Continuously capture frames from camera"""
+        # Video files are paced to their own frame rate to behave like a camera
+        interval = 1.0 / (self.cap.get(cv2.CAP_PROP_FPS) or 30) if self.is_file else 0
+        
         while self.running:
             try:
-                ret, frame = self.cap.read()
-                if ret:
+                frame, frame_time = self.read()
+                if frame is not None:
                     with self.lock:
-                        self.frame = frame.copy()
+                        self.frame = frame
+                        self.frame_time = frame_time
+                    if interval:
+                        time.sleep(interval)
                 else:
                     print("Failed to read frame from camera")
                     time.sleep(0.1)
@@ -58,9 +101,17 @@ class CameraManager:
                 return self.frame.copy()
             return None
     
+    def get_frame_with_timestamp(self):
+        """Get current frame and the time it was captured"""
+        with self.lock:
+            if self.frame is not None:
+                return self.frame.copy(), self.frame_time
+            return None, None
+    
     def stop(self):
         """Stop camera capture"""
         self.running = False
+        camera_running.set(0)
         if self.thread:
             self.thread.join()
         if self.cap:
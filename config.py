@@ -8,6 +8,37 @@ DB_CONFIG = {
     'database': 'face_attendance_db'
 }
 
+# Storage Backend ('mysql' talks to DB_CONFIG directly; 'sqlite' keeps a local database on an edge
+# node and syncs it with DB_CONFIG in the background, see sync_agent.py)
+DB_BACKEND = 'mysql'
+SQLITE_PATH = 'attendance_edge.db'
+SYNC_INTERVAL_SECONDS = 30          # Pause between sync rounds
+SYNC_BATCH_SIZE = 500               # Rows per upload/download batch
+SYNC_OVERLAP_SECONDS = 2            # Change watermarks are re-read this far back to catch late commits
+
+# Attendance Journal (MySQL backend: marks are fsynced to disk before the database write and
+# replayed after an outage, see journal.py)
+ATTENDANCE_JOURNAL_DIR = 'attendance_journal'      # None disables the journal
+ATTENDANCE_JOURNAL_SEGMENT_BYTES = 4 * 1024 * 1024
+ATTENDANCE_JOURNAL_REPLAY_BATCH = 500              # Marks per replay transaction
+ATTENDANCE_JOURNAL_REPLAY_INTERVAL_SECONDS = 5     # Retry pause while the database is down or the journal is empty
+
+# Attendance Partitioning (monthly MySQL partitions; months past the hot horizon move to compressed
+# archive files that queries still read, see attendance_archive.py). Apps only maintain a table once it
+# has been converted with: python attendance_archive.py --partition [--enhanced]
+ATTENDANCE_PARTITIONING = True
+ATTENDANCE_PARTITIONS_AHEAD = 3          # Upcoming months created in advance
+ATTENDANCE_HOT_MONTHS = 12               # Months kept in MySQL; None never archives
+ATTENDANCE_ARCHIVE_DIR = 'attendance_archive'
+ATTENDANCE_ARCHIVE_CACHE_MONTHS = 12     # Archived months kept decoded in memory
+ATTENDANCE_MAINTENANCE_HOURS = 24        # How often running apps create partitions and archive
+
+# Batch Attendance Ingestion (/api/attendance/batch, for kiosks uploading marks cached offline)
+ATTENDANCE_BATCH_MAX_EVENTS = 20000       # Larger uploads are refused
+ATTENDANCE_BATCH_CHUNK = 500              # Events per database transaction
+ATTENDANCE_BATCH_MAX_AGE_DAYS = 7         # Older events are rejected
+ATTENDANCE_BATCH_MAX_SKEW_SECONDS = 300   # Kiosk clocks may run this far ahead
+
 # Camera Configuration
 CAMERA_INDEX = 1
 FRAME_WIDTH = 640
@@ -17,10 +48,103 @@ FRAME_HEIGHT = 480
 FACE_TOLERANCE = 0.6
 FACE_LOCATIONS_MODEL = 'hog'
 
+# Face Quality Gate (faces failing any check are not encoded and are retried on the next frame)
+FACE_QUALITY_ENABLED = True
+FACE_QUALITY_MIN_SIZE = 60               # Shorter side of the face box in pixels
+FACE_QUALITY_MIN_SHARPNESS = 40.0        # Laplacian variance of the face resized to 64x64
+FACE_QUALITY_BRIGHTNESS = (40, 220)      # Allowed mean grey level of the face
+FACE_QUALITY_USE_LANDMARKS = True        # Pose check from 5-point landmarks
+FACE_QUALITY_MAX_YAW = 0.3               # Nose offset from the eye midpoint, in inter-eye distances
+FACE_QUALITY_MAX_ROLL_DEGREES = 25
+FACE_QUALITY_EDGE_MARGIN = 2             # Boxes this close to the frame border are treated as cut off
+
+# Face Gallery Configuration (multi-sample templates)
+GALLERY_MAX_SAMPLES = 8              # Samples kept per person after compaction
+GALLERY_MERGE_DISTANCE = 0.15        # Samples closer than this are merged into one
+GALLERY_BORDERLINE_MARGIN = 0.08     # Centroid distances within tolerance +- margin are re-checked per sample
+GALLERY_REFRESH_DISTANCE = 0.4       # Recognitions at least this confident are folded into the template
+GALLERY_REFRESH_MARGIN = 0.15        # ...and at least this much closer than to any other person's centroid
+GALLERY_REFRESH_FLUSH_SECONDS = 60   # app_enhanced.py: refreshed templates are written to the database this often
+GALLERY_DTYPE = 'float32'            # In-memory storage: 'float32', 'float16' or 'int8' (per-dimension scaled)
+GALLERY_DEDUPE_DUPLICATE_DISTANCE = 0.35  # gallery_dedupe.py: identities closer than this are reported as one person
+GALLERY_DEDUPE_TILE = 4096           # Identities per side of a distance tile (4096 x 4096 float32 = 64 MB)
+GALLERY_DEDUPE_MAX_PAIRS = 10000     # Pairs listed per category in a report
+# Roster this camera usually sees, searched first when no scoped schedule is active, e.g.
+# {'departments': ['Physics'], 'class_sections': ['A']}; None searches the whole gallery
+CAMERA_SCOPE = None
+
+# Gallery Service (one process owns the gallery and models for all web workers, see gallery_service.py)
+GALLERY_SERVICE_SOCKET = None        # Unix socket path, e.g. '/tmp/face_gallery.sock'; None keeps the gallery in-process
+GALLERY_SERVICE_TIMEOUT = 5.0        # Seconds to wait for the service before a request fails
+
+# Recognition Cooldown (repeat sightings of a person within the window don't reach the attendance layer)
+RECOGNITION_COOLDOWN_SECONDS = 300
+RECOGNITION_COOLDOWN_TICK_SECONDS = 1.0   # Timing wheel resolution
+
+# Thin-Client Recognition (/api/recognize: clients detect faces and send embeddings or crops)
+REMOTE_RECOGNIZE_MAX_FACES = 64      # Larger requests are refused
+
+# Enrollment (registrations capture several frames in the background, see enrollment.py)
+ENROLL_CAPTURE_SECONDS = 4.0         # How long the camera is watched per registration
+ENROLL_BEST_FRAMES = 5               # Faces kept (by quality score) and encoded
+ENROLL_MIN_FRAMES = 2                # Fewer usable faces fail the job
+ENROLL_FRAME_INTERVAL_SECONDS = 0.1
+ENROLL_JOBS_KEPT = 100               # Finished jobs kept for polling
+
+# Unknown Faces (unrecognized faces are clustered so each stranger is prompted for once, see unknown_faces.py)
+UNKNOWN_CLUSTER_DISTANCE = 0.5       # A face joins the nearest cluster centroid within this distance, else starts one
+UNKNOWN_MAX_CLUSTERS = 1000          # Beyond this the least recently seen cluster is evicted
+UNKNOWN_BEST_SIGHTINGS = 3           # Sharpest crops (with their encodings) kept per cluster
+UNKNOWN_PROMPT_SIGHTINGS = 3         # Sightings before a cluster asks for registration
+
+# Analytics Configuration
+ANALYTICS_DEFAULT_DAYS = 120
+ANALYTICS_CACHE_SIZE = 64
+ANALYTICS_BITMAP_LIMIT = 200_000_000  # max users x days for the dense de-duplication bitmap
+ANALYTICS_LATE_GRACE_MINUTES = 5
+ANALYTICS_LATE_BUCKETS_MINUTES = [5, 10, 15, 30, 60]  # Histogram edges; buckets start at the grace period
+
+# Event Stream Configuration
+EVENT_BUFFER_SIZE = 100          # Events buffered per client before the oldest are dropped
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_RETRY_MS = 3000            # Client reconnect delay
+EVENT_WINDOW_CHECK_SECONDS = 5   # How often the attendance window is checked for open/close
+
+# Response Cache Configuration
+RESPONSE_CACHE_SIZE = 256              # Cached (route, query) responses
+RESPONSE_CACHE_GZIP_MIN_BYTES = 1024   # Smaller bodies are not worth compressing
+
+# Bulk Enrollment Configuration
+BULK_ENROLL_BATCH_SIZE = 500                 # Users per executemany transaction
+BULK_ENROLL_STATE_DIR = 'enrollment_state'   # Progress logs used to resume interrupted runs
+BULK_ENROLL_IMPORT_ROOT = 'imports'          # /api/users/bulk only reads manifests and images under this directory
+
+# Metrics Configuration
+METRICS_LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0]  # Seconds
+
+# Frame Tracing Configuration
+TRACE_RING_SIZE = 500          # Recent frame traces kept in memory
+TRACE_SLOW_FRAME_MS = 500      # Frames slower than this (capture to done) are kept with a thumbnail
+TRACE_SLOW_FRAMES_KEPT = 50
+TRACE_THUMB_WIDTH = 160
+
+# Runtime State (status, last recognition and registration prompts)
+RUNTIME_STATE_SHARED_PATH = None     # Memory-mapped file shared by worker processes, e.g. '/dev/shm/face_attendance_state'
+RUNTIME_STATE_SHARED_BYTES = 65536   # Size of the shared state file
+
 # File Paths
 FACE_IMAGES_DIR = 'face_images'
 STATIC_DIR = 'static'
 TEMPLATES_DIR = 'templates'
 
+# Face Image Store
+FACE_IMAGE_FORMAT = 'jpg'        # 'jpg' or 'webp'
+FACE_IMAGE_QUALITY = 90
+FACE_THUMB_SIZE = 96             # Longest thumbnail side in pixels
+FACE_THUMB_QUALITY = 80
+FACE_CROP_PADDING = 0.25         # Padding around the face as a fraction of its size
+FACE_IMAGE_QUEUE_SIZE = 64
+FACE_IMAGE_CACHE_SECONDS = 31536000  # Stored images are content-addressed, so never change
+
 # Create directories if they don't exist
 os.makedirs(FACE_IMAGES_DIR, exist_ok=True)
\ No newline at end of file
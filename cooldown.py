@@ -0,0 +1,136 @@
+import threading
+import time
+
+import metrics
+from config import RECOGNITION_COOLDOWN_SECONDS, RECOGNITION_COOLDOWN_TICK_SECONDS
+
+events_admitted = metrics.counter('recognition_events_admitted_total',
+                                  'Recognition events passed on to the attendance layer')
+events_suppressed = metrics.counter('recognition_events_suppressed_total',
+                                    'Repeat recognition events absorbed by the cooldown')
+
+
+class TimingWheel:
+    """Hierarchical timing wheel: O(1) scheduling, expiry work proportional to elapsed ticks and fired items
+
+    Level 0 has one slot per tick; each slot of a higher level covers a full turn of the level
+    below and is redistributed downwards when that turn comes round.
+    """
+
+    def __init__(self, tick_seconds=1.0, slots=64, levels=3, start=0.0):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current = int(start / tick_seconds)  # Absolute tick
+
+    def schedule(self, item, expires):
+        """Fire item once the clock passes expires (same time base as advance)"""
+        self._place(item, max(int(-(-expires // self.tick_seconds)), self.current + 1))
+
+    def _place(self, item, tick):
+        delta = tick - self.current
+        for level in range(self.levels):
+            if delta < self.slots ** (level + 1) or level == self.levels - 1:
+                self.wheels[level][(tick // self.slots ** level) % self.slots].append((tick, item))
+                return
+
+    def advance(self, now):
+        """Move the clock to now, returns the items that expired"""
+        target = int(now // self.tick_seconds)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            # Higher levels first, so their items can land in a lower slot cascaded on this tick
+            for level in range(self.levels - 1, 0, -1):
+                span = self.slots ** level
+                if self.current % span == 0:
+                    slot = (self.current // span) % self.slots
+                    entries, self.wheels[level][slot] = self.wheels[level][slot], []
+                    for tick, item in entries:
+                        self._place(item, tick)
+
+            slot = self.current % self.slots
+            entries, self.wheels[0][slot] = self.wheels[0][slot], []
+            for tick, item in entries:
+                if tick <= self.current:
+                    expired.append(item)
+                else:
+                    self._place(item, tick)
+        return expired
+
+
+class _Cooldown:
+    __slots__ = ('key', 'result', 'suppressed')
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.suppressed = 0
+
+
+class CooldownScheduler:
+    """Lets the first recognition event per identity and schedule through, absorbs repeats for a window"""
+
+    def __init__(self, window=RECOGNITION_COOLDOWN_SECONDS, tick_seconds=RECOGNITION_COOLDOWN_TICK_SECONDS,
+                 clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.wheel = TimingWheel(tick_seconds, start=clock())
+        self.active = {}  # (identity, schedule) -> _Cooldown
+        self.lock = threading.Lock()
+        metrics.REGISTRY.register_collector(lambda: {
+            'recognition_cooldown_active': ('Identities currently in their cooldown window', len(self.active))
+        })
+
+    def _expire(self, now):
+        for cooldown in self.wheel.advance(now):
+            # Released and re-admitted keys have a newer entry, leave it alone
+            if self.active.get(cooldown.key) is cooldown:
+                del self.active[cooldown.key]
+
+    def admit(self, identity, schedule=None):
+        """True for the first event of identity/schedule in the window, False for a repeat"""
+        key = (identity, schedule)
+        now = self.clock()
+        with self.lock:
+            self._expire(now)
+            cooldown = self.active.get(key)
+            if cooldown is not None:
+                cooldown.suppressed += 1
+                events_suppressed.inc()
+                return False
+            cooldown = self.active[key] = _Cooldown(key)
+            self.wheel.schedule(cooldown, now + self.window)
+        events_admitted.inc()
+        return True
+
+    def record(self, identity, schedule, result):
+        """Remember the outcome of the admitted event, returned for repeats by last_result"""
+        cooldown = self.active.get((identity, schedule))
+        if cooldown is not None:
+            cooldown.result = result
+
+    def last_result(self, identity, schedule=None):
+        cooldown = self.active.get((identity, schedule))
+        return cooldown.result if cooldown is not None else None
+
+    def release(self, identity, schedule=None):
+        """End the window early so the next event is admitted, e.g. after a failed write"""
+        with self.lock:
+            self.active.pop((identity, schedule), None)
+
+    def stats(self, top=10):
+        with self.lock:
+            self._expire(self.clock())
+            cooldowns = list(self.active.values())
+        busiest = sorted(cooldowns, key=lambda cooldown: cooldown.suppressed, reverse=True)[:top]
+        return {
+            'window_seconds': self.window,
+            'active': len(cooldowns),
+            'admitted_total': events_admitted.value,
+            'suppressed_total': events_suppressed.value,
+            'most_suppressed': [{'identity': cooldown.key[0], 'schedule': cooldown.key[1],
+                                 'suppressed': cooldown.suppressed}
+                                for cooldown in busiest if cooldown.suppressed]
+        }
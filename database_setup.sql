@@ -35,6 +35,17 @@ CREATE TABLE IF NOT EXISTS attendance (
     INDEX idx_student_date (student_id, date)
 );
 
+-- Create face_samples table (several compact float32 encodings per student)
+CREATE TABLE IF NOT EXISTS face_samples (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    student_id VARCHAR(50) NOT NULL,
+    encoding VARBINARY(512) NOT NULL,
+    source ENUM('enrollment', 'recognition', 'compacted') DEFAULT 'enrollment',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (student_id) REFERENCES students(student_id) ON DELETE CASCADE,
+    INDEX idx_face_samples_student (student_id)
+);
+
 -- Create attendance_settings table
 CREATE TABLE IF NOT EXISTS attendance_settings (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -52,4 +63,5 @@ ON DUPLICATE KEY UPDATE start_time = start_time;
 SHOW TABLES;
 DESCRIBE students;
 DESCRIBE attendance;
+DESCRIBE face_samples;
 DESCRIBE attendance_settings;
\ No newline at end of file
@@ -1,14 +1,31 @@
 import mysql.connector
 from mysql.connector import Error
 import config
+import metrics
+from attendance_archive import AttendanceArchive
 from datetime import datetime, date
 
+# Columns that may be requested through the listing APIs
+STUDENT_FIELDS = ['id', 'name', 'student_id', 'class', 'department', 'roll_no',
+                  'face_image_path', 'status', 'created_at', 'face_encoding']
+# Default projection: everything except the (large) face encoding
+STUDENT_DEFAULT_FIELDS = [field for field in STUDENT_FIELDS if field != 'face_encoding']
+
+def select_columns(fields, allowed, default):
+    """Build a column list from requested fields, ignoring unknown names"""
+    columns = [field for field in (fields or default) if field in allowed]
+    return ', '.join(f"`{column}`" for column in (columns or default))
+
+connect_failures = metrics.counter('db_connect_failures_total', 'Failed MySQL connection attempts')
+
 class DatabaseManager:
     def __init__(self):
         self.connection = None
+        self.archive = AttendanceArchive(self, 'attendance') if config.ATTENDANCE_PARTITIONING else None
         self.connect()
         self.create_tables()
     
+    @metrics.timed_query
     def connect(self):
         try:
             if self.connection and self.connection.is_connected():
@@ -18,8 +35,10 @@ class DatabaseManager:
                 print("Connected to MySQL database")
         except Error as e:
             print(f"Error connecting to MySQL: {e}")
+            connect_failures.inc()
             self.connection = None
     
+    @metrics.timed_query
     def create_database(self):
         """Create database if it doesn't exist"""
         try:
@@ -33,6 +52,7 @@ class DatabaseManager:
         except Error as e:
             print(f"Error creating database: {e}")
     
+    @metrics.timed_query
     def create_tables(self):
         """Create all required tables"""
         tables = {
@@ -62,6 +82,17 @@ class DatabaseManager:
                     UNIQUE KEY unique_attendance (student_id, date)
                 )
             """,
+            'face_samples': """
+                CREATE TABLE IF NOT EXISTS face_samples (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    student_id VARCHAR(50) NOT NULL,
+                    encoding VARBINARY(512) NOT NULL,
+                    source ENUM('enrollment', 'recognition', 'compacted') DEFAULT 'enrollment',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (student_id) REFERENCES students(student_id) ON DELETE CASCADE,
+                    INDEX idx_face_samples_student (student_id)
+                )
+            """,
             'attendance_settings': """
                 CREATE TABLE IF NOT EXISTS attendance_settings (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -91,6 +122,7 @@ class DatabaseManager:
         except Error as e:
             print(f"Error creating tables: {e}")
     
+    @metrics.timed_query
     def add_student(self, name, student_id, class_name, department, roll_no, face_image_path, face_encoding):
         """Add new student to database"""
         try:
@@ -107,11 +139,13 @@ class DatabaseManager:
             print(f"Error adding student: {e}")
             return False
     
-    def get_approved_students(self):
-        """Get all approved students with face encodings"""
+    @metrics.timed_query
+    def get_approved_students(self, fields=None):
+        """Get all approved students with face encodings (lightweight columns unless fields are given)"""
         try:
             cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM students WHERE status = 'approved' AND face_encoding IS NOT NULL")
+            columns = select_columns(fields, STUDENT_FIELDS, STUDENT_DEFAULT_FIELDS)
+            cursor.execute(f"SELECT {columns} FROM students WHERE status = 'approved' AND face_encoding IS NOT NULL")
             students = cursor.fetchall()
             cursor.close()
             return students
@@ -119,11 +153,86 @@ class DatabaseManager:
             print(f"Error fetching students: {e}")
             return []
     
-    def get_student_by_id(self, student_id):
+    @metrics.timed_query
+    def get_face_encodings(self):
+        """Get (student_id, face_encoding) for all approved students"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT student_id, face_encoding FROM students WHERE status = 'approved' AND face_encoding IS NOT NULL")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching face encodings: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_face_samples(self):
+        """Get (student_id, encoding) rows for approved students, one per stored sample
+        
+        Students without samples fall back to their single face_encoding column
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT f.student_id, f.encoding FROM face_samples f
+                JOIN students s ON s.student_id = f.student_id
+                WHERE s.status = 'approved'
+            """)
+            rows = cursor.fetchall()
+            cursor.execute("""
+                SELECT student_id, face_encoding FROM students s
+                WHERE status = 'approved' AND face_encoding IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM face_samples f WHERE f.student_id = s.student_id)
+            """)
+            rows.extend(cursor.fetchall())
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching face samples: {e}")
+            return []
+    
+    @metrics.timed_query
+    def add_face_samples(self, student_id, encodings, source='enrollment'):
+        """Store packed (float32 bytes) encodings as extra samples for a student"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.executemany(
+                "INSERT INTO face_samples (student_id, encoding, source) VALUES (%s, %s, %s)",
+                [(student_id, encoding, source) for encoding in encodings]
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error adding face samples: {e}")
+            return False
+    
+    @metrics.timed_query
+    def replace_face_samples(self, student_id, encodings, source='compacted'):
+        """Replace all of a student's samples in one transaction"""
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM face_samples WHERE student_id = %s", (student_id,))
+            cursor.executemany(
+                "INSERT INTO face_samples (student_id, encoding, source) VALUES (%s, %s, %s)",
+                [(student_id, encoding, source) for encoding in encodings]
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error replacing face samples: {e}")
+            self.connection.rollback()
+            return False
+    
+    @metrics.timed_query
+    def get_student_by_id(self, student_id, fields=None):
         """Get student by student_id"""
         try:
             cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM students WHERE student_id = %s", (student_id,))
+            columns = select_columns(fields, STUDENT_FIELDS, STUDENT_DEFAULT_FIELDS)
+            cursor.execute(f"SELECT {columns} FROM students WHERE student_id = %s", (student_id,))
             student = cursor.fetchone()
             cursor.close()
             return student
@@ -131,19 +240,19 @@ class DatabaseManager:
             print(f"Error fetching student: {e}")
             return None
     
-    def mark_attendance(self, student_id):
-        """Mark attendance for student"""
+    @metrics.timed_query
+    def mark_attendance(self, student_id, at=None):
+        """Mark attendance for student (now, or at the given datetime)"""
         try:
             cursor = self.connection.cursor()
-            today = date.today()
-            current_time = datetime.now().time()
+            at = at or datetime.now()
             
             query = """
                 INSERT INTO attendance (student_id, date, time)
                 VALUES (%s, %s, %s)
                 ON DUPLICATE KEY UPDATE time = VALUES(time)
             """
-            cursor.execute(query, (student_id, today, current_time))
+            cursor.execute(query, (student_id, at.date(), at.time()))
             self.connection.commit()
             cursor.close()
             return True
@@ -151,12 +260,13 @@ class DatabaseManager:
             print(f"Error marking attendance: {e}")
             return False
     
-    def check_attendance_today(self, student_id):
-        """Check if student already marked attendance today"""
+    @metrics.timed_query
+    def check_attendance_today(self, student_id, day=None):
+        """Check if student already marked attendance today (or on the given date)"""
         try:
             cursor = self.connection.cursor()
-            today = date.today()
-            cursor.execute("SELECT COUNT(*) FROM attendance WHERE student_id = %s AND date = %s", (student_id, today))
+            day = day or date.today()
+            cursor.execute("SELECT COUNT(*) FROM attendance WHERE student_id = %s AND date = %s", (student_id, day))
             count = cursor.fetchone()[0]
             cursor.close()
             return count > 0
@@ -164,6 +274,7 @@ class DatabaseManager:
             print(f"Error checking attendance: {e}")
             return False
     
+    @metrics.timed_query
     def get_attendance_settings(self):
         """Get current attendance time settings"""
         try:
@@ -179,6 +290,7 @@ class DatabaseManager:
             print(f"Error fetching attendance settings: {e}")
             return None
     
+    @metrics.timed_query
     def update_attendance_settings(self, start_time, end_time):
         """Update attendance time settings"""
         try:
@@ -191,6 +303,7 @@ class DatabaseManager:
             print(f"Error updating attendance settings: {e}")
             return False
     
+    @metrics.timed_query
     def get_attendance_records(self, date_filter=None):
         """Get attendance records with student details"""
         try:
@@ -214,6 +327,17 @@ class DatabaseManager:
                 cursor.execute(query)
             
             records = cursor.fetchall()
+            
+            # Months past the hot horizon live in archive files
+            archived = self.archive.read_rows(date_filter, date_filter) if self.archive else []
+            if archived:
+                cursor.execute("SELECT student_id, name, class, department, roll_no FROM students")
+                students = {student['student_id']: student for student in cursor.fetchall()}
+                for record in archived:
+                    student = students.get(record['student_id'])
+                    if student is not None:
+                        records.append(dict(record, **student))
+                records.sort(key=lambda record: (record['date'], record['time']), reverse=True)
             cursor.close()
             return records
         except Error as e:
@@ -1,15 +1,32 @@
 import mysql.connector
 from mysql.connector import Error
 import config
+import metrics
+from attendance_archive import AttendanceArchive
+from db import select_columns
+from gallery import encoding_samples
 from datetime import datetime, date, time
 import json
+import numpy as np
+
+# Columns that may be requested through the listing APIs
+USER_FIELDS = ['id', 'name', 'user_id', 'role', 'department', 'class_section', 'phone',
+               'email', 'face_image_path', 'status', 'created_at', 'updated_at', 'face_encoding']
+# Default projection: everything except the (large) face encoding
+USER_DEFAULT_FIELDS = [field for field in USER_FIELDS if field != 'face_encoding']
+
+connect_failures = metrics.counter('db_connect_failures_total', 'Failed MySQL connection attempts')
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, journal=None):
         self.connection = None
+        self.journal = journal  # journal.AttendanceJournal: marks survive database outages
+        self.archive = AttendanceArchive(self, 'attendance_records') if config.ATTENDANCE_PARTITIONING else None
+        self.attendance_version = 0  # Bumped on every attendance write
         self.connect()
         self.create_tables()
     
+    @metrics.timed_query
     def connect(self):
         try:
             if self.connection and self.connection.is_connected():
@@ -19,8 +36,10 @@ class DatabaseManager:
                 print("Connected to MySQL database")
         except Error as e:
             print(f"Error connecting to MySQL: {e}")
+            connect_failures.inc()
             self.connection = None
     
+    @metrics.timed_query
     def create_tables(self):
         """Create all required tables with enhanced schema"""
         tables = {
@@ -54,6 +73,17 @@ class DatabaseManager:
                     UNIQUE KEY unique_attendance (user_id, date, schedule_id)
                 )
             """,
+            'face_samples': """
+                CREATE TABLE IF NOT EXISTS face_samples (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    user_id VARCHAR(50) NOT NULL,
+                    encoding VARBINARY(512) NOT NULL,
+                    source ENUM('enrollment', 'recognition', 'compacted') DEFAULT 'enrollment',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+                    INDEX idx_face_samples_user (user_id)
+                )
+            """,
             'attendance_schedules': """
                 CREATE TABLE IF NOT EXISTS attendance_schedules (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -62,6 +92,8 @@ class DatabaseManager:
                     start_time TIME,
                     end_time TIME,
                     days_of_week JSON,
+                    departments JSON,
+                    class_sections JSON,
                     interval_minutes INT DEFAULT 60,
                     is_active BOOLEAN DEFAULT TRUE,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -84,6 +116,20 @@ class DatabaseManager:
                 cursor.execute(query)
                 print(f"Table {table_name} created successfully")
             
+            # Columns added after the first release, missing from tables created before them
+            added_columns = [
+                ('attendance_schedules', 'departments', 'JSON'),
+                ('attendance_schedules', 'class_sections', 'JSON')
+            ]
+            for table_name, column, definition in added_columns:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.columns
+                    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+                """, (table_name, column))
+                if not cursor.fetchone()[0]:
+                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {definition}")
+                    print(f"Column {table_name}.{column} added")
+            
             # Insert default settings
             default_settings = [
                 ('camera_always_on', 'true'),
@@ -110,6 +156,7 @@ class DatabaseManager:
             print(f"Error creating tables: {e}")
     
     # CRUD Operations for Users
+    @metrics.timed_query
     def create_user(self, name, user_id, role='student', department='', class_section='', 
                    phone='', email='', face_image_path='', face_encoding=''):
         """Create new user"""
@@ -130,12 +177,59 @@ class DatabaseManager:
             print(f"Error creating user: {e}")
             return False
     
-    def get_all_users(self):
-        """Read all users"""
+    @metrics.timed_query
+    def create_users_bulk(self, rows):
+        """Create or refresh many users in one transaction
+        
+        rows: (name, user_id, role, department, class_section, phone, email, face_image_path, face_encoding)
+        """
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            query = """
+                INSERT INTO users (name, user_id, role, department, class_section,
+                                 phone, email, face_image_path, face_encoding)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE name = VALUES(name), department = VALUES(department),
+                    class_section = VALUES(class_section), face_image_path = VALUES(face_image_path),
+                    face_encoding = VALUES(face_encoding), status = 'active'
+            """
+            changed = self._changed_encodings(cursor, {row[1]: row[8] for row in rows})
+            cursor.executemany(query, rows)
+            self._reset_face_samples(cursor, changed)
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error creating users in bulk: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    def _changed_encodings(self, cursor, encodings):
+        """The {user_id: face_encoding} entries that are new or differ from the stored column"""
+        if not encodings:
+            return {}
+        cursor.execute(f"SELECT user_id, face_encoding FROM users WHERE user_id IN ({', '.join(['%s'] * len(encodings))})",
+                       list(encodings))
+        stored = dict(cursor.fetchall())
+        return {user_id: value for user_id, value in encodings.items()
+                if user_id not in stored or stored[user_id] != value}
+    
+    def _reset_face_samples(self, cursor, encodings):
+        """Replace each user's samples with their new face_encoding, so the matcher sees the new face"""
+        cursor.executemany("DELETE FROM face_samples WHERE user_id = %s", [(user_id,) for user_id in encodings])
+        cursor.executemany("INSERT INTO face_samples (user_id, encoding, source) VALUES (%s, %s, 'enrollment')",
+                           [(user_id, sample) for user_id, value in encodings.items() for sample in encoding_samples(value)])
+    
+    @metrics.timed_query
+    def get_all_users(self, fields=None):
+        """Read all users (lightweight columns unless fields are given)"""
         try:
             self.connect()
             cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE status = 'active' ORDER BY created_at DESC")
+            columns = select_columns(fields, USER_FIELDS, USER_DEFAULT_FIELDS)
+            cursor.execute(f"SELECT {columns} FROM users WHERE status = 'active' ORDER BY created_at DESC")
             users = cursor.fetchall()
             cursor.close()
             return users
@@ -143,12 +237,14 @@ class DatabaseManager:
             print(f"Error fetching users: {e}")
             return []
     
-    def get_user_by_id(self, user_id):
+    @metrics.timed_query
+    def get_user_by_id(self, user_id, fields=None):
         """Get user by ID"""
         try:
             self.connect()
             cursor = self.connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
+            columns = select_columns(fields, USER_FIELDS, USER_DEFAULT_FIELDS)
+            cursor.execute(f"SELECT {columns} FROM users WHERE user_id = %s", (user_id,))
             user = cursor.fetchone()
             cursor.close()
             return user
@@ -156,6 +252,88 @@ class DatabaseManager:
             print(f"Error fetching user: {e}")
             return None
     
+    @metrics.timed_query
+    def get_face_encodings(self):
+        """Get (user_id, face_encoding) for all active users with an encoding"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT user_id, face_encoding FROM users
+                WHERE status = 'active' AND face_encoding IS NOT NULL AND face_encoding != ''
+            """)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching face encodings: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_face_samples(self):
+        """Get (user_id, encoding) rows for active users, one per stored sample
+        
+        Users without samples fall back to their single face_encoding column
+        """
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT f.user_id, f.encoding FROM face_samples f
+                JOIN users u ON u.user_id = f.user_id
+                WHERE u.status = 'active'
+            """)
+            rows = cursor.fetchall()
+            cursor.execute("""
+                SELECT user_id, face_encoding FROM users u
+                WHERE status = 'active' AND face_encoding IS NOT NULL AND face_encoding != ''
+                AND NOT EXISTS (SELECT 1 FROM face_samples f WHERE f.user_id = u.user_id)
+            """)
+            rows.extend(cursor.fetchall())
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching face samples: {e}")
+            return []
+    
+    @metrics.timed_query
+    def add_face_samples(self, user_id, encodings, source='enrollment'):
+        """Store packed (float32 bytes) encodings as extra samples for a user"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.executemany(
+                "INSERT INTO face_samples (user_id, encoding, source) VALUES (%s, %s, %s)",
+                [(user_id, encoding, source) for encoding in encodings]
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error adding face samples: {e}")
+            return False
+    
+    @metrics.timed_query
+    def replace_face_samples(self, user_id, encodings, source='compacted'):
+        """Replace all of a user's samples in one transaction"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM face_samples WHERE user_id = %s", (user_id,))
+            cursor.executemany(
+                "INSERT INTO face_samples (user_id, encoding, source) VALUES (%s, %s, %s)",
+                [(user_id, encoding, source) for encoding in encodings]
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error replacing face samples: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    @metrics.timed_query
     def update_user(self, user_id, **kwargs):
         """Update user details"""
         try:
@@ -177,13 +355,18 @@ class DatabaseManager:
             values.append(user_id)
             
             cursor.execute(query, values)
+            if 'face_encoding' in kwargs:
+                self._reset_face_samples(cursor, {user_id: kwargs['face_encoding']})
             self.connection.commit()
             cursor.close()
             return True
         except Error as e:
             print(f"Error updating user: {e}")
+            if self.connection:
+                self.connection.rollback()
             return False
     
+    @metrics.timed_query
     def delete_user(self, user_id):
         """Delete user (soft delete)"""
         try:
@@ -198,21 +381,26 @@ class DatabaseManager:
             return False
     
     # CRUD Operations for Schedules
+    @metrics.timed_query
     def create_schedule(self, name, schedule_type, start_time=None, end_time=None, 
-                       days_of_week=None, interval_minutes=60):
-        """Create attendance schedule"""
+                       days_of_week=None, interval_minutes=60, departments=None, class_sections=None):
+        """Create attendance schedule, optionally scoped to departments/class sections"""
         try:
             self.connect()
             cursor = self.connection.cursor()
             
             days_json = json.dumps(days_of_week) if days_of_week else None
+            departments_json = json.dumps(departments) if departments else None
+            class_sections_json = json.dumps(class_sections) if class_sections else None
             
             query = """
                 INSERT INTO attendance_schedules 
-                (name, schedule_type, start_time, end_time, days_of_week, interval_minutes)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                (name, schedule_type, start_time, end_time, days_of_week, interval_minutes,
+                 departments, class_sections)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """
-            cursor.execute(query, (name, schedule_type, start_time, end_time, days_json, interval_minutes))
+            cursor.execute(query, (name, schedule_type, start_time, end_time, days_json, interval_minutes,
+                                   departments_json, class_sections_json))
             self.connection.commit()
             schedule_id = cursor.lastrowid
             cursor.close()
@@ -221,6 +409,7 @@ class DatabaseManager:
             print(f"Error creating schedule: {e}")
             return None
     
+    @metrics.timed_query
     def get_all_schedules(self):
         """Get all schedules"""
         try:
@@ -229,10 +418,11 @@ class DatabaseManager:
             cursor.execute("SELECT * FROM attendance_schedules WHERE is_active = TRUE ORDER BY created_at DESC")
             schedules = cursor.fetchall()
             
-            # Parse JSON days_of_week
+            # Parse JSON columns
             for schedule in schedules:
-                if schedule['days_of_week']:
-                    schedule['days_of_week'] = json.loads(schedule['days_of_week'])
+                for key in ('days_of_week', 'departments', 'class_sections'):
+                    if schedule.get(key):
+                        schedule[key] = json.loads(schedule[key])
             
             cursor.close()
             return schedules
@@ -240,6 +430,7 @@ class DatabaseManager:
             print(f"Error fetching schedules: {e}")
             return []
     
+    @metrics.timed_query
     def update_schedule(self, schedule_id, **kwargs):
         """Update schedule"""
         try:
@@ -252,8 +443,8 @@ class DatabaseManager:
                 if key in ['name', 'schedule_type', 'start_time', 'end_time', 'interval_minutes', 'is_active']:
                     set_clauses.append(f"{key} = %s")
                     values.append(value)
-                elif key == 'days_of_week':
-                    set_clauses.append("days_of_week = %s")
+                elif key in ['days_of_week', 'departments', 'class_sections']:
+                    set_clauses.append(f"{key} = %s")
                     values.append(json.dumps(value) if value else None)
             
             if not set_clauses:
@@ -270,6 +461,7 @@ class DatabaseManager:
             print(f"Error updating schedule: {e}")
             return False
     
+    @metrics.timed_query
     def delete_schedule(self, schedule_id):
         """Delete schedule"""
         try:
@@ -284,13 +476,22 @@ class DatabaseManager:
             return False
     
     # Attendance Operations
+    @metrics.timed_query
     def mark_attendance(self, user_id, schedule_id=1):
-        """Mark attendance for user"""
+        """Mark attendance for user (journaled first when a journal is attached)"""
+        today = date.today()
+        current_time = datetime.now().time().replace(microsecond=0)
+        seq = None
+        if self.journal:
+            try:
+                seq = self.journal.append(user_id, today, current_time, schedule_id)
+            except OSError as e:  # Disk full, permissions: fall back to the direct write
+                print(f"Error journaling attendance for {user_id}, writing it directly: {e}")
         try:
             self.connect()
+            if self.connection is None:
+                raise Error("not connected to MySQL")
             cursor = self.connection.cursor()
-            today = date.today()
-            current_time = datetime.now().time()
             
             query = """
                 INSERT INTO attendance_records (user_id, date, time, schedule_id)
@@ -300,11 +501,19 @@ class DatabaseManager:
             cursor.execute(query, (user_id, today, current_time, schedule_id))
             self.connection.commit()
             cursor.close()
+            self.attendance_version += 1
+            if seq is not None:
+                self.journal.commit([seq])
             return True
         except Error as e:
+            if seq is not None:
+                # Durable in the journal, the replayer writes it once MySQL is back
+                print(f"Attendance for {user_id} journaled, database write failed: {e}")
+                return True
             print(f"Error marking attendance: {e}")
             return False
     
+    @metrics.timed_query
     def get_attendance_records(self, date_filter=None, user_id=None):
         """Get attendance records with filters"""
         try:
@@ -333,12 +542,28 @@ class DatabaseManager:
             
             cursor.execute(query, params)
             records = cursor.fetchall()
+            
+            # Months past the hot horizon live in archive files
+            archived = self.archive.read_rows(date_filter, date_filter, user_id) if self.archive else []
+            if archived:
+                cursor.execute("SELECT user_id, name, role, department, class_section FROM users")
+                users = {user['user_id']: user for user in cursor.fetchall()}
+                cursor.execute("SELECT id, name FROM attendance_schedules")
+                schedule_names = {schedule['id']: schedule['name'] for schedule in cursor.fetchall()}
+                for record in archived:
+                    user = users.get(record['user_id'])
+                    if user is not None:
+                        records.append(dict(record, name=user['name'], role=user['role'],
+                                            department=user['department'], class_section=user['class_section'],
+                                            schedule_name=schedule_names.get(record['schedule_id'])))
+                records.sort(key=lambda record: (record['date'], record['time']), reverse=True)
             cursor.close()
             return records
         except Error as e:
             print(f"Error fetching attendance records: {e}")
             return []
     
+    @metrics.timed_query
     def delete_attendance_record(self, record_id):
         """Delete attendance record"""
         try:
@@ -346,13 +571,258 @@ class DatabaseManager:
             cursor = self.connection.cursor()
             cursor.execute("DELETE FROM attendance_records WHERE id = %s", (record_id,))
             self.connection.commit()
+            if not cursor.rowcount and self.archive is not None:
+                self.archive.delete_ids([record_id])
             cursor.close()
+            self.attendance_version += 1
             return True
         except Error as e:
             print(f"Error deleting attendance record: {e}")
             return False
     
+    # Analytics Queries
+    @metrics.timed_query
+    def get_attendance_columns(self, start_date, end_date):
+        """Get (user_id, day_number, seconds_of_day, schedule_id) tuples for a date range"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT user_id, DATEDIFF(date, %s), TIME_TO_SEC(time), COALESCE(schedule_id, -1)
+                FROM attendance_records
+                WHERE date BETWEEN %s AND %s
+            """, (start_date, start_date, end_date))
+            rows = cursor.fetchall()
+            cursor.close()
+            
+            archived = self.archive.read_columns(start_date, end_date) if self.archive else None
+            if archived is not None:
+                days = (archived['date'] - np.datetime64(str(start_date))).astype(np.int64)
+                rows += list(zip(archived['user_id'].tolist(), days.tolist(), archived['time'].tolist(),
+                                 archived['schedule_id'].tolist()))
+            return rows
+        except Error as e:
+            print(f"Error fetching attendance columns: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_analytics_roster(self):
+        """Get (user_id, department) for all active users"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT user_id, department FROM users WHERE status = 'active'")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching analytics roster: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_user_scopes(self):
+        """Get (user_id, department, class_section) for all active users"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT user_id, department, class_section FROM users WHERE status = 'active'")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching user scopes: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_schedule_start_seconds(self):
+        """Get (schedule_id, start seconds of day) for all schedules"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT id, TIME_TO_SEC(start_time) FROM attendance_schedules")
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+        except Error as e:
+            print(f"Error fetching schedule start times: {e}")
+            return []
+    
+    # Edge Sync (central side of sync_agent.SyncAgent); None means the query failed
+    @metrics.timed_query
+    def get_users_changed_since(self, updated_at, last_id, limit):
+        """Get users changed after the (updated_at, id) watermark, oldest first"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, name, user_id, role, department, class_section, phone, email,
+                       face_image_path, face_encoding, status, updated_at
+                FROM users
+                WHERE updated_at > %s OR (updated_at = %s AND id > %s)
+                ORDER BY updated_at, id
+                LIMIT %s
+            """, (updated_at, updated_at, last_id, limit))
+            users = cursor.fetchall()
+            cursor.close()
+            return users
+        except Error as e:
+            print(f"Error fetching changed users: {e}")
+            return None
+    
+    @metrics.timed_query
+    def get_schedules_changed_since(self, updated_at, last_id, limit):
+        """Get schedules changed after the (updated_at, id) watermark, oldest first"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor(dictionary=True)
+            cursor.execute("""
+                SELECT id, name, schedule_type, start_time, end_time, days_of_week, departments,
+                       class_sections, interval_minutes, is_active, updated_at
+                FROM attendance_schedules
+                WHERE updated_at > %s OR (updated_at = %s AND id > %s)
+                ORDER BY updated_at, id
+                LIMIT %s
+            """, (updated_at, updated_at, last_id, limit))
+            schedules = cursor.fetchall()
+            cursor.close()
+            return schedules
+        except Error as e:
+            print(f"Error fetching changed schedules: {e}")
+            return None
+    
+    @metrics.timed_query
+    def get_face_sample_changes(self, after_id, limit):
+        """Get (user_id, newest sample id) for users with samples stored after after_id"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT user_id, MAX(id) AS newest FROM face_samples
+                WHERE id > %s
+                GROUP BY user_id
+                ORDER BY newest
+                LIMIT %s
+            """, (after_id, limit))
+            changes = cursor.fetchall()
+            cursor.close()
+            return changes
+        except Error as e:
+            print(f"Error fetching face sample changes: {e}")
+            return None
+    
+    @metrics.timed_query
+    def get_user_face_samples(self, user_id):
+        """Get (encoding, source) for every sample stored for one user"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("SELECT encoding, source FROM face_samples WHERE user_id = %s ORDER BY id", (user_id,))
+            samples = cursor.fetchall()
+            cursor.close()
+            return samples
+        except Error as e:
+            print(f"Error fetching user face samples: {e}")
+            return None
+    
+    @metrics.timed_query
+    def set_user_face_samples(self, user_id, samples):
+        """Replace a user's samples with (encoding, source) pairs in one transaction"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            cursor.execute("DELETE FROM face_samples WHERE user_id = %s", (user_id,))
+            cursor.executemany(
+                "INSERT INTO face_samples (user_id, encoding, source) VALUES (%s, %s, %s)",
+                [(user_id, encoding, source) for encoding, source in samples]
+            )
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error storing user face samples: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    @metrics.timed_query
+    def upsert_users(self, users):
+        """Create or overwrite users uploaded by an edge node (dicts of user columns)"""
+        try:
+            self.connect()
+            cursor = self.connection.cursor()
+            # The edge pushes its samples separately; only a changed face_encoding replaces them here
+            changed = self._changed_encodings(cursor, {user['user_id']: user['face_encoding'] for user in users})
+            cursor.executemany("""
+                INSERT INTO users (name, user_id, role, department, class_section, phone, email,
+                                   face_image_path, face_encoding, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE name = VALUES(name), role = VALUES(role),
+                    department = VALUES(department), class_section = VALUES(class_section),
+                    phone = VALUES(phone), email = VALUES(email), face_image_path = VALUES(face_image_path),
+                    face_encoding = VALUES(face_encoding), status = VALUES(status)
+            """, [(user['name'], user['user_id'], user['role'], user['department'], user['class_section'],
+                   user['phone'], user['email'], user['face_image_path'], user['face_encoding'], user['status'])
+                  for user in users])
+            self._reset_face_samples(cursor, changed)
+            self.connection.commit()
+            cursor.close()
+            return True
+        except Error as e:
+            print(f"Error upserting users: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    @metrics.timed_query
+    def upsert_attendance(self, rows):
+        """Store attendance from an edge node or the journal, rows: (user_id, date, time, status, schedule_id)
+
+        Idempotent on (user_id, date, schedule_id) and order-independent: the later time wins
+        """
+        try:
+            self.connect()
+            if self.connection is None:
+                raise Error("not connected to MySQL")
+            cursor = self.connection.cursor()
+            cursor.executemany("""
+                INSERT INTO attendance_records (user_id, date, time, status, schedule_id)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE time = GREATEST(time, VALUES(time)), status = VALUES(status)
+            """, rows)
+            self.connection.commit()
+            cursor.close()
+            self.attendance_version += 1
+            return True
+        except Error as e:
+            print(f"Error upserting attendance: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
+    @metrics.timed_query
+    def delete_attendance_entries(self, keys):
+        """Delete attendance by (user_id, date, schedule_id), for records removed on an edge node"""
+        try:
+            self.connect()
+            if self.connection is None:
+                raise Error("not connected to MySQL")
+            cursor = self.connection.cursor()
+            cursor.executemany(
+                "DELETE FROM attendance_records WHERE user_id = %s AND date = %s AND schedule_id <=> %s",
+                keys
+            )
+            self.connection.commit()
+            cursor.close()
+            self.attendance_version += 1
+            return True
+        except Error as e:
+            print(f"Error deleting attendance entries: {e}")
+            if self.connection:
+                self.connection.rollback()
+            return False
+    
     # System Settings
+    @metrics.timed_query
     def get_setting(self, key):
         """Get system setting"""
         try:
@@ -366,6 +836,7 @@ class DatabaseManager:
             print(f"Error getting setting: {e}")
             return None
     
+    @metrics.timed_query
     def update_setting(self, key, value):
         """Update system setting"""
         try:
@@ -387,4 +858,15 @@ class DatabaseManager:
         """Close database connection"""
         if self.connection and self.connection.is_connected():
             self.connection.close()
-            print("MySQL connection closed")
\ No newline at end of file
+            print("MySQL connection closed")
+
+
+def open_database(journal=None):
+    """Database manager for the configured DB_BACKEND ('mysql' or 'sqlite')
+
+    The journal only applies to MySQL; SQLite marks are already local and durable
+    """
+    if config.DB_BACKEND == 'sqlite':
+        from db_sqlite import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(config.SQLITE_PATH)
+    return DatabaseManager(journal=journal)
\ No newline at end of file
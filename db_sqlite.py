@@ -0,0 +1,745 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime, date, time
+
+import config
+import metrics
+from db import select_columns
+from db_enhanced import USER_FIELDS, USER_DEFAULT_FIELDS
+from gallery import encoding_samples
+
+# Columns copied between the kiosk and the central database
+USER_SYNC_FIELDS = ['name', 'user_id', 'role', 'department', 'class_section', 'phone', 'email',
+                    'face_image_path', 'face_encoding', 'status']
+SCHEDULE_SYNC_FIELDS = ['id', 'name', 'schedule_type', 'start_time', 'end_time', 'days_of_week',
+                        'departments', 'class_sections', 'interval_minutes', 'is_active']
+
+
+def _time_text(value):
+    """TIME column value (time, timedelta from MySQL or text) as HH:MM:SS"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, time):
+        return value.strftime('%H:%M:%S')
+    seconds = int(value.total_seconds())
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class SQLiteDatabaseManager:
+    """Embedded database for edge kiosks, same interface as db_enhanced.DatabaseManager
+    
+    Rows changed locally are flagged unsynced until sync_agent.SyncAgent has uploaded them
+    """
+    
+    def __init__(self, path=None):
+        self.path = path or config.SQLITE_PATH
+        self.connection = None
+        self.lock = threading.RLock()  # One connection shared by the request and recognition threads
+        self.attendance_version = 0  # Bumped on every attendance write
+        self.archive = None  # Partitioning and archiving are MySQL-only, edge databases stay small
+        self.connect()
+        self.create_tables()
+    
+    @metrics.timed_query
+    def connect(self):
+        if self.connection is not None:
+            return
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        # WAL: readers don't block the writer; NORMAL sync is durable across app crashes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        print(f"Opened SQLite database {self.path}")
+    
+    @metrics.timed_query
+    def create_tables(self):
+        """Create all required tables, mirroring the central schema plus sync bookkeeping"""
+        tables = {
+            'users': """
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    user_id TEXT UNIQUE NOT NULL,
+                    role TEXT DEFAULT 'student',
+                    department TEXT,
+                    class_section TEXT,
+                    phone TEXT,
+                    email TEXT,
+                    face_image_path TEXT,
+                    face_encoding TEXT,
+                    status TEXT DEFAULT 'active',
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    synced INTEGER DEFAULT 0
+                )
+            """,
+            'attendance_records': """
+                CREATE TABLE IF NOT EXISTS attendance_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    status TEXT DEFAULT 'Present',
+                    schedule_id INTEGER,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    synced INTEGER DEFAULT 0,
+                    UNIQUE (user_id, date, schedule_id)
+                )
+            """,
+            'attendance_deletions': """
+                CREATE TABLE IF NOT EXISTS attendance_deletions (
+                    user_id TEXT,
+                    date TEXT NOT NULL,
+                    schedule_id INTEGER
+                )
+            """,
+            'face_samples': """
+                CREATE TABLE IF NOT EXISTS face_samples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    encoding BLOB NOT NULL,
+                    source TEXT DEFAULT 'enrollment',
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+            'face_sample_changes': """
+                CREATE TABLE IF NOT EXISTS face_sample_changes (
+                    user_id TEXT PRIMARY KEY
+                )
+            """,
+            'attendance_schedules': """
+                CREATE TABLE IF NOT EXISTS attendance_schedules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    schedule_type TEXT NOT NULL,
+                    start_time TEXT,
+                    end_time TEXT,
+                    days_of_week TEXT,
+                    departments TEXT,
+                    class_sections TEXT,
+                    interval_minutes INTEGER DEFAULT 60,
+                    is_active INTEGER DEFAULT 1,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+            'system_settings': """
+                CREATE TABLE IF NOT EXISTS system_settings (
+                    setting_key TEXT PRIMARY KEY,
+                    setting_value TEXT,
+                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            """,
+            'sync_state': """
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    state_key TEXT PRIMARY KEY,
+                    state_value TEXT
+                )
+            """
+        }
+        
+        try:
+            with self.lock, self.connection:
+                for query in tables.values():
+                    self.connection.execute(query)
+                self.connection.execute("CREATE INDEX IF NOT EXISTS idx_face_samples_user ON face_samples (user_id)")
+                self.connection.execute("CREATE INDEX IF NOT EXISTS idx_attendance_unsynced ON attendance_records (synced)")
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO system_settings (setting_key, setting_value) VALUES (?, ?)",
+                    [('camera_always_on', 'true'), ('capture_mode', 'continuous'), ('default_schedule_id', '1')]
+                )
+                self.connection.execute("""
+                    INSERT OR IGNORE INTO attendance_schedules
+                    (id, name, schedule_type, start_time, end_time, days_of_week)
+                    VALUES (1, 'Daily Attendance', 'fixed', '09:00:00', '17:00:00', '["1","2","3","4","5"]')
+                """)
+        except sqlite3.Error as e:
+            print(f"Error creating tables: {e}")
+    
+    def _fetchall(self, query, params=()):
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+    
+    # CRUD Operations for Users
+    @metrics.timed_query
+    def create_user(self, name, user_id, role='student', department='', class_section='',
+                   phone='', email='', face_image_path='', face_encoding=''):
+        """Create new user"""
+        try:
+            with self.lock, self.connection:
+                self.connection.execute("""
+                    INSERT INTO users (name, user_id, role, department, class_section,
+                                       phone, email, face_image_path, face_encoding)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, user_id, role, department, class_section, phone, email, face_image_path, face_encoding))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating user: {e}")
+            return False
+    
+    @metrics.timed_query
+    def create_users_bulk(self, rows):
+        """Create or refresh many users in one transaction
+        
+        rows: (name, user_id, role, department, class_section, phone, email, face_image_path, face_encoding)
+        """
+        try:
+            with self.lock, self.connection:
+                changed = self._changed_encodings({row[1]: row[8] for row in rows})
+                self.connection.executemany("""
+                    INSERT INTO users (name, user_id, role, department, class_section,
+                                       phone, email, face_image_path, face_encoding)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET name = excluded.name, department = excluded.department,
+                        class_section = excluded.class_section, face_image_path = excluded.face_image_path,
+                        face_encoding = excluded.face_encoding, status = 'active',
+                        updated_at = CURRENT_TIMESTAMP, synced = 0
+                """, rows)
+                self._reset_face_samples(changed)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating users in bulk: {e}")
+            return False
+    
+    def _changed_encodings(self, encodings):
+        """The {user_id: face_encoding} entries that are new or differ from the stored column"""
+        if not encodings:
+            return {}
+        stored = dict(self.connection.execute(
+            f"SELECT user_id, face_encoding FROM users WHERE user_id IN ({', '.join('?' * len(encodings))})",
+            list(encodings)).fetchall())
+        return {user_id: value for user_id, value in encodings.items()
+                if user_id not in stored or stored[user_id] != value}
+    
+    def _reset_face_samples(self, encodings):
+        """Replace each user's samples with their new face_encoding (flagged for upload), so the matcher sees the new face"""
+        self.connection.executemany("DELETE FROM face_samples WHERE user_id = ?", [(user_id,) for user_id in encodings])
+        self.connection.executemany("INSERT INTO face_samples (user_id, encoding, source) VALUES (?, ?, 'enrollment')",
+                                    [(user_id, sample) for user_id, value in encodings.items()
+                                     for sample in encoding_samples(value)])
+        self.connection.executemany("INSERT OR IGNORE INTO face_sample_changes (user_id) VALUES (?)",
+                                    [(user_id,) for user_id in encodings])
+    
+    @metrics.timed_query
+    def get_all_users(self, fields=None):
+        """Read all users (lightweight columns unless fields are given)"""
+        try:
+            columns = select_columns(fields, USER_FIELDS, USER_DEFAULT_FIELDS)
+            rows = self._fetchall(f"SELECT {columns} FROM users WHERE status = 'active' ORDER BY created_at DESC")
+            return [dict(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Error fetching users: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_user_by_id(self, user_id, fields=None):
+        """Get user by ID"""
+        try:
+            columns = select_columns(fields, USER_FIELDS, USER_DEFAULT_FIELDS)
+            rows = self._fetchall(f"SELECT {columns} FROM users WHERE user_id = ?", (user_id,))
+            return dict(rows[0]) if rows else None
+        except sqlite3.Error as e:
+            print(f"Error fetching user: {e}")
+            return None
+    
+    @metrics.timed_query
+    def get_face_encodings(self):
+        """Get (user_id, face_encoding) for all active users with an encoding"""
+        try:
+            return [tuple(row) for row in self._fetchall("""
+                SELECT user_id, face_encoding FROM users
+                WHERE status = 'active' AND face_encoding IS NOT NULL AND face_encoding != ''
+            """)]
+        except sqlite3.Error as e:
+            print(f"Error fetching face encodings: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_face_samples(self):
+        """Get (user_id, encoding) rows for active users, one per stored sample
+        
+        Users without samples fall back to their single face_encoding column
+        """
+        try:
+            rows = self._fetchall("""
+                SELECT f.user_id, f.encoding FROM face_samples f
+                JOIN users u ON u.user_id = f.user_id
+                WHERE u.status = 'active'
+            """)
+            rows += self._fetchall("""
+                SELECT user_id, face_encoding FROM users u
+                WHERE status = 'active' AND face_encoding IS NOT NULL AND face_encoding != ''
+                AND NOT EXISTS (SELECT 1 FROM face_samples f WHERE f.user_id = u.user_id)
+            """)
+            return [tuple(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Error fetching face samples: {e}")
+            return []
+    
+    @metrics.timed_query
+    def add_face_samples(self, user_id, encodings, source='enrollment'):
+        """Store packed (float32 bytes) encodings as extra samples for a user"""
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany(
+                    "INSERT INTO face_samples (user_id, encoding, source) VALUES (?, ?, ?)",
+                    [(user_id, encoding, source) for encoding in encodings]
+                )
+                self.connection.execute("INSERT OR IGNORE INTO face_sample_changes (user_id) VALUES (?)", (user_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error adding face samples: {e}")
+            return False
+    
+    @metrics.timed_query
+    def replace_face_samples(self, user_id, encodings, source='compacted'):
+        """Replace all of a user's samples in one transaction"""
+        try:
+            with self.lock, self.connection:
+                self.connection.execute("DELETE FROM face_samples WHERE user_id = ?", (user_id,))
+                self.connection.executemany(
+                    "INSERT INTO face_samples (user_id, encoding, source) VALUES (?, ?, ?)",
+                    [(user_id, encoding, source) for encoding in encodings]
+                )
+                self.connection.execute("INSERT OR IGNORE INTO face_sample_changes (user_id) VALUES (?)", (user_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error replacing face samples: {e}")
+            return False
+    
+    @metrics.timed_query
+    def update_user(self, user_id, **kwargs):
+        """Update user details"""
+        set_clauses = []
+        values = []
+        for key, value in kwargs.items():
+            if key in ['name', 'role', 'department', 'class_section', 'phone', 'email', 'face_image_path', 'face_encoding']:
+                set_clauses.append(f"{key} = ?")
+                values.append(value)
+        
+        if not set_clauses:
+            return False
+        
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    f"UPDATE users SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP, synced = 0 "
+                    "WHERE user_id = ?", values + [user_id])
+                if 'face_encoding' in kwargs:
+                    self._reset_face_samples({user_id: kwargs['face_encoding']})
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating user: {e}")
+            return False
+    
+    @metrics.timed_query
+    def delete_user(self, user_id):
+        """Delete user (soft delete)"""
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "UPDATE users SET status = 'inactive', updated_at = CURRENT_TIMESTAMP, synced = 0 WHERE user_id = ?",
+                    (user_id,))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error deleting user: {e}")
+            return False
+    
+    # CRUD Operations for Schedules (managed centrally; local changes last until the next pull touches them)
+    @metrics.timed_query
+    def create_schedule(self, name, schedule_type, start_time=None, end_time=None,
+                       days_of_week=None, interval_minutes=60, departments=None, class_sections=None):
+        """Create attendance schedule, optionally scoped to departments/class sections"""
+        try:
+            with self.lock, self.connection:
+                cursor = self.connection.execute("""
+                    INSERT INTO attendance_schedules
+                    (name, schedule_type, start_time, end_time, days_of_week, interval_minutes,
+                     departments, class_sections)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (name, schedule_type, start_time, end_time,
+                      json.dumps(days_of_week) if days_of_week else None, interval_minutes,
+                      json.dumps(departments) if departments else None,
+                      json.dumps(class_sections) if class_sections else None))
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"Error creating schedule: {e}")
+            return None
+    
+    @metrics.timed_query
+    def get_all_schedules(self):
+        """Get all schedules"""
+        try:
+            schedules = [dict(row) for row in self._fetchall(
+                "SELECT * FROM attendance_schedules WHERE is_active = 1 ORDER BY created_at DESC")]
+            
+            # Parse JSON columns
+            for schedule in schedules:
+                schedule['is_active'] = bool(schedule['is_active'])
+                for key in ('days_of_week', 'departments', 'class_sections'):
+                    if schedule.get(key):
+                        schedule[key] = json.loads(schedule[key])
+            return schedules
+        except sqlite3.Error as e:
+            print(f"Error fetching schedules: {e}")
+            return []
+    
+    @metrics.timed_query
+    def update_schedule(self, schedule_id, **kwargs):
+        """Update schedule"""
+        set_clauses = []
+        values = []
+        for key, value in kwargs.items():
+            if key in ['name', 'schedule_type', 'start_time', 'end_time', 'interval_minutes', 'is_active']:
+                set_clauses.append(f"{key} = ?")
+                values.append(value)
+            elif key in ['days_of_week', 'departments', 'class_sections']:
+                set_clauses.append(f"{key} = ?")
+                values.append(json.dumps(value) if value else None)
+        
+        if not set_clauses:
+            return False
+        
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    f"UPDATE attendance_schedules SET {', '.join(set_clauses)}, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ?", values + [schedule_id])
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating schedule: {e}")
+            return False
+    
+    @metrics.timed_query
+    def delete_schedule(self, schedule_id):
+        """Delete schedule"""
+        return self.update_schedule(schedule_id, is_active=0)
+    
+    # Attendance Operations
+    @metrics.timed_query
+    def mark_attendance(self, user_id, schedule_id=1):
+        """Mark attendance for user"""
+        try:
+            with self.lock, self.connection:
+                self.connection.execute("""
+                    INSERT INTO attendance_records (user_id, date, time, schedule_id)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (user_id, date, schedule_id) DO UPDATE SET time = excluded.time, synced = 0
+                """, (user_id, date.today().isoformat(), datetime.now().strftime('%H:%M:%S'), schedule_id))
+            self.attendance_version += 1
+            return True
+        except sqlite3.Error as e:
+            print(f"Error marking attendance: {e}")
+            return False
+    
+    @metrics.timed_query
+    def upsert_attendance(self, rows):
+        """Store many marks in one transaction, rows: (user_id, date, time, status, schedule_id)
+
+        Idempotent on (user_id, date, schedule_id) and order-independent: the later time wins
+        """
+        try:
+            with self.lock, self.connection:
+                self.connection.executemany("""
+                    INSERT INTO attendance_records (user_id, date, time, status, schedule_id)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, date, schedule_id) DO UPDATE SET
+                        time = MAX(time, excluded.time), status = excluded.status, synced = 0
+                """, [(user_id, str(day), str(at), status, schedule_id) for user_id, day, at, status, schedule_id in rows])
+            self.attendance_version += 1
+            return True
+        except sqlite3.Error as e:
+            print(f"Error upserting attendance: {e}")
+            return False
+
+    @metrics.timed_query
+    def get_attendance_records(self, date_filter=None, user_id=None):
+        """Get attendance records with filters"""
+        query = """
+            SELECT ar.id, ar.user_id, ar.date, ar.time, ar.status, ar.schedule_id, ar.created_at,
+                   u.name, u.role, u.department, u.class_section, s.name as schedule_name
+            FROM attendance_records ar
+            JOIN users u ON ar.user_id = u.user_id
+            LEFT JOIN attendance_schedules s ON ar.schedule_id = s.id
+            WHERE 1=1
+        """
+        params = []
+        
+        if date_filter:
+            query += " AND ar.date = ?"
+            params.append(str(date_filter))
+        
+        if user_id:
+            query += " AND ar.user_id = ?"
+            params.append(user_id)
+        
+        query += " ORDER BY ar.date DESC, ar.time DESC"
+        
+        try:
+            records = [dict(row) for row in self._fetchall(query, params)]
+            # Same types as the MySQL driver returns for DATE and TIME columns
+            for record in records:
+                record['date'] = date.fromisoformat(record['date'])
+                record['time'] = time.fromisoformat(record['time'])
+            return records
+        except sqlite3.Error as e:
+            print(f"Error fetching attendance records: {e}")
+            return []
+    
+    @metrics.timed_query
+    def delete_attendance_record(self, record_id):
+        """Delete attendance record"""
+        try:
+            with self.lock, self.connection:
+                row = self.connection.execute(
+                    "SELECT user_id, date, schedule_id, synced FROM attendance_records WHERE id = ?",
+                    (record_id,)).fetchone()
+                if row is None:
+                    return True
+                # Records already uploaded must also be removed centrally
+                if row['synced']:
+                    self.connection.execute(
+                        "INSERT INTO attendance_deletions (user_id, date, schedule_id) VALUES (?, ?, ?)",
+                        (row['user_id'], row['date'], row['schedule_id']))
+                self.connection.execute("DELETE FROM attendance_records WHERE id = ?", (record_id,))
+            self.attendance_version += 1
+            return True
+        except sqlite3.Error as e:
+            print(f"Error deleting attendance record: {e}")
+            return False
+    
+    # Analytics Queries
+    @metrics.timed_query
+    def get_attendance_columns(self, start_date, end_date):
+        """Get (user_id, day_number, seconds_of_day, schedule_id) tuples for a date range"""
+        try:
+            return [tuple(row) for row in self._fetchall("""
+                SELECT user_id,
+                       CAST(julianday(date) - julianday(?) AS INTEGER),
+                       CAST(strftime('%s', '1970-01-01 ' || time) AS INTEGER),
+                       COALESCE(schedule_id, -1)
+                FROM attendance_records
+                WHERE date BETWEEN ? AND ?
+            """, (str(start_date), str(start_date), str(end_date)))]
+        except sqlite3.Error as e:
+            print(f"Error fetching attendance columns: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_analytics_roster(self):
+        """Get (user_id, department) for all active users"""
+        try:
+            return [tuple(row) for row in self._fetchall("SELECT user_id, department FROM users WHERE status = 'active'")]
+        except sqlite3.Error as e:
+            print(f"Error fetching analytics roster: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_user_scopes(self):
+        """Get (user_id, department, class_section) for all active users"""
+        try:
+            return [tuple(row) for row in self._fetchall(
+                "SELECT user_id, department, class_section FROM users WHERE status = 'active'")]
+        except sqlite3.Error as e:
+            print(f"Error fetching user scopes: {e}")
+            return []
+    
+    @metrics.timed_query
+    def get_schedule_start_seconds(self):
+        """Get (schedule_id, start seconds of day) for all schedules"""
+        try:
+            return [tuple(row) for row in self._fetchall(
+                "SELECT id, CAST(strftime('%s', '1970-01-01 ' || start_time) AS INTEGER) FROM attendance_schedules")]
+        except sqlite3.Error as e:
+            print(f"Error fetching schedule start times: {e}")
+            return []
+    
+    # System Settings
+    @metrics.timed_query
+    def get_setting(self, key):
+        """Get system setting"""
+        try:
+            rows = self._fetchall("SELECT setting_value FROM system_settings WHERE setting_key = ?", (key,))
+            return rows[0][0] if rows else None
+        except sqlite3.Error as e:
+            print(f"Error getting setting: {e}")
+            return None
+    
+    @metrics.timed_query
+    def update_setting(self, key, value):
+        """Update system setting"""
+        try:
+            with self.lock, self.connection:
+                self.connection.execute("""
+                    INSERT INTO system_settings (setting_key, setting_value) VALUES (?, ?)
+                    ON CONFLICT (setting_key) DO UPDATE SET setting_value = excluded.setting_value,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (key, value))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating setting: {e}")
+            return False
+    
+    # Sync bookkeeping (see sync_agent.py)
+    @metrics.timed_query
+    def get_sync_state(self, key, default=None):
+        rows = self._fetchall("SELECT state_value FROM sync_state WHERE state_key = ?", (key,))
+        return rows[0][0] if rows else default
+    
+    @metrics.timed_query
+    def set_sync_state(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                INSERT INTO sync_state (state_key, state_value) VALUES (?, ?)
+                ON CONFLICT (state_key) DO UPDATE SET state_value = excluded.state_value
+            """, (key, value))
+    
+    @metrics.timed_query
+    def get_unsynced_attendance(self, limit):
+        """Get (id, user_id, date, time, status, schedule_id) rows not yet uploaded"""
+        return [tuple(row) for row in self._fetchall("""
+            SELECT id, user_id, date, time, status, schedule_id FROM attendance_records
+            WHERE synced = 0 ORDER BY id LIMIT ?
+        """, (limit,))]
+    
+    @metrics.timed_query
+    def mark_attendance_synced(self, rows):
+        """Flag uploaded rows, unless they were re-marked since they were read"""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE attendance_records SET synced = 1 WHERE id = ? AND time = ?",
+                [(row[0], row[3]) for row in rows])
+    
+    @metrics.timed_query
+    def get_attendance_deletions(self, limit):
+        """Get (rowid, user_id, date, schedule_id) of uploaded records deleted locally"""
+        return [tuple(row) for row in self._fetchall(
+            "SELECT rowid, user_id, date, schedule_id FROM attendance_deletions ORDER BY rowid LIMIT ?", (limit,))]
+    
+    @metrics.timed_query
+    def clear_attendance_deletions(self, rowids):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM attendance_deletions WHERE rowid = ?",
+                                        [(rowid,) for rowid in rowids])
+    
+    @metrics.timed_query
+    def get_unsynced_users(self, limit):
+        """Get users created or changed locally, as dicts of USER_SYNC_FIELDS plus updated_at"""
+        columns = ', '.join(USER_SYNC_FIELDS)
+        return [dict(row) for row in self._fetchall(
+            f"SELECT {columns}, updated_at FROM users WHERE synced = 0 ORDER BY id LIMIT ?", (limit,))]
+    
+    @metrics.timed_query
+    def mark_users_synced(self, users):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE users SET synced = 1 WHERE user_id = ? AND updated_at = ?",
+                [(user['user_id'], user['updated_at']) for user in users])
+    
+    @metrics.timed_query
+    def get_changed_sample_users(self, limit):
+        """Get user_ids whose face samples changed locally"""
+        return [row[0] for row in self._fetchall("SELECT user_id FROM face_sample_changes LIMIT ?", (limit,))]
+    
+    @metrics.timed_query
+    def get_user_face_samples(self, user_id):
+        """Get (encoding, source) for every sample stored for one user"""
+        return [tuple(row) for row in self._fetchall(
+            "SELECT encoding, source FROM face_samples WHERE user_id = ? ORDER BY id", (user_id,))]
+    
+    @metrics.timed_query
+    def clear_sample_changes(self, user_ids):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM face_sample_changes WHERE user_id = ?",
+                                        [(user_id,) for user_id in user_ids])
+    
+    @metrics.timed_query
+    def flag_sample_changes(self, user_ids):
+        """Mark users' samples as changed again, e.g. after a failed upload"""
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO face_sample_changes (user_id) VALUES (?)",
+                                        [(user_id,) for user_id in user_ids])
+    
+    @metrics.timed_query
+    def apply_central_users(self, users):
+        """Upsert users pulled from the central database, keeping local changes not yet uploaded
+        
+        Returns how many users were inserted or changed; rows identical to the local copy are left alone
+        """
+        columns = ', '.join(USER_SYNC_FIELDS)
+        placeholders = ', '.join('?' for _ in USER_SYNC_FIELDS)
+        fields = [field for field in USER_SYNC_FIELDS if field != 'user_id']
+        updates = ', '.join(f"{field} = excluded.{field}" for field in fields)
+        differs = ' OR '.join(f"users.{field} IS NOT excluded.{field}" for field in fields)
+        with self.lock, self.connection:
+            cursor = self.connection.executemany(f"""
+                INSERT INTO users ({columns}, synced) VALUES ({placeholders}, 1)
+                ON CONFLICT (user_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+                WHERE users.synced = 1 AND ({differs})
+            """, [tuple(user[field] for field in USER_SYNC_FIELDS) for user in users])
+            return max(cursor.rowcount, 0)
+    
+    @metrics.timed_query
+    def apply_central_face_samples(self, user_id, encodings):
+        """Replace a user's samples with the central set, unless they changed locally"""
+        with self.lock, self.connection:
+            if self.connection.execute("SELECT 1 FROM face_sample_changes WHERE user_id = ?", (user_id,)).fetchone():
+                return False
+            self.connection.execute("DELETE FROM face_samples WHERE user_id = ?", (user_id,))
+            self.connection.executemany(
+                "INSERT INTO face_samples (user_id, encoding, source) VALUES (?, ?, ?)",
+                [(user_id, bytes(encoding), source) for encoding, source in encodings])
+        return True
+    
+    @metrics.timed_query
+    def apply_central_schedules(self, schedules):
+        """Upsert schedules pulled from the central database (central wins), returns how many changed"""
+        rows = []
+        for schedule in schedules:
+            row = []
+            for field in SCHEDULE_SYNC_FIELDS:
+                value = schedule.get(field)
+                if field in ('start_time', 'end_time'):
+                    value = _time_text(value)
+                elif field in ('days_of_week', 'departments', 'class_sections') and isinstance(value, (list, dict)):
+                    value = json.dumps(value)
+                elif field == 'is_active':
+                    value = int(bool(value))
+                row.append(value)
+            rows.append(tuple(row))
+        
+        columns = ', '.join(SCHEDULE_SYNC_FIELDS)
+        placeholders = ', '.join('?' for _ in SCHEDULE_SYNC_FIELDS)
+        fields = [field for field in SCHEDULE_SYNC_FIELDS if field != 'id']
+        updates = ', '.join(f"{field} = excluded.{field}" for field in fields)
+        differs = ' OR '.join(f"attendance_schedules.{field} IS NOT excluded.{field}" for field in fields)
+        with self.lock, self.connection:
+            cursor = self.connection.executemany(f"""
+                INSERT INTO attendance_schedules ({columns}) VALUES ({placeholders})
+                ON CONFLICT (id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+                WHERE {differs}
+            """, rows)
+            return max(cursor.rowcount, 0)
+    
+    @metrics.timed_query
+    def get_sync_backlog(self):
+        """Counts of local changes waiting for upload"""
+        try:
+            return {
+                'attendance': self._fetchall("SELECT COUNT(*) FROM attendance_records WHERE synced = 0")[0][0],
+                'attendance_deletions': self._fetchall("SELECT COUNT(*) FROM attendance_deletions")[0][0],
+                'users': self._fetchall("SELECT COUNT(*) FROM users WHERE synced = 0")[0][0],
+                'face_samples': self._fetchall("SELECT COUNT(*) FROM face_sample_changes")[0][0]
+            }
+        except sqlite3.Error as e:
+            print(f"Error counting sync backlog: {e}")
+            return {}
+    
+    def close(self):
+        """Close database connection"""
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            print("SQLite connection closed")
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Multi-frame enrollment
+A registration starts a background job instead of storing whatever frame the camera holds. The
+job watches the camera for ENROLL_CAPTURE_SECONDS, keeps the ENROLL_BEST_FRAMES best faces by
+quality score and encodes them. The new template is then matched against the whole gallery, so
+one person can't be registered twice under different IDs, and only then handed to a register
+callback that stores it and adds it to the live matcher. Templates that are already encoded (an
+unknown-face cluster, see unknown_faces.py) skip the capture and go straight to the check.
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import cv2
+
+import config
+import metrics
+from face_quality import FaceQualityGate
+from gallery import compact_samples
+from image_store import get_image_store
+
+FINISHED = ('completed', 'rejected', 'failed')
+
+enrollment_seconds = metrics.histogram('enrollment_seconds', 'Submit to finish time per enrollment job')
+
+
+def enrollment_jobs(result):
+    return metrics.counter('enrollment_jobs_total', 'Finished enrollment jobs by outcome', result=result)
+
+
+def frame_score(scores):
+    """Rank of a face that passed the quality gate: sharpness, larger faces breaking ties"""
+    return scores.get('sharpness', 0.0), scores['size']
+
+
+class EnrollmentJob:
+    """One person's enrollment, from capture to commit"""
+    
+    def __init__(self, job_id, details, force=False, source='camera', encodings=None, image=None):
+        self.job_id = job_id
+        self.details = details
+        self.force = force              # Register even if the face matches an existing identity
+        self.source = source            # camera, or where the pre-encoded template came from
+        self.encodings = encodings      # Pre-encoded template, skips the capture
+        self.image = image              # BGR face image stored with a pre-encoded template
+        self.status = 'queued'          # capturing, encoding, checking, then completed, rejected or failed
+        self.message = None
+        self.frames_seen = 0
+        self.faces_kept = 0
+        self.samples = 0
+        self.similar = []               # Existing identities the template matched, closest first
+        self.created_at = time.time()
+        self.finished_at = None
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'user_id': self.details.get('user_id'),
+            'source': self.source,
+            'status': self.status,
+            'message': self.message,
+            'frames_seen': self.frames_seen,
+            'faces_kept': self.faces_kept,
+            'samples': self.samples,
+            'similar': self.similar,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class EnrollmentPipeline:
+    """Background worker running enrollment jobs one at a time, as they share the camera
+    
+    detect(frame) -> face locations (top, right, bottom, left) in a BGR frame
+    encode(frame, locations) -> 128-d encodings
+    match(encodings) -> (identity or None, distance) per encoding, against the whole gallery
+    register(details, samples, image_path) -> True once the user is stored and matchable
+    on_update(job) is called on every status change, e.g. to push it to event stream clients
+    """
+    
+    def __init__(self, camera, detect, encode, match, register, on_update=None, quality_gate=None,
+                 capture_seconds=config.ENROLL_CAPTURE_SECONDS, best_frames=config.ENROLL_BEST_FRAMES,
+                 min_frames=config.ENROLL_MIN_FRAMES, frame_interval=config.ENROLL_FRAME_INTERVAL_SECONDS):
+        self.camera = camera
+        self.detect = detect
+        self.encode = encode
+        self.match = match
+        self.register = register
+        self.on_update = on_update
+        # Pose needs dlib landmarks; sharpness, size and exposure are enough to rank frames
+        self.quality_gate = quality_gate or FaceQualityGate(use_landmarks=False)
+        self.capture_seconds = capture_seconds
+        self.best_frames = best_frames
+        self.min_frames = min_frames
+        self.frame_interval = frame_interval
+        self.jobs = {}  # job_id -> job, oldest first
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.thread = None
+    
+    def submit(self, details, force=False, source='camera', encodings=None, image=None):
+        """Queue an enrollment, returns the job straight away
+        
+        encodings/image: an already encoded template and its face image, enrolled without the camera
+        """
+        job = EnrollmentJob(f"enroll-{int(time.time() * 1000)}-{next(self.ids)}", details, force, source,
+                            encodings, image)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            finished = [job_id for job_id, old in self.jobs.items() if old.status in FINISHED]
+            for job_id in finished[:max(0, len(self.jobs) - config.ENROLL_JOBS_KEPT)]:
+                del self.jobs[job_id]
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='enrollment', daemon=True)
+                self.thread.start()
+        self.queue.put(job)
+        self._update(job)
+        return job
+    
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+    
+    def recent(self):
+        """All kept jobs, newest first"""
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+    
+    def _update(self, job, status=None, message=None):
+        if status is not None:
+            job.status = status
+        if message is not None:
+            job.message = message
+        if status in FINISHED:
+            job.finished_at = time.time()
+            enrollment_jobs(status).inc()
+            enrollment_seconds.observe(job.finished_at - job.created_at)
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Error publishing enrollment {job.job_id}: {e}")
+    
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self.process(job)
+            except Exception as e:
+                print(f"Error in enrollment {job.job_id}: {e}")
+                self._update(job, 'failed', str(e))
+    
+    def capture(self, job):
+        """(score, seq, frame, location) of the best faces seen in the capture window, best first"""
+        best = []  # Min-heap, the weakest kept face is replaced first
+        seq = itertools.count()
+        deadline = time.monotonic() + self.capture_seconds
+        while time.monotonic() < deadline:
+            frame = self.camera.get_frame()
+            if frame is not None:
+                job.frames_seen += 1
+                locations = self.detect(frame)
+                # A second person in view would make the template ambiguous
+                if len(locations) == 1:
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    reason, scores = self.quality_gate.score(rgb_frame, locations[0])
+                    if reason is None:
+                        entry = (frame_score(scores), next(seq), frame, tuple(locations[0]))
+                        if len(best) < self.best_frames:
+                            heapq.heappush(best, entry)
+                        else:
+                            heapq.heappushpop(best, entry)
+                        job.faces_kept = len(best)
+            time.sleep(self.frame_interval)
+        return sorted(best, key=lambda entry: entry[:2], reverse=True)
+    
+    def collect(self, job):
+        """(encodings, frame, location) of the best face frames, None if too few were usable"""
+        self._update(job, 'capturing')
+        best = self.capture(job)
+        if len(best) < self.min_frames:
+            self._update(job, 'failed', f"Only {len(best)} usable face frames in {self.capture_seconds:g}s, "
+                                        f"face the camera alone and try again")
+            return None
+        
+        self._update(job, 'encoding')
+        encodings = []
+        for _, _, frame, location in best:
+            encodings.extend(self.encode(frame, [location]))
+        _, _, frame, location = best[0]
+        return encodings, frame, location
+    
+    def process(self, job):
+        if job.encodings is not None:
+            encodings, frame, location = job.encodings, job.image, None
+        else:
+            collected = self.collect(job)
+            if collected is None:
+                return
+            encodings, frame, location = collected
+        samples = compact_samples(encodings)
+        job.samples = len(samples)
+        
+        self._update(job, 'checking')
+        similar = {}
+        for identity, distance in self.match(samples):
+            if identity is not None:
+                similar[identity] = min(distance, similar.get(identity, distance))
+        job.similar = [{'user_id': identity, 'distance': round(float(distance), 4)}
+                       for identity, distance in sorted(similar.items(), key=lambda item: item[1])]
+        if job.similar and not job.force:
+            self._update(job, 'rejected', f"Face already registered as {job.similar[0]['user_id']}")
+            return
+        
+        paths = get_image_store().submit(frame, location) if frame is not None else None
+        if not self.register(job.details, samples, paths['image'] if paths else None):
+            self._update(job, 'failed', 'Failed to store the new user')
+            return
+        self._update(job, 'completed', 'User registered successfully')
\ No newline at end of file
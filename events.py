@@ -0,0 +1,114 @@
+import json
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from config import EVENT_BUFFER_SIZE, EVENT_HEARTBEAT_SECONDS, EVENT_RETRY_MS
+
+
+def _json_default(value):
+    """Serialize the non-JSON types that end up in recognition payloads"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return str(value)
+    return str(value)
+
+
+class Subscription:
+    """Bounded per-client event buffer"""
+    
+    def __init__(self, buffer_size):
+        self.events = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+    
+    def put(self, event):
+        """Queue an event, dropping the oldest one if the client is too slow"""
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+            self.condition.notify()
+    
+    def get(self, timeout):
+        """Wait for the next event, returns None on timeout"""
+        with self.condition:
+            if not self.events and not self.closed:
+                self.condition.wait(timeout)
+            if self.events:
+                return self.events.popleft()
+            return None
+    
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class EventBroker:
+    """Fan-out of system events to Server-Sent Events clients"""
+    
+    def __init__(self, buffer_size=EVENT_BUFFER_SIZE, heartbeat=EVENT_HEARTBEAT_SECONDS):
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.next_id = 0
+    
+    def subscribe(self):
+        """Register a new client"""
+        subscription = Subscription(self.buffer_size)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        """Remove a client"""
+        subscription.close()
+        with self.lock:
+            self.subscribers.discard(subscription)
+    
+    def publish(self, event_type, data):
+        """Send an event to every connected client"""
+        with self.lock:
+            if not self.subscribers:
+                return
+            self.next_id += 1
+            event = self.format(event_type, data, self.next_id)
+            subscribers = list(self.subscribers)
+        
+        for subscription in subscribers:
+            subscription.put(event)
+    
+    @staticmethod
+    def format(event_type, data, event_id=None):
+        """Encode one event in text/event-stream format"""
+        payload = json.dumps(data, default=_json_default)
+        lines = [f"id: {event_id}"] if event_id is not None else []
+        lines.append(f"event: {event_type}")
+        lines.append(f"data: {payload}")
+        return '\n'.join(lines) + '\n\n'
+    
+    def stream(self, subscription, initial=None):
+        """Generator for a streaming response, sends heartbeats while idle"""
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            if initial is not None:
+                yield self.format('status', initial)
+            while not subscription.closed:
+                event = subscription.get(self.heartbeat)
+                yield event if event is not None else ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscription)
+    
+    def client_count(self):
+        with self.lock:
+            return len(self.subscribers)
\ No newline at end of file
@@ -0,0 +1,131 @@
+import math
+
+import cv2
+import numpy as np
+
+import metrics
+from config import (FACE_QUALITY_MIN_SIZE, FACE_QUALITY_MIN_SHARPNESS, FACE_QUALITY_BRIGHTNESS,
+                    FACE_QUALITY_MAX_YAW, FACE_QUALITY_MAX_ROLL_DEGREES, FACE_QUALITY_EDGE_MARGIN,
+                    FACE_QUALITY_USE_LANDMARKS)
+
+SHARPNESS_SIZE = 64  # Crops are resized to this before measuring sharpness, so scores are comparable
+
+faces_checked = metrics.counter('face_quality_checked_total', 'Detected faces scored by the quality gate')
+faces_passed = metrics.counter('face_quality_passed_total', 'Faces that passed the quality gate and were encoded')
+REJECT_REASONS = ('too_small', 'cut_off', 'too_dark', 'too_bright', 'blurry', 'no_landmarks', 'pose')
+faces_rejected = {reason: metrics.counter('face_quality_rejected_total', 'Faces skipped before encoding', reason=reason)
+                  for reason in REJECT_REASONS}
+metrics.REGISTRY.register_collector(lambda: {
+    'face_quality_encodings_avoided_ratio': (
+        'Fraction of detected faces not encoded because of low quality',
+        round(1 - faces_passed.value / faces_checked.value, 4) if faces_checked.value else 0.0)
+})
+
+
+def estimate_pose(landmarks):
+    """(yaw, roll in degrees) from 5-point landmarks; yaw is the nose offset in inter-eye distances"""
+    left_eye = np.mean(landmarks['left_eye'], axis=0)
+    right_eye = np.mean(landmarks['right_eye'], axis=0)
+    nose = np.mean(landmarks['nose_tip'], axis=0)
+    
+    eye_vector = right_eye - left_eye
+    inter_eye = float(np.hypot(*eye_vector))
+    if inter_eye == 0:
+        return float('inf'), 0.0
+    eye_mid = (left_eye + right_eye) / 2
+    
+    # Project the nose offset onto the eye line so roll doesn't read as yaw
+    yaw = float(np.dot(nose - eye_mid, eye_vector) / inter_eye ** 2)
+    roll = math.degrees(math.atan2(eye_vector[1], eye_vector[0]))
+    if roll > 90:
+        roll -= 180
+    elif roll < -90:
+        roll += 180
+    return yaw, roll
+
+
+class FaceQualityGate:
+    """Cheap per-face checks run between detection and encoding"""
+    
+    def __init__(self, min_size=FACE_QUALITY_MIN_SIZE, min_sharpness=FACE_QUALITY_MIN_SHARPNESS,
+                 brightness=FACE_QUALITY_BRIGHTNESS, max_yaw=FACE_QUALITY_MAX_YAW,
+                 max_roll=FACE_QUALITY_MAX_ROLL_DEGREES, edge_margin=FACE_QUALITY_EDGE_MARGIN,
+                 use_landmarks=FACE_QUALITY_USE_LANDMARKS):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.brightness = brightness
+        self.max_yaw = max_yaw
+        self.max_roll = max_roll
+        self.edge_margin = edge_margin
+        self.use_landmarks = use_landmarks
+    
+    def score(self, rgb_frame, face_location):
+        """Quality measurements for one face, cheapest first; stops at the first failure
+        
+        Returns (reason or None, scores)
+        """
+        height, width = rgb_frame.shape[:2]
+        top, right, bottom, left = face_location
+        scores = {'size': min(bottom - top, right - left)}
+        if scores['size'] < self.min_size:
+            return 'too_small', scores
+        
+        # Detector boxes are clipped to the frame, so a box on the border means the face is cut off
+        margin = self.edge_margin
+        if top <= margin or left <= margin or bottom >= height - margin or right >= width - margin:
+            return 'cut_off', scores
+        
+        gray = cv2.cvtColor(rgb_frame[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        scores['brightness'] = round(float(gray.mean()), 1)
+        if scores['brightness'] < self.brightness[0]:
+            return 'too_dark', scores
+        if scores['brightness'] > self.brightness[1]:
+            return 'too_bright', scores
+        
+        small = cv2.resize(gray, (SHARPNESS_SIZE, SHARPNESS_SIZE), interpolation=cv2.INTER_AREA)
+        scores['sharpness'] = round(float(cv2.Laplacian(small, cv2.CV_64F).var()), 1)
+        if scores['sharpness'] < self.min_sharpness:
+            return 'blurry', scores
+        return None, scores
+    
+    def check_pose(self, rgb_frame, face_locations):
+        """Pose reason (or None) and scores per face, from one batched 5-point landmark call"""
+        import face_recognition
+        
+        results = []
+        for landmarks in face_recognition.face_landmarks(rgb_frame, face_locations, model='small'):
+            if not landmarks.get('nose_tip'):
+                results.append(('no_landmarks', {}))
+                continue
+            yaw, roll = estimate_pose(landmarks)
+            scores = {'yaw': round(yaw, 3), 'roll': round(roll, 1)}
+            results.append(('pose' if abs(yaw) > self.max_yaw or abs(roll) > self.max_roll else None, scores))
+        return results
+    
+    def filter(self, rgb_frame, face_locations):
+        """Split detections into faces worth encoding and rejected (location, reason, scores)"""
+        accepted, rejected = [], []
+        checked = {}
+        for face_location in face_locations:
+            reason, scores = self.score(rgb_frame, face_location)
+            if reason:
+                rejected.append((face_location, reason, scores))
+            else:
+                accepted.append(face_location)
+                checked[tuple(face_location)] = scores
+        
+        if self.use_landmarks and accepted:
+            posed = []
+            for face_location, (reason, pose_scores) in zip(accepted, self.check_pose(rgb_frame, accepted)):
+                scores = dict(checked[tuple(face_location)], **pose_scores)
+                if reason:
+                    rejected.append((face_location, reason, scores))
+                else:
+                    posed.append(face_location)
+            accepted = posed
+        
+        faces_checked.inc(len(face_locations))
+        faces_passed.inc(len(accepted))
+        for _, reason, _ in rejected:
+            faces_rejected[reason].inc()
+        return accepted, rejected
\ No newline at end of file
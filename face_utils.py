@@ -1,37 +1,46 @@
 import face_recognition
 import cv2
-import numpy as np
 import pickle
 import os
-from config import FACE_TOLERANCE, FACE_LOCATIONS_MODEL
+import threading
+from config import FACE_TOLERANCE, FACE_LOCATIONS_MODEL, FACE_QUALITY_ENABLED
+from image_store import get_image_store
+from face_quality import FaceQualityGate
+from gallery import FaceGallery, pack_encoding
+from metrics import stage_timer, gauge
+
+detect_seconds = stage_timer('detect')
+quality_seconds = stage_timer('quality')
+encode_seconds = stage_timer('encode')
+match_seconds = stage_timer('match')
+gallery_size = gauge('face_gallery_size', 'Known identities loaded for matching')
+gallery_samples = gauge('face_gallery_samples', 'Face samples across all identities')
 
 class FaceRecognitionEngine:
-    def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_student_ids = []
+    def __init__(self, db=None, quality_gate=None):
+        self.db = db
+        self.quality_gate = quality_gate or (FaceQualityGate() if FACE_QUALITY_ENABLED else None)
+        self.gallery = FaceGallery(tolerance=FACE_TOLERANCE)
+        self.refreshed = {}  # student_id -> refreshed samples not yet written, see flush_templates()
+        self.refreshed_lock = threading.Lock()
         self.load_known_faces()
     
     def load_known_faces(self):
-        """Load all approved student face encodings from database"""
+        """Load all approved student face samples from database"""
         from db import DatabaseManager
-        db = DatabaseManager()
-        students = db.get_approved_students()
-        
-        self.known_face_encodings = []
-        self.known_face_student_ids = []
+        db = self.db or DatabaseManager()
+        # Databases without the face_samples table only have the single legacy encoding
+        rows = db.get_face_samples() if hasattr(db, 'get_face_samples') else db.get_face_encodings()
         
-        for student in students:
-            if student['face_encoding']:
-                try:
-                    # Convert string back to numpy array
-                    encoding = np.fromstring(student['face_encoding'], sep=',')
-                    self.known_face_encodings.append(encoding)
-                    self.known_face_student_ids.append(student['student_id'])
-                except Exception as e:
-                    print(f"Error loading encoding for student {student['student_id']}: {e}")
-        
-        print(f"Loaded {len(self.known_face_encodings)} face encodings")
-        db.close()
+        self.gallery.load(rows)
+        self._update_gauges()
+        print(f"Loaded {self.gallery.sample_count()} face samples for {len(self.gallery)} people")
+        if self.db is None:
+            db.close()
+    
+    def _update_gauges(self):
+        gallery_size.set(len(self.gallery))
+        gallery_samples.set(self.gallery.sample_count())
     
     def encode_face_from_image(self, image_path):
         """Generate face encoding from image file"""
@@ -62,6 +71,45 @@ class FaceRecognitionEngine:
             print(f"Error encoding face from frame: {e}")
             return None
     
+    def detect(self, rgb_frame):
+        """Face locations (top, right, bottom, left) in an RGB frame"""
+        with detect_seconds.time():
+            return face_recognition.face_locations(rgb_frame, model=FACE_LOCATIONS_MODEL)
+    
+    def filter_quality(self, rgb_frame, face_locations):
+        """Drop faces not worth encoding, returns (accepted locations, rejected)"""
+        if self.quality_gate is None or not face_locations:
+            return face_locations, []
+        with quality_seconds.time():
+            return self.quality_gate.filter(rgb_frame, face_locations)
+    
+    def encode(self, rgb_frame, face_locations):
+        """128-d encodings for the given face locations"""
+        if not face_locations:
+            return []
+        with encode_seconds.time():
+            return face_recognition.face_encodings(rgb_frame, face_locations)
+    
+    def encode_crops(self, bgr_crops):
+        """128-d encoding of each face crop, the whole crop taken as the face box"""
+        encodings = []
+        with encode_seconds.time():
+            for crop in bgr_crops:
+                rgb_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+                height, width = rgb_crop.shape[:2]
+                encodings.extend(face_recognition.face_encodings(rgb_crop, [(0, width, height, 0)]))
+        return encodings
+    
+    def match(self, face_encodings, scope=None):
+        """Best matching student_id (or None) and distance for each encoding
+
+        scope: name of a gallery scope searched first (see FaceGallery.set_scope)
+        """
+        with match_seconds.time():
+            if scope is not None:
+                return self.gallery.match_scoped(face_encodings, scope)
+            return self.gallery.match(face_encodings)
+    
     def recognize_face(self, frame):
         """Recognize face in the given frame"""
         try:
@@ -69,33 +117,17 @@ class FaceRecognitionEngine:
             rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             
             # Find face locations and encodings
-            face_locations = face_recognition.face_locations(rgb_frame, model=FACE_LOCATIONS_MODEL)
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+            face_locations = self.detect(rgb_frame)
+            face_locations, _ = self.filter_quality(rgb_frame, face_locations)
+            face_encodings = self.encode(rgb_frame, face_locations)
             
             recognized_students = []
             
-            for face_encoding, face_location in zip(face_encodings, face_locations):
-                # Compare with known faces
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings, 
-                    face_encoding, 
-                    tolerance=FACE_TOLERANCE
-                )
-                
-                student_id = None
-                
-                if True in matches:
-                    # Find the best match
-                    face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                    best_match_index = np.argmin(face_distances)
-                    
-                    if matches[best_match_index]:
-                        student_id = self.known_face_student_ids[best_match_index]
-                
+            for (student_id, distance), face_location in zip(self.match(face_encodings), face_locations):
                 recognized_students.append({
                     'student_id': student_id,
                     'face_location': face_location,
-                    'confidence': 1 - (face_distances[best_match_index] if student_id else 1)
+                    'confidence': 1 - distance if student_id else 0
                 })
             
             return recognized_students
@@ -115,19 +147,12 @@ class FaceRecognitionEngine:
             return []
     
     def save_face_image(self, frame, student_id, face_location=None):
-        """Save face image to file"""
+        """Queue face crop and thumbnail for saving, returns the image path"""
         try:
-            if face_location:
-                top, right, bottom, left = face_location
-                face_image = frame[top:bottom, left:right]
-            else:
-                face_image = frame
-            
-            filename = f"face_images/{student_id}.jpg"
-            cv2.imwrite(filename, face_image)
-            return filename
+            paths = get_image_store().submit(frame, face_location)
+            return paths['image'] if paths else None
         except Exception as e:
-            print(f"Error saving face image: {e}")
+            print(f"Error saving face image for {student_id}: {e}")
             return None
     
     def encoding_to_string(self, encoding):
@@ -135,11 +160,35 @@ class FaceRecognitionEngine:
         return ','.join(map(str, encoding))
     
     def add_new_face(self, student_id, face_encoding):
-        """Add new face encoding to known faces"""
-        self.known_face_encodings.append(face_encoding)
-        self.known_face_student_ids.append(student_id)
+        """Add a face sample to the student's template"""
+        self.gallery.add(student_id, face_encoding)
+        self._update_gauges()
         print(f"Added new face for student: {student_id}")
     
+    def refresh_template(self, student_id, face_encoding, distance):
+        """Fold a confident recognition into the student's template; the database write waits for flush_templates()"""
+        samples = self.gallery.refresh(student_id, face_encoding, distance)
+        if samples is None:
+            return False
+        self._update_gauges()
+        with self.refreshed_lock:
+            self.refreshed[student_id] = samples
+        return True
+    
+    def flush_templates(self):
+        """Write the templates refreshed since the last flush, returns how many were written"""
+        with self.refreshed_lock:
+            refreshed, self.refreshed = self.refreshed, {}
+        if self.db is None or not hasattr(self.db, 'replace_face_samples'):
+            return 0
+        written = 0
+        for student_id, samples in refreshed.items():
+            if student_id not in self.gallery.samples:
+                continue  # Removed since, don't bring the samples back
+            if self.db.replace_face_samples(student_id, [pack_encoding(sample) for sample in samples]):
+                written += 1
+        return written
+    
     def reload_faces(self):
         """Reload all face encodings from database"""
         self.load_known_faces()
\ No newline at end of file
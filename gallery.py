@@ -0,0 +1,367 @@
+"""
+Multi-sample face templates
+Each identity keeps several samples and a centroid, stored as float32, float16
+or per-dimension scaled int8 (GALLERY_DTYPE). Matching scores every identity by
+its centroid and only compares individual samples for identities in the
+borderline band around the tolerance.
+Usage:
+    python gallery.py --compact [--enhanced]    # Merge near-duplicate stored samples
+"""
+
+import argparse
+import threading
+
+import numpy as np
+
+import metrics
+from config import (FACE_TOLERANCE, GALLERY_BORDERLINE_MARGIN, GALLERY_MERGE_DISTANCE,
+                    GALLERY_MAX_SAMPLES, GALLERY_REFRESH_DISTANCE, GALLERY_REFRESH_MARGIN, GALLERY_DTYPE)
+
+ENCODING_SIZE = 128
+GALLERY_DTYPES = ('float32', 'float16', 'int8')
+INT8_DEFAULT_PEAK = 0.5  # Assumed largest component magnitude before an int8 gallery is fitted
+DISTANCE_BLOCK_ROWS = 8192  # Stored rows widened to float32 at a time when computing distances
+
+borderline_matches = metrics.counter('gallery_borderline_total', 'Matches that needed per-sample comparison')
+
+
+def scope_counter(scope, result):
+    """Scoped match outcomes: hit (found in scope), fallback (found globally) or miss"""
+    return metrics.counter('gallery_scope_matches_total', 'Scoped match outcomes', scope=scope, result=result)
+
+
+def pack_encoding(encoding):
+    """Compact storage form: 128 float32 values (512 bytes)"""
+    return np.asarray(encoding, dtype=np.float32).tobytes()
+
+
+def unpack_encoding(value):
+    """Encoding from packed bytes or the legacy comma-separated text column, None if unusable"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        encoding = np.frombuffer(bytes(value), dtype=np.float32)
+    else:
+        try:
+            encoding = np.array(str(value).split(','), dtype=np.float32)
+        except ValueError:
+            return None  # Placeholder such as "opencv_detection"
+    return encoding if encoding.shape == (ENCODING_SIZE,) else None
+
+
+def encoding_samples(value):
+    """Packed samples for a template set from a single face_encoding value, none if it is unusable"""
+    encoding = unpack_encoding(value)
+    return [] if encoding is None else [pack_encoding(encoding)]
+
+
+def compact_samples(samples, merge_distance=GALLERY_MERGE_DISTANCE, max_samples=GALLERY_MAX_SAMPLES):
+    """Merge the closest pair of samples until none are within merge_distance and at most max_samples remain"""
+    samples = [np.asarray(sample, dtype=np.float32) for sample in samples]
+    weights = [1] * len(samples)
+    while len(samples) > 1:
+        stacked = np.vstack(samples)
+        distances = np.linalg.norm(stacked[:, None, :] - stacked[None, :, :], axis=2)
+        np.fill_diagonal(distances, np.inf)
+        i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        if distances[i, j] > merge_distance and len(samples) <= max_samples:
+            break
+        # Weighted by how many originals each side already absorbed in this pass
+        merged = (samples[i] * weights[i] + samples[j] * weights[j]) / (weights[i] + weights[j])
+        weight = weights[i] + weights[j]
+        for index in sorted((i, j), reverse=True):
+            del samples[index]
+            del weights[index]
+        samples.append(merged.astype(np.float32))
+        weights.append(weight)
+    return samples
+
+
+def roster_scope(roster, departments=None, class_sections=None):
+    """Identities whose department or class section is in the given lists
+    
+    roster: (identity, department, class_section) rows
+    """
+    departments = set(departments or [])
+    class_sections = set(class_sections or [])
+    return {identity for identity, department, class_section in roster
+            if department in departments or class_section in class_sections}
+
+
+class EncodingCodec:
+    """Storage form of gallery encodings: float32, float16 or int8 with a per-dimension scale"""
+    
+    def __init__(self, dtype=GALLERY_DTYPE):
+        if dtype not in GALLERY_DTYPES:
+            raise ValueError(f"Unknown gallery dtype {dtype!r}, expected one of {', '.join(GALLERY_DTYPES)}")
+        self.dtype = dtype
+        # int8 only: value of one step in each dimension, until fitted the default range is assumed
+        self.scale = np.full(ENCODING_SIZE, INT8_DEFAULT_PEAK / 127, dtype=np.float32) if dtype == 'int8' else None
+    
+    def fit(self, encodings):
+        """Choose the int8 scale so the largest magnitude seen in each dimension maps to 127"""
+        if self.dtype == 'int8' and len(encodings):
+            peak = np.abs(np.asarray(encodings, dtype=np.float32)).max(axis=0)
+            self.scale = (np.where(peak > 0, peak, INT8_DEFAULT_PEAK) / 127).astype(np.float32)
+    
+    def covers(self, encodings):
+        """Whether the encodings fit the int8 range without saturating"""
+        if self.dtype != 'int8':
+            return True
+        return bool(np.all(np.abs(np.asarray(encodings, dtype=np.float32)) <= self.scale * 127))
+    
+    def encode(self, encodings):
+        values = np.asarray(encodings, dtype=np.float32)
+        if self.dtype == 'float16':
+            return values.astype(np.float16)
+        if self.dtype == 'int8':
+            # Values beyond the fitted range saturate, FaceGallery refits before storing any (see covers())
+            return np.clip(np.rint(values / self.scale), -127, 127).astype(np.int8)
+        return values
+    
+    def decode(self, stored):
+        values = np.asarray(stored, dtype=np.float32)
+        return values * self.scale if self.dtype == 'int8' else values
+    
+    def distances(self, queries, stored, norms):
+        """Euclidean distances from float32 queries to stored rows
+        
+        norms: squared norms of the decoded rows. Stored rows are widened to float32 a block at a time,
+        and int8 rows are dotted with pre-scaled queries, so no decoded copy of the gallery is kept
+        """
+        weighted = queries * self.scale if self.dtype == 'int8' else queries
+        products = np.empty((len(queries), len(stored)), dtype=np.float32)
+        for start in range(0, len(stored), DISTANCE_BLOCK_ROWS):
+            block = stored[start:start + DISTANCE_BLOCK_ROWS].astype(np.float32, copy=False)
+            products[:, start:start + DISTANCE_BLOCK_ROWS] = weighted @ block.T
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        squared = query_norms[:, None] + norms[None, :] - 2.0 * products
+        return np.sqrt(np.maximum(squared, 0.0))
+    
+    def nbytes(self):
+        return self.scale.nbytes if self.scale is not None else 0
+
+
+class FaceGallery:
+    """Known identities, each with one or more encoding samples"""
+    
+    def __init__(self, tolerance=FACE_TOLERANCE, margin=GALLERY_BORDERLINE_MARGIN, dtype=GALLERY_DTYPE):
+        self.tolerance = tolerance
+        self.margin = margin
+        self.codec = EncodingCodec(dtype)
+        self.samples = {}  # identity -> [encodings in the codec's dtype, rows of sample_matrix once built]
+        self.scopes = {}  # scope name -> identities expected there (e.g. a schedule's roster)
+        self.scope_galleries = {}  # scope name -> sub-gallery, built on first use
+        self.lock = threading.Lock()
+        self._build()
+    
+    def load(self, rows):
+        """Replace the gallery from (identity, encoding) rows; repeated identities become extra samples"""
+        samples = {}
+        for identity, value in rows:
+            encoding = unpack_encoding(value)
+            if encoding is not None:
+                samples.setdefault(identity, []).append(encoding)
+        samples = {identity: compact_samples(encodings) for identity, encodings in samples.items()}
+        codec = EncodingCodec(self.codec.dtype)
+        if samples:
+            codec.fit(np.vstack([sample for encodings in samples.values() for sample in encodings]))
+        with self.lock:
+            self.codec = codec
+            self.samples = {identity: list(codec.encode(encodings)) for identity, encodings in samples.items()}
+            self._build()
+    
+    def identity_samples(self, identity):
+        """The identity's samples as float32"""
+        return list(self.codec.decode(self.samples[identity])) if self.samples.get(identity) else []
+    
+    def add(self, identity, encoding):
+        """Add one sample, compacting that identity's template"""
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self.lock:
+            return self._add(identity, encoding)
+    
+    def _add(self, identity, encoding):
+        compacted = compact_samples(self.identity_samples(identity) + [encoding])
+        if not self.codec.covers(compacted):
+            self._refit(compacted)
+        self.samples[identity] = list(self.codec.encode(compacted))
+        self._build()
+        return compacted
+    
+    def _refit(self, extra):
+        """Widen the int8 range to cover new samples, re-encoding the whole gallery
+        
+        A new codec replaces the old one, so a match already running keeps a consistent scale
+        """
+        samples = {identity: self.identity_samples(identity) for identity in self.samples}
+        codec = EncodingCodec(self.codec.dtype)
+        codec.fit(np.vstack([sample for encodings in samples.values() for sample in encodings] + list(extra)))
+        self.codec = codec
+        self.samples = {identity: list(codec.encode(encodings)) for identity, encodings in samples.items()}
+    
+    def remove(self, identity):
+        with self.lock:
+            if self.samples.pop(identity, None) is not None:
+                self._build()
+    
+    def refresh(self, identity, encoding, distance):
+        """Fold a confidently recognized face into the template so it tracks appearance changes
+        
+        Returns the identity's new samples, or None when the recognition wasn't confident enough
+        """
+        if distance is None or distance > GALLERY_REFRESH_DISTANCE:
+            return None
+        encoding = np.asarray(encoding, dtype=np.float32)
+        with self.lock:
+            if identity not in self.samples:
+                return None
+            # A face this close to an existing sample adds nothing, skip the rebuild
+            existing = np.vstack(self.identity_samples(identity))
+            if np.min(np.linalg.norm(existing - encoding, axis=1)) <= GALLERY_MERGE_DISTANCE:
+                return None
+            # A face nearly as close to someone else may be a false accept, keep it out of the template
+            others = self.codec.distances(encoding[None, :], self.centroids, self.centroid_norms)[0]
+            others[self.identities.index(identity)] = np.inf
+            if len(others) and np.min(others) < distance + GALLERY_REFRESH_MARGIN:
+                return None
+            return self._add(identity, encoding)
+    
+    def set_scope(self, name, identities):
+        """Define (or redefine) a named subset of identities searched before the full gallery"""
+        with self.lock:
+            self.scopes[name] = set(identities)
+            self.scope_galleries.pop(name, None)
+    
+    def clear_scopes(self):
+        with self.lock:
+            self.scopes = {}
+            self.scope_galleries = {}
+    
+    def scoped(self, name):
+        """Sub-gallery holding only the scope's identities"""
+        with self.lock:
+            sub = self.scope_galleries.get(name)
+            if sub is None:
+                sub = FaceGallery(self.tolerance, self.margin, self.codec.dtype)
+                sub.codec = self.codec
+                sub.samples = {identity: self.samples[identity] for identity in self.scopes.get(name, ())
+                               if identity in self.samples}
+                sub._build()
+                self.scope_galleries[name] = sub
+            return sub
+    
+    def match_scoped(self, face_encodings, scope):
+        """Match against the scope's sub-gallery first, falling back to the full gallery on a miss"""
+        if scope not in self.scopes:
+            return self.match(face_encodings)
+        results = self.scoped(scope).match(face_encodings)
+        misses = [index for index, (identity, _) in enumerate(results) if identity is None]
+        if misses:
+            for index, result in zip(misses, self.match([face_encodings[index] for index in misses])):
+                results[index] = result
+                scope_counter(scope, 'fallback' if result[0] is not None else 'miss').inc()
+        hits = len(results) - len(misses)
+        if hits:
+            scope_counter(scope, 'hit').inc(hits)
+        return results
+    
+    def _build(self):
+        """Rebuild the centroid and sample matrices used for matching"""
+        self.scope_galleries = {}  # Rebuilt from the new samples on next use
+        self.identities = list(self.samples)
+        stored_dtype = self.codec.encode(np.zeros((0, ENCODING_SIZE))).dtype
+        counts = [len(self.samples[identity]) for identity in self.identities]
+        
+        if sum(counts):
+            self.sample_matrix = np.vstack([np.vstack(self.samples[identity]) for identity in self.identities])
+            decoded = self.codec.decode(self.sample_matrix)
+            offsets = np.cumsum([0] + counts[:-1])
+            centroids = np.add.reduceat(decoded, offsets, axis=0) / np.asarray(counts, dtype=np.float32)[:, None]
+            self.centroids = self.codec.encode(centroids)
+            self.sample_norms = np.einsum('ij,ij->i', decoded, decoded)
+            decoded_centroids = self.codec.decode(self.centroids)
+            self.centroid_norms = np.einsum('ij,ij->i', decoded_centroids, decoded_centroids)
+            # Keep each identity's samples as views of the matrix instead of a second copy
+            for identity, offset, count in zip(self.identities, offsets, counts):
+                self.samples[identity] = list(self.sample_matrix[offset:offset + count])
+        else:
+            self.sample_matrix = np.empty((0, ENCODING_SIZE), dtype=stored_dtype)
+            self.centroids = np.empty((0, ENCODING_SIZE), dtype=stored_dtype)
+            self.sample_norms = np.empty(0, dtype=np.float32)
+            self.centroid_norms = np.empty(0, dtype=np.float32)
+        self.sample_owner = np.repeat(np.arange(len(self.identities), dtype=np.int64), counts)
+    
+    def __len__(self):
+        return len(self.identities)
+    
+    def sample_count(self):
+        return len(self.sample_matrix)
+    
+    def nbytes(self):
+        return (self.sample_matrix.nbytes + self.centroids.nbytes + self.sample_norms.nbytes
+                + self.centroid_norms.nbytes + self.codec.nbytes())
+    
+    def match(self, face_encodings):
+        """Best identity (or None) and distance for each encoding"""
+        with self.lock:
+            codec, identities, centroids, centroid_norms = self.codec, self.identities, self.centroids, self.centroid_norms
+            sample_matrix, sample_norms, sample_owner = self.sample_matrix, self.sample_norms, self.sample_owner
+        if len(face_encodings) == 0:
+            return []
+        if not identities:
+            return [(None, None)] * len(face_encodings)
+        
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        centroid_distances = codec.distances(queries, centroids, centroid_norms)
+        
+        results = []
+        for query, distances in zip(queries, centroid_distances):
+            best = int(np.argmin(distances))
+            best_distance = float(distances[best])
+            if best_distance > self.tolerance - self.margin:
+                # Borderline: compare individual samples of every identity near the tolerance
+                candidates = np.flatnonzero(distances <= self.tolerance + self.margin)
+                if len(candidates):
+                    borderline_matches.inc()
+                    mask = np.isin(sample_owner, candidates)
+                    sample_distances = codec.distances(query[None, :], sample_matrix[mask], sample_norms[mask])[0]
+                    nearest = int(np.argmin(sample_distances))
+                    if sample_distances[nearest] < best_distance:
+                        best = int(sample_owner[mask][nearest])
+                        best_distance = float(sample_distances[nearest])
+            results.append((identities[best] if best_distance <= self.tolerance else None, best_distance))
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact stored face samples")
+    parser.add_argument('--compact', action='store_true', required=True)
+    parser.add_argument('--enhanced', action='store_true', help="Use the users table (app_enhanced)")
+    args = parser.parse_args()
+    
+    if args.enhanced:
+        from db_enhanced import DatabaseManager
+    else:
+        from db import DatabaseManager
+    
+    db = DatabaseManager()
+    try:
+        samples = {}
+        for identity, value in db.get_face_samples():
+            encoding = unpack_encoding(value)
+            if encoding is not None:
+                samples.setdefault(identity, []).append(encoding)
+        
+        before = after = 0
+        for identity, encodings in samples.items():
+            compacted = compact_samples(encodings)
+            before += len(encodings)
+            after += len(compacted)
+            if len(compacted) < len(encodings):
+                db.replace_face_samples(identity, [pack_encoding(sample) for sample in compacted])
+        print(f"Compacted {before} samples for {len(samples)} identities into {after}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Gallery-wide duplicate and look-alike detection
+Compares every enrolled identity with every other one. Identity centroids are self-joined in
+tiles of GALLERY_DEDUPE_TILE x GALLERY_DEDUPE_TILE distances, so memory stays at one tile per
+worker, and row blocks can be spread over processes. Pairs near the match tolerance are re-checked
+on their individual samples, like the matcher's borderline band.
+  duplicates:  closer than GALLERY_DEDUPE_DUPLICATE_DISTANCE, most likely one person under two IDs
+  look-alikes: within FACE_TOLERANCE, different people the matcher can confuse
+Usage:
+    python gallery_dedupe.py [--enhanced] [--workers 4] [--json results/gallery_duplicates.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from gallery import ENCODING_SIZE, unpack_encoding
+
+_worker = {}  # Centroids, norms, tile and threshold of a pool worker
+
+
+def identity_templates(rows):
+    """(identities, centroid matrix, samples per identity) from (identity, encoding) rows"""
+    samples = {}
+    for identity, value in rows:
+        encoding = unpack_encoding(value)
+        if encoding is not None:
+            samples.setdefault(identity, []).append(encoding)
+    identities = list(samples)
+    stacked = [np.vstack(samples[identity]) for identity in identities]
+    if not stacked:
+        return identities, np.empty((0, ENCODING_SIZE), dtype=np.float32), stacked
+    centroids = np.vstack([matrix.mean(axis=0) for matrix in stacked]).astype(np.float32)
+    return identities, centroids, stacked
+
+
+def scan_block(centroids, norms, start, tile, threshold):
+    """(i, j, distance) for pairs i < j with i in the row block at start, closer than threshold"""
+    rows = centroids[start:start + tile]
+    row_norms = norms[start:start + tile]
+    limit = threshold * threshold
+    found_i, found_j, found_distance = [], [], []
+    for column in range(start, len(centroids), tile):
+        products = rows @ centroids[column:column + tile].T
+        squared = row_norms[:, None] + norms[column:column + tile][None, :] - 2.0 * products
+        i, j = np.nonzero(squared <= limit)
+        if column == start:
+            keep = j > i  # Diagonal tile: each pair once, no self-pairs
+            i, j = i[keep], j[keep]
+        found_i.append(i + start)
+        found_j.append(j + column)
+        found_distance.append(np.sqrt(np.maximum(squared[i, j], 0.0)))
+    return np.concatenate(found_i), np.concatenate(found_j), np.concatenate(found_distance)
+
+
+def _init_worker(centroids, tile, threshold):
+    _worker.update(centroids=centroids, norms=np.einsum('ij,ij->i', centroids, centroids), tile=tile,
+                   threshold=threshold)
+
+
+def _scan_worker_block(start):
+    return scan_block(_worker['centroids'], _worker['norms'], start, _worker['tile'], _worker['threshold'])
+
+
+def scan_pairs(centroids, threshold, tile=config.GALLERY_DEDUPE_TILE, workers=1):
+    """(i, j, distance) arrays for every pair of centroids closer than threshold"""
+    starts = range(0, len(centroids), tile)
+    if workers > 1 and len(starts) > 1:
+        # spawn: safe to use from inside the threaded web server; BLAS already threads each tile
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(centroids, tile, threshold)) as pool:
+            blocks = list(pool.map(_scan_worker_block, starts))
+    else:
+        norms = np.einsum('ij,ij->i', centroids, centroids)
+        blocks = [scan_block(centroids, norms, start, tile, threshold) for start in starts]
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+
+def closest_samples(a, b):
+    """Smallest distance between any sample of a and any sample of b"""
+    return float(np.sqrt(np.maximum(
+        np.einsum('ij,ij->i', a, a)[:, None] + np.einsum('ij,ij->i', b, b)[None, :] - 2.0 * (a @ b.T), 0.0)).min())
+
+
+def find_duplicates(rows, duplicate_distance=config.GALLERY_DEDUPE_DUPLICATE_DISTANCE,
+                    lookalike_distance=config.FACE_TOLERANCE, margin=config.GALLERY_BORDERLINE_MARGIN,
+                    tile=config.GALLERY_DEDUPE_TILE, workers=1, max_pairs=config.GALLERY_DEDUPE_MAX_PAIRS):
+    """Report of suspected duplicate registrations and look-alike pairs, closest first"""
+    start = time.perf_counter()
+    identities, centroids, samples = identity_templates(rows)
+    loaded = time.perf_counter()
+    i, j, centroid_distance = scan_pairs(centroids, lookalike_distance + margin, tile, workers)
+    scanned = time.perf_counter()
+    
+    duplicates, lookalikes = [], []
+    for a, b, distance in zip(i.tolist(), j.tolist(), centroid_distance.tolist()):
+        sample_distance = closest_samples(samples[a], samples[b])
+        closest = min(distance, sample_distance)
+        pair = {'a': identities[a], 'b': identities[b], 'distance': round(distance, 4),
+                'sample_distance': round(sample_distance, 4)}
+        if closest <= duplicate_distance:
+            duplicates.append((closest, pair))
+        elif closest <= lookalike_distance:
+            lookalikes.append((closest, pair))
+    duplicates.sort(key=lambda item: item[0])
+    lookalikes.sort(key=lambda item: item[0])
+    
+    n = len(identities)
+    return {
+        'identities': n,
+        'samples': sum(len(matrix) for matrix in samples),
+        'pairs_compared': n * (n - 1) // 2,
+        'candidates': len(i),
+        'duplicate_distance': duplicate_distance,
+        'lookalike_distance': lookalike_distance,
+        'duplicates_found': len(duplicates),
+        'lookalikes_found': len(lookalikes),
+        'duplicates': [pair for _, pair in duplicates[:max_pairs]],
+        'lookalikes': [pair for _, pair in lookalikes[:max_pairs]],
+        'seconds': {
+            'load': round(loaded - start, 3),
+            'scan': round(scanned - loaded, 3),
+            'recheck': round(time.perf_counter() - scanned, 3)
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find duplicate registrations and look-alike pairs in the gallery")
+    parser.add_argument('--enhanced', action='store_true', help="Use the users table (app_enhanced)")
+    parser.add_argument('--workers', type=int, default=1, help="Processes scanning row blocks")
+    parser.add_argument('--tile', type=int, default=config.GALLERY_DEDUPE_TILE)
+    parser.add_argument('--duplicate-distance', type=float, default=config.GALLERY_DEDUPE_DUPLICATE_DISTANCE)
+    parser.add_argument('--lookalike-distance', type=float, default=config.FACE_TOLERANCE)
+    parser.add_argument('--json', help="Write the report to this file")
+    args = parser.parse_args()
+    
+    if args.enhanced:
+        from db_enhanced import DatabaseManager
+    else:
+        from db import DatabaseManager
+    
+    db = DatabaseManager()
+    try:
+        rows = db.get_face_samples()
+    finally:
+        db.close()
+    
+    report = find_duplicates(rows, args.duplicate_distance, args.lookalike_distance, tile=args.tile,
+                             workers=args.workers)
+    print(f"{report['identities']} identities, {report['pairs_compared']} pairs compared in "
+          f"{report['seconds']['scan']}s: {report['duplicates_found']} suspected duplicates, "
+          f"{report['lookalikes_found']} look-alike pairs")
+    for pair in report['duplicates'][:20]:
+        print(f"  duplicate  {pair['a']} / {pair['b']}  {pair['distance']:.3f} (closest samples {pair['sample_distance']:.3f})")
+    
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
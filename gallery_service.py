@@ -0,0 +1,415 @@
+"""
+Gallery service
+One process owns the face gallery (and the recognition models, when
+face_recognition is installed) and answers requests from any number of web
+workers over a Unix domain socket.
+Protocol: every message is a header (op or status: uint8, payload length: uint32,
+little-endian) followed by the payload. Strings are uint16-length-prefixed UTF-8,
+encodings are a uint32 count followed by count x 128 float32.
+Usage:
+    python gallery_service.py [--enhanced] [--socket /tmp/face_gallery.sock]
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+import metrics
+from config import GALLERY_SERVICE_SOCKET, GALLERY_SERVICE_TIMEOUT
+from gallery import ENCODING_SIZE, FaceGallery
+
+DEFAULT_SOCKET = '/tmp/face_gallery.sock'
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+OP_MATCH = 1        # scope, encodings -> matches
+OP_RECOGNIZE = 2    # scope, frame -> boxes with matches
+OP_ADD = 3          # identity, encodings -> sample count
+OP_REMOVE = 4       # identity -> (empty)
+OP_RELOAD = 5       # (empty) -> identity count
+OP_SET_SCOPES = 6   # {name: identities}, replacing all scopes -> (empty)
+OP_STATS = 7        # (empty) -> JSON
+OP_ENCODE = 8       # face crops -> encodings
+OP_NAMES = {OP_MATCH: 'match', OP_RECOGNIZE: 'recognize', OP_ADD: 'add', OP_REMOVE: 'remove',
+            OP_RELOAD: 'reload', OP_SET_SCOPES: 'set_scopes', OP_STATS: 'stats', OP_ENCODE: 'encode'}
+# Cheap ops that give the same result when run twice, resent if the connection drops after sending
+RETRY_OPS = {OP_MATCH, OP_REMOVE, OP_SET_SCOPES, OP_STATS, OP_ENCODE}
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+HEADER = struct.Struct('<BI')
+COUNT = struct.Struct('<I')
+STRING_LENGTH = struct.Struct('<H')
+DISTANCE = struct.Struct('<f')
+BOX = struct.Struct('<iiii')            # x, y, w, h
+FRAME_SHAPE = struct.Struct('<HHB')     # height, width, channels of a raw uint8 frame
+
+
+class GalleryServiceError(Exception):
+    """Error reported by the gallery service"""
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Gallery service connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def pack_string(value):
+    data = (value or '').encode('utf-8')
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def unpack_string(buffer, offset):
+    (length,) = STRING_LENGTH.unpack_from(buffer, offset)
+    offset += STRING_LENGTH.size
+    return bytes(buffer[offset:offset + length]).decode('utf-8'), offset + length
+
+
+def pack_encodings(encodings):
+    array = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    return COUNT.pack(len(array)) + array.tobytes()
+
+
+def unpack_encodings(buffer, offset):
+    (count,) = COUNT.unpack_from(buffer, offset)
+    offset += COUNT.size
+    size = count * ENCODING_SIZE * 4
+    array = np.frombuffer(buffer, dtype=np.float32, count=count * ENCODING_SIZE, offset=offset)
+    return array.reshape(count, ENCODING_SIZE), offset + size
+
+
+def pack_frame(frame):
+    """Raw uint8 BGR frame prefixed by its shape"""
+    frame = np.ascontiguousarray(frame, dtype=np.uint8)
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    return FRAME_SHAPE.pack(height, width, channels) + frame.tobytes()
+
+
+def unpack_frame(buffer, offset):
+    height, width, channels = FRAME_SHAPE.unpack_from(buffer, offset)
+    offset += FRAME_SHAPE.size
+    size = height * width * channels
+    frame = np.frombuffer(buffer, dtype=np.uint8, count=size, offset=offset)
+    return frame.reshape(height, width, channels), offset + size
+
+
+def pack_matches(matches, boxes=None):
+    """(identity or None, distance or None) per face, optionally preceded by its box"""
+    parts = [COUNT.pack(len(matches))]
+    for index, (identity, distance) in enumerate(matches):
+        if boxes is not None:
+            parts.append(BOX.pack(*boxes[index]))
+        parts.append(DISTANCE.pack(float('nan') if distance is None else distance))
+        parts.append(pack_string(identity))
+    return b''.join(parts)
+
+
+def unpack_matches(buffer, offset=0, with_boxes=False):
+    (count,) = COUNT.unpack_from(buffer, offset)
+    offset += COUNT.size
+    boxes, matches = [], []
+    for _ in range(count):
+        if with_boxes:
+            boxes.append(list(BOX.unpack_from(buffer, offset)))
+            offset += BOX.size
+        (distance,) = DISTANCE.unpack_from(buffer, offset)
+        identity, offset = unpack_string(buffer, offset + DISTANCE.size)
+        matches.append((identity or None, None if np.isnan(distance) else distance))
+    return (boxes, matches) if with_boxes else matches
+
+
+class GalleryService:
+    """Request handlers around one shared gallery"""
+    
+    def __init__(self, db, engine=None):
+        self.db = db
+        self.engine = engine
+        self.gallery = engine.gallery if engine is not None else FaceGallery()
+        self.db_lock = threading.Lock()
+        self.model_lock = threading.Lock()  # dlib models are not safe to call concurrently
+        self.handlers = {
+            OP_MATCH: self.match,
+            OP_RECOGNIZE: self.recognize,
+            OP_ADD: self.add,
+            OP_REMOVE: self.remove,
+            OP_RELOAD: self.reload,
+            OP_SET_SCOPES: self.set_scopes,
+            OP_STATS: self.stats,
+            OP_ENCODE: self.encode
+        }
+        self.request_seconds = {op: metrics.histogram('gallery_service_request_seconds',
+                                                      'Gallery service request handling time', op=name)
+                                for op, name in OP_NAMES.items()}
+        if engine is None:
+            self.reload(b'')
+    
+    def handle(self, op, payload):
+        handler = self.handlers.get(op)
+        if handler is None:
+            raise ValueError(f"Unknown operation {op}")
+        with self.request_seconds[op].time():
+            return handler(payload)
+    
+    def match(self, payload):
+        scope, offset = unpack_string(payload, 0)
+        encodings, _ = unpack_encodings(payload, offset)
+        if scope:
+            return pack_matches(self.gallery.match_scoped(encodings, scope))
+        return pack_matches(self.gallery.match(encodings))
+    
+    def recognize(self, payload):
+        if self.engine is None:
+            raise RuntimeError("face_recognition is not installed in the gallery service")
+        scope, offset = unpack_string(payload, 0)
+        frame, _ = unpack_frame(payload, offset)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        
+        with self.model_lock:
+            face_locations = self.engine.detect(rgb_frame)
+            face_locations, _ = self.engine.filter_quality(rgb_frame, face_locations)
+            face_encodings = self.engine.encode(rgb_frame, face_locations)
+        matches = self.engine.match(face_encodings, scope=scope or None)
+        boxes = [(left, top, right - left, bottom - top) for top, right, bottom, left in face_locations]
+        return pack_matches(matches, boxes)
+    
+    def encode(self, payload):
+        if self.engine is None:
+            raise RuntimeError("face_recognition is not installed in the gallery service")
+        (count,) = COUNT.unpack_from(payload, 0)
+        offset = COUNT.size
+        crops = []
+        for _ in range(count):
+            crop, offset = unpack_frame(payload, offset)
+            crops.append(crop)
+        with self.model_lock:
+            return pack_encodings(self.engine.encode_crops(crops))
+    
+    def add(self, payload):
+        identity, offset = unpack_string(payload, 0)
+        encodings, _ = unpack_encodings(payload, offset)
+        samples = []
+        for encoding in encodings:
+            samples = self.gallery.add(identity, encoding)
+        return COUNT.pack(len(samples))
+    
+    def remove(self, payload):
+        identity, _ = unpack_string(payload, 0)
+        self.gallery.remove(identity)
+        return b''
+    
+    def reload(self, payload):
+        with self.db_lock:
+            if self.engine is not None:
+                self.engine.reload_faces()
+            else:
+                rows = self.db.get_face_samples() if hasattr(self.db, 'get_face_samples') else self.db.get_face_encodings()
+                self.gallery.load(rows)
+        return COUNT.pack(len(self.gallery))
+    
+    def set_scopes(self, payload):
+        (count,) = COUNT.unpack_from(payload, 0)
+        offset = COUNT.size
+        scopes = {}
+        for _ in range(count):
+            name, offset = unpack_string(payload, offset)
+            (members,) = COUNT.unpack_from(payload, offset)
+            offset += COUNT.size
+            identities = []
+            for _ in range(members):
+                identity, offset = unpack_string(payload, offset)
+                identities.append(identity)
+            scopes[name] = identities
+        
+        self.gallery.clear_scopes()
+        for name, identities in scopes.items():
+            self.gallery.set_scope(name, identities)
+            self.gallery.scoped(name)  # Build now rather than on the first match
+        return b''
+    
+    def stats(self, payload):
+        return json.dumps({
+            'identities': len(self.gallery),
+            'samples': self.gallery.sample_count(),
+            'gallery_bytes': self.gallery.nbytes(),
+            'dtype': self.gallery.codec.dtype,
+            'scopes': sorted(self.gallery.scopes),
+            'recognize': self.engine is not None,
+            'requests': {OP_NAMES[op]: histogram.count for op, histogram in self.request_seconds.items()}
+        }).encode('utf-8')
+    
+    def serve(self, path):
+        """Listen on a Unix socket until interrupted"""
+        if os.path.exists(path):
+            os.unlink(path)  # Stale socket from a previous run
+        server = socketserver.ThreadingUnixStreamServer(path, _RequestHandler)
+        server.daemon_threads = True
+        server.service = self
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """One client connection, any number of requests"""
+    
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                op, length = HEADER.unpack(_recv_exact(self.request, HEADER.size))
+                if length > MAX_MESSAGE_BYTES:
+                    message = f"Message of {length} bytes exceeds {MAX_MESSAGE_BYTES}".encode('utf-8')
+                    self.request.sendall(HEADER.pack(STATUS_ERROR, len(message)) + message)
+                    return
+                payload = _recv_exact(self.request, length)
+            except (ConnectionError, OSError):
+                return
+            
+            try:
+                status, body = STATUS_OK, service.handle(op, payload)
+            except Exception as e:
+                print(f"Error handling gallery request {OP_NAMES.get(op, op)}: {e}")
+                status, body = STATUS_ERROR, str(e).encode('utf-8')
+            try:
+                self.request.sendall(HEADER.pack(status, len(body)) + body)
+            except OSError:
+                return
+
+
+class GalleryClient:
+    """Connection to the gallery service, safe to share between threads"""
+    
+    def __init__(self, path=None, timeout=GALLERY_SERVICE_TIMEOUT):
+        self.path = path or GALLERY_SERVICE_SOCKET or DEFAULT_SOCKET
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+        self.request_seconds = {op: metrics.histogram('gallery_client_request_seconds',
+                                                      'Round trip to the gallery service', op=name)
+                                for op, name in OP_NAMES.items()}
+    
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self.sock = sock
+    
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+    
+    def _request(self, op, payload=b''):
+        with self.request_seconds[op].time(), self.lock:
+            # Retry once on a fresh connection in case the service restarted
+            for attempt in range(2):
+                sent = False
+                try:
+                    if self.sock is None:
+                        self._connect()
+                    self.sock.sendall(HEADER.pack(op, len(payload)) + payload)
+                    sent = True
+                    status, length = HEADER.unpack(_recv_exact(self.sock, HEADER.size))
+                    body = _recv_exact(self.sock, length)
+                    break
+                except OSError as e:
+                    self.close()
+                    # Once sent, the service may have run the request: an add would store its samples
+                    # twice, and a timeout means the service is busy, not gone
+                    if attempt or (sent and (isinstance(e, socket.timeout) or op not in RETRY_OPS)):
+                        raise
+        if status != STATUS_OK:
+            raise GalleryServiceError(body.decode('utf-8', 'replace'))
+        return body
+    
+    def match(self, face_encodings, scope=None):
+        """Best identity (or None) and distance for each encoding, in one round trip"""
+        if len(face_encodings) == 0:
+            return []
+        return unpack_matches(self._request(OP_MATCH, pack_string(scope) + pack_encodings(face_encodings)))
+    
+    def recognize(self, frame, scope=None):
+        """Detect, encode and match faces in a BGR frame; returns ([x, y, w, h] boxes, matches)"""
+        return unpack_matches(self._request(OP_RECOGNIZE, pack_string(scope) + pack_frame(frame)), with_boxes=True)
+    
+    def encode_crops(self, crops):
+        """Encoding of each BGR face crop (the whole crop is the face), in one round trip"""
+        if not crops:
+            return []
+        payload = COUNT.pack(len(crops)) + b''.join(pack_frame(crop) for crop in crops)
+        return list(unpack_encodings(self._request(OP_ENCODE, payload), 0)[0])
+    
+    def add(self, identity, encodings):
+        """Add samples to an identity's template, returns its sample count"""
+        body = self._request(OP_ADD, pack_string(identity) + pack_encodings(encodings))
+        return COUNT.unpack(body)[0]
+    
+    def remove(self, identity):
+        self._request(OP_REMOVE, pack_string(identity))
+    
+    def reload(self):
+        """Reload the gallery from the database, returns the identity count"""
+        return COUNT.unpack(self._request(OP_RELOAD))[0]
+    
+    def set_scopes(self, scopes):
+        """Replace all scopes with {name: identities}"""
+        parts = [COUNT.pack(len(scopes))]
+        for name, identities in scopes.items():
+            identities = list(identities)
+            parts.append(pack_string(name) + COUNT.pack(len(identities)))
+            parts.extend(pack_string(identity) for identity in identities)
+        self._request(OP_SET_SCOPES, b''.join(parts))
+    
+    def stats(self):
+        return json.loads(self._request(OP_STATS).decode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the face gallery to web workers over a Unix socket")
+    parser.add_argument('--socket', default=GALLERY_SERVICE_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument('--enhanced', action='store_true', help="Use the users table (app_enhanced)")
+    args = parser.parse_args()
+    
+    if args.enhanced:
+        from db_enhanced import DatabaseManager
+    else:
+        from db import DatabaseManager
+    try:
+        from face_utils import FaceRecognitionEngine
+    except ImportError:
+        FaceRecognitionEngine = None
+        print("face_recognition not installed, serving match requests only")
+    
+    db = DatabaseManager()
+    try:
+        service = GalleryService(db, FaceRecognitionEngine(db=db) if FaceRecognitionEngine is not None else None)
+        print(f"Serving {len(service.gallery)} identities on {args.socket}")
+        service.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
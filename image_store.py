@@ -0,0 +1,148 @@
+import hashlib
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+import config
+
+
+class FaceImageStore:
+    """Content-addressed face image store with a background writer thread"""
+    
+    def __init__(self, root=None, queue_size=None):
+        self.root = root or config.FACE_IMAGES_DIR
+        self.image_format = config.FACE_IMAGE_FORMAT
+        self.queue = queue.Queue(maxsize=queue_size or config.FACE_IMAGE_QUEUE_SIZE)
+        self.cascade = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        
+        self.thread = threading.Thread(target=self._writer)
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def paths_for(self, digest):
+        """Sharded relative paths for an image and its thumbnail"""
+        directory = os.path.join(self.root, digest[:2], digest[2:4])
+        return {
+            'image': os.path.join(directory, f"{digest}.{self.image_format}").replace(os.sep, '/'),
+            'thumbnail': os.path.join(directory, f"{digest}_thumb.{self.image_format}").replace(os.sep, '/')
+        }
+    
+    def submit(self, frame, face_location=None):
+        """Queue a frame for saving and return the paths it will be written to (None if the queue is full)"""
+        frame = np.ascontiguousarray(frame)
+        paths = self.paths_for(self._digest(frame, face_location))
+        try:
+            self.queue.put_nowait((frame, face_location, paths))
+        except queue.Full:
+            self.dropped += 1
+            print("Face image queue full, dropping image")
+            return None
+        return paths
+    
+    def save(self, frame, face_location=None):
+        """Write the crop and thumbnail now, in the calling thread; returns their paths"""
+        paths = self.paths_for(self._digest(frame, face_location))
+        self._store(np.ascontiguousarray(frame), face_location, paths)
+        return paths
+    
+    def flush(self):
+        """Block until every queued image has been written"""
+        self.queue.join()
+    
+    @staticmethod
+    def _digest(frame, face_location):
+        digest = hashlib.sha1(memoryview(np.ascontiguousarray(frame))).hexdigest()
+        if face_location is not None:
+            digest = hashlib.sha1((digest + repr(tuple(face_location))).encode('utf-8')).hexdigest()
+        return digest
+    
+    def crop(self, frame, face_location=None):
+        """Padded crop around the given (top, right, bottom, left) face, or the largest detected face"""
+        height, width = frame.shape[:2]
+        if face_location is None:
+            if self.cascade is None:
+                self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = self.cascade.detectMultiScale(gray, 1.1, 4)
+            if len(faces) == 0:
+                return frame
+            x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+            face_location = (y, x + w, y + h, x)
+        
+        top, right, bottom, left = [int(value) for value in face_location]
+        pad_y = int((bottom - top) * config.FACE_CROP_PADDING)
+        pad_x = int((right - left) * config.FACE_CROP_PADDING)
+        return frame[max(0, top - pad_y):min(height, bottom + pad_y),
+                     max(0, left - pad_x):min(width, right + pad_x)]
+    
+    def _encode(self, image, quality):
+        if self.image_format == 'webp':
+            params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+        else:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        ret, buffer = cv2.imencode(f".{self.image_format}", image, params)
+        if not ret:
+            raise ValueError("Image encoding failed")
+        return buffer.tobytes()
+    
+    @staticmethod
+    def _write(path, data):
+        """Write atomically so readers never see a partial file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    
+    def _store(self, frame, face_location, paths):
+        """Crop, compress and write one image and its thumbnail"""
+        if os.path.exists(paths['thumbnail']):  # Written last
+            return
+        face = self.crop(frame, face_location)
+        self._write(paths['image'], self._encode(face, config.FACE_IMAGE_QUALITY))
+        
+        size = config.FACE_THUMB_SIZE
+        scale = size / max(face.shape[:2])
+        thumbnail = cv2.resize(face, (max(1, int(face.shape[1] * scale)), max(1, int(face.shape[0] * scale))),
+                               interpolation=cv2.INTER_AREA)
+        self._write(paths['thumbnail'], self._encode(thumbnail, config.FACE_THUMB_QUALITY))
+    
+    def _writer(self):
+        """Background loop: crop, compress and write queued images"""
+        while True:
+            frame, face_location, paths = self.queue.get()
+            try:
+                self._store(frame, face_location, paths)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error saving face image: {e}")
+            finally:
+                self.queue.task_done()
+    
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_image_store():
+    """Shared store instance (started on first use)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FaceImageStore()
+        return _store
\ No newline at end of file
@@ -0,0 +1,208 @@
+"""
+Batch attendance ingestion
+Kiosks that cached recognitions while offline upload them in one request, either as JSON lines
+({"user_id", "timestamp", "schedule_id", "camera_id"} per line, timestamp as epoch seconds or ISO
+8601 local time) or as a packed binary payload: uint32 event count, then per event a
+uint16-length-prefixed user_id, float64 epoch seconds, int32 schedule_id (-1 picks the schedule
+open at that time) and uint16-length-prefixed camera_id, little-endian.
+"""
+
+import json
+import struct
+from datetime import datetime, timedelta
+
+import config
+import metrics
+from gallery_service import COUNT, pack_string, unpack_string
+
+EVENT_FIELDS = struct.Struct('<di')  # epoch seconds, schedule_id
+
+batch_seconds = metrics.histogram('attendance_batch_seconds', 'Validate and commit time per batch upload')
+
+
+def batch_events(result):
+    return metrics.counter('attendance_batch_events_total', 'Batch-uploaded attendance events by outcome',
+                           result=result)
+
+
+class IngestError(ValueError):
+    """Malformed batch payload"""
+
+
+def parse_json_lines(text):
+    events = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            raise IngestError(f"Line {number} is not valid JSON")
+        if not isinstance(event, dict):
+            raise IngestError(f"Line {number} is not an object")
+        events.append(event)
+    return events
+
+
+def pack_events(events):
+    """Binary payload for a list of event dicts (timestamps as epoch seconds)"""
+    parts = [COUNT.pack(len(events))]
+    for event in events:
+        schedule_id = event.get('schedule_id')
+        parts.append(pack_string(event['user_id']))
+        parts.append(EVENT_FIELDS.pack(event['timestamp'], -1 if schedule_id is None else schedule_id))
+        parts.append(pack_string(event.get('camera_id')))
+    return b''.join(parts)
+
+
+def unpack_events(payload):
+    try:
+        (count,) = COUNT.unpack_from(payload, 0)
+        offset = COUNT.size
+        events = []
+        for _ in range(count):
+            user_id, offset = unpack_string(payload, offset)
+            timestamp, schedule_id = EVENT_FIELDS.unpack_from(payload, offset)
+            offset += EVENT_FIELDS.size
+            camera_id, offset = unpack_string(payload, offset)
+            events.append({'user_id': user_id, 'timestamp': timestamp,
+                           'schedule_id': None if schedule_id < 0 else schedule_id, 'camera_id': camera_id})
+    except (struct.error, UnicodeDecodeError):
+        raise IngestError("Truncated or malformed binary payload")
+    if offset != len(payload):
+        raise IngestError("Trailing bytes after the last event")
+    return events
+
+
+def parse_timestamp(value):
+    """Local datetime from epoch seconds or an ISO 8601 string, None if invalid"""
+    try:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value)
+        if isinstance(value, str):
+            # Before Python 3.11 fromisoformat doesn't accept a 'Z' suffix
+            parsed = datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+            # Offsets are converted to local time; naive values already are local
+            return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+
+def schedule_open(schedule, when):
+    """Whether an active schedule's days and hours include the datetime when"""
+    if not schedule['is_active']:
+        return False
+    if schedule['days_of_week'] and str(when.weekday() + 1) not in schedule['days_of_week']:  # 1=Monday
+        return False
+    if schedule['start_time'] and schedule['end_time']:
+        start_time = schedule['start_time']
+        end_time = schedule['end_time']
+        
+        # Convert to datetime.time if needed
+        if isinstance(start_time, str):
+            start_time = datetime.strptime(start_time, '%H:%M:%S').time()
+        if isinstance(end_time, str):
+            end_time = datetime.strptime(end_time, '%H:%M:%S').time()
+        return start_time <= when.time() <= end_time
+    return False
+
+
+class BatchIngest:
+    """Validates uploaded events against the cached roster and schedules, commits them in chunks"""
+    
+    def __init__(self, db, chunk_size=config.ATTENDANCE_BATCH_CHUNK,
+                 max_age_days=config.ATTENDANCE_BATCH_MAX_AGE_DAYS,
+                 max_skew_seconds=config.ATTENDANCE_BATCH_MAX_SKEW_SECONDS):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.max_age = timedelta(days=max_age_days)
+        self.max_skew = timedelta(seconds=max_skew_seconds)
+    
+    def validate(self, event, users, schedules, now):
+        """(row, None) for an acceptable event, (None, reason) otherwise"""
+        user_id = event.get('user_id')
+        if not isinstance(user_id, str) or user_id not in users:
+            return None, 'unknown user'
+        when = parse_timestamp(event.get('timestamp'))
+        if when is None:
+            return None, 'invalid timestamp'
+        if when > now + self.max_skew:
+            return None, 'timestamp in the future'
+        if when < now - self.max_age:
+            return None, 'timestamp too old'
+        
+        schedule_id = event.get('schedule_id')
+        if schedule_id is None:
+            schedule = next((schedule for schedule in schedules.values() if schedule_open(schedule, when)), None)
+            if schedule is None:
+                return None, 'outside attendance hours'
+        else:
+            try:
+                schedule = schedules.get(int(schedule_id))
+            except (TypeError, ValueError):
+                schedule = None
+            if schedule is None:
+                return None, 'unknown schedule'
+            if not schedule_open(schedule, when):
+                return None, 'outside schedule window'
+        return (user_id, when.date(), when.time().replace(microsecond=0), 'Present', schedule['id']), None
+    
+    def ingest(self, events, users, schedules, now=None):
+        """Per-event results in input order and a summary
+        
+        users: user_id -> user of the active roster; schedules: id -> active schedule
+        """
+        now = now or datetime.now()
+        with batch_seconds.time():
+            results = [None] * len(events)
+            latest = {}  # (user_id, date, schedule_id) -> (index, row); the latest mark wins like in the database
+            for index, event in enumerate(events):
+                row, reason = self.validate(event, users, schedules, now)
+                if row is None:
+                    results[index] = {'status': 'rejected', 'reason': reason}
+                    continue
+                key = (row[0], row[1], row[4])
+                previous = latest.get(key)
+                if previous is None or row[2] >= previous[1][2]:
+                    if previous is not None:
+                        results[previous[0]] = {'status': 'duplicate'}
+                    latest[key] = (index, row)
+                else:
+                    results[index] = {'status': 'duplicate'}
+            
+            accepted = sorted(latest.values())
+            journal = getattr(self.db, 'journal', None)
+            for start in range(0, len(accepted), self.chunk_size):
+                chunk = accepted[start:start + self.chunk_size]
+                rows = [row for _, row in chunk]
+                # Journaled first like single marks, so a failed chunk is replayed later
+                seqs = None
+                if journal is not None:
+                    try:
+                        seqs = journal.append_many(rows)
+                    except OSError as e:  # Disk full, permissions: the chunk is only written directly
+                        print(f"Error journaling {len(rows)} attendance events: {e}")
+                if self.db.upsert_attendance(rows):
+                    if seqs:
+                        journal.commit(seqs)
+                    status = {'status': 'marked'}
+                elif seqs:
+                    status = {'status': 'queued', 'reason': 'database unavailable, journaled for replay'}
+                else:
+                    status = {'status': 'failed', 'reason': 'database write failed'}
+                for index, _ in chunk:
+                    results[index] = status
+        
+        summary = {'received': len(events)}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        for status, count in summary.items():
+            if status != 'received':
+                batch_events(status).inc(count)
+        cameras = {}
+        for event in events:
+            camera_id = event.get('camera_id') or 'unknown'
+            cameras[camera_id] = cameras.get(camera_id, 0) + 1
+        summary['cameras'] = cameras
+        return results, summary
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Store-and-forward attendance journal
+Every attendance mark is appended to an on-disk journal and fsynced before the MySQL write, so a
+mark made while the database is unreachable is kept and replayed once it is back.
+Segment files hold length-prefixed records: <I length><I crc32> followed by a JSON payload.
+A torn record at the end of a segment (crash mid-write) is truncated away on open.
+"""
+
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import config
+import metrics
+
+RECORD_HEADER = struct.Struct('<II')  # payload length, crc32 of the payload
+CHECKPOINT_FILE = 'checkpoint'
+
+journal_appends = metrics.counter('attendance_journal_appends_total', 'Attendance marks written to the journal')
+journal_replayed = metrics.counter('attendance_journal_replayed_total', 'Journaled marks replayed into the database')
+journal_rejected = metrics.counter('attendance_journal_rejected_total',
+                                   'Journaled marks the database refused (dropped after logging)')
+journal_fsync_seconds = metrics.histogram('attendance_journal_fsync_seconds', 'Journal fsync duration')
+journal_replay_seconds = metrics.histogram('attendance_journal_replay_batch_seconds', 'Replay time per batch')
+
+
+def read_segment(path):
+    """Yield (seq, record, end_offset) for the intact records of a segment file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        length, checksum = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            return
+        record = json.loads(payload)
+        offset = start + length
+        yield record.pop('seq'), record, offset
+
+
+class AttendanceJournal:
+    """Append-only journal of attendance marks with group-committed fsyncs
+    
+    append() returns once the record is on disk; concurrent appenders share one fsync.
+    Records stay pending until commit() (the database has them); checkpoint() persists the
+    highest sequence below which everything is committed and deletes segments behind it.
+    """
+    
+    def __init__(self, directory=None, segment_bytes=config.ATTENDANCE_JOURNAL_SEGMENT_BYTES):
+        self.directory = directory or config.ATTENDANCE_JOURNAL_DIR
+        self.segment_bytes = segment_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = threading.Lock()        # Sequence numbers, file writes, pending records
+        self.sync_lock = threading.Lock()   # One fsync (and segment roll) at a time
+        self.pending = {}                   # seq -> record, oldest first
+        self.checkpoint_seq = self._read_checkpoint()
+        self.segments = []                  # (first seq, path), oldest first
+        last_seq = self.checkpoint_seq
+        for path in sorted(glob.glob(os.path.join(self.directory, 'journal-*.log'))):
+            self.segments.append((int(os.path.basename(path)[8:-4]), path))
+            good_offset = 0
+            for seq, record, good_offset in read_segment(path):
+                last_seq = max(last_seq, seq)
+                if seq > self.checkpoint_seq:
+                    self.pending[seq] = record
+            if good_offset < os.path.getsize(path):
+                print(f"Journal segment {path} has a torn record, truncating at byte {good_offset}")
+                os.truncate(path, good_offset)
+        if self.pending:
+            print(f"Journal holds {len(self.pending)} marks not yet in the database")
+        
+        self.next_seq = last_seq + 1
+        self.synced_seq = last_seq
+        self.file = None
+        self._open_segment()
+        metrics.REGISTRY.register_collector(lambda: {
+            'attendance_journal_depth': ('Journaled marks not yet in the database', len(self.pending)),
+            'attendance_journal_oldest_unsynced_seconds': ('Age of the oldest journaled mark not yet in the database',
+                                                           self.oldest_age())
+        })
+    
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+    
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"journal-{self.next_seq:012d}.log")
+        self.file = open(path, 'ab')
+        if not self.segments or self.segments[-1][1] != path:
+            self.segments.append((self.next_seq, path))
+    
+    def append(self, user_id, day, at, schedule_id, status='Present'):
+        """Durably record a mark, returns its sequence number"""
+        return self.append_many([(user_id, day, at, status, schedule_id)])[0]
+    
+    def append_many(self, rows):
+        """Durably record (user_id, date, time, status, schedule_id) rows with one fsync, returns their sequence numbers"""
+        now = time.time()
+        seqs = []
+        with self.lock:
+            for user_id, day, at, status, schedule_id in rows:
+                record = {'user_id': user_id, 'date': str(day), 'time': str(at), 'schedule_id': schedule_id,
+                          'status': status, 'ts': now}
+                seq = self.next_seq
+                self.next_seq += 1
+                payload = json.dumps(dict(record, seq=seq)).encode('utf-8')
+                self.file.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                self.pending[seq] = record
+                seqs.append(seq)
+        journal_appends.inc(len(seqs))
+        if seqs:
+            self._sync(seqs[-1])
+        return seqs
+    
+    def _sync(self, seq):
+        with self.sync_lock:
+            if self.synced_seq >= seq:
+                return  # Covered by an fsync another appender ran meanwhile
+            with self.lock:
+                target = self.next_seq - 1
+                self.file.flush()
+            # Appends carry on while the fsync runs and are picked up by the next one
+            with journal_fsync_seconds.time():
+                os.fsync(self.file.fileno())
+            self.synced_seq = target
+            
+            if self.file.tell() >= self.segment_bytes:
+                with self.lock:
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+                    self.file.close()
+                    self.synced_seq = self.next_seq - 1
+                    self._open_segment()
+    
+    def commit(self, seqs):
+        """The database holds these marks, they no longer need replaying"""
+        with self.lock:
+            for seq in seqs:
+                self.pending.pop(seq, None)
+    
+    def pending_batch(self, limit):
+        """Oldest (seq, record) pairs not yet in the database"""
+        with self.lock:
+            batch = []
+            for seq, record in self.pending.items():
+                batch.append((seq, record))
+                if len(batch) >= limit:
+                    break
+            return batch
+    
+    def oldest_age(self):
+        with self.lock:
+            oldest = next(iter(self.pending.values()), None)
+        return time.time() - oldest['ts'] if oldest else 0.0
+    
+    def checkpoint(self):
+        """Persist the committed prefix and delete segments that only hold committed marks"""
+        with self.lock:
+            committed = (next(iter(self.pending)) - 1) if self.pending else self.next_seq - 1
+            if committed == self.checkpoint_seq:
+                return
+            path = os.path.join(self.directory, CHECKPOINT_FILE)
+            with open(path + '.tmp', 'w') as f:
+                f.write(str(committed))
+            os.replace(path + '.tmp', path)
+            self.checkpoint_seq = committed
+            
+            # A segment ends where the next one starts; the open one is never removed
+            while len(self.segments) > 1 and self.segments[1][0] - 1 <= committed:
+                os.remove(self.segments.pop(0)[1])
+    
+    def stats(self):
+        with self.lock:
+            depth = len(self.pending)
+            segments = len(self.segments)
+        return {
+            'depth': depth,
+            'oldest_unsynced_seconds': round(self.oldest_age(), 3),
+            'checkpoint': self.checkpoint_seq,
+            'next_seq': self.next_seq,
+            'segments': segments,
+            'appended_total': journal_appends.value,
+            'replayed_total': journal_replayed.value,
+            'rejected_total': journal_rejected.value
+        }
+    
+    def close(self):
+        with self.sync_lock, self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+class JournalReplayer:
+    """Background thread draining pending journal records into the database in batches"""
+    
+    def __init__(self, journal, db, batch_size=config.ATTENDANCE_JOURNAL_REPLAY_BATCH,
+                 interval=config.ATTENDANCE_JOURNAL_REPLAY_INTERVAL_SECONDS):
+        self.journal = journal
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows_per_second = 0.0  # Throughput of the last replayed batch
+        self.stop_event = threading.Event()
+        self.thread = None
+        metrics.REGISTRY.register_collector(lambda: {
+            'attendance_journal_replay_rows_per_second': ('Replay throughput of the last batch', self.rows_per_second)
+        })
+    
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='journal-replayer', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            # Keep going while full batches drain, back off when empty or the database is down
+            try:
+                drained = self.replay_once()
+            except Exception as e:
+                print(f"Journal replay failed: {e}")
+                drained = False
+            if not drained:
+                self.journal.checkpoint()
+                self.stop_event.wait(self.interval)
+    
+    def replay_once(self):
+        """Replay one batch, returns True if a batch went in"""
+        batch = self.journal.pending_batch(self.batch_size)
+        if not batch:
+            return False
+        rows = [(record['user_id'], record['date'], record['time'], record['status'], record['schedule_id'])
+                for _, record in batch]
+        
+        start = time.perf_counter()
+        replayed = self.db.upsert_attendance(rows)
+        elapsed = time.perf_counter() - start
+        journal_replay_seconds.observe(elapsed)
+        if not replayed:
+            if not self._database_up():
+                return False
+            # Connected but the batch was refused: isolate the rows the database will never take
+            for (seq, record), row in zip(batch, rows):
+                if self.db.upsert_attendance([row]):
+                    journal_replayed.inc()
+                elif self._database_up():
+                    print(f"Dropping journaled mark {seq} for {record['user_id']}: rejected by the database")
+                    journal_rejected.inc()
+                else:
+                    return False
+                self.journal.commit([seq])
+            return True
+        
+        self.journal.commit([seq for seq, _ in batch])
+        journal_replayed.inc(len(batch))
+        self.rows_per_second = len(batch) / elapsed if elapsed else 0.0
+        return len(batch) == self.batch_size
+    
+    def _database_up(self):
+        connection = self.db.connection
+        return connection is not None and connection.is_connected()
\ No newline at end of file
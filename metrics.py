@@ -0,0 +1,263 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from config import METRICS_LATENCY_BUCKETS
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count"""
+    
+    kind = 'counter'
+    
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+    
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+    
+    def samples(self, name, labels):
+        yield name, labels, self.value
+    
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Value that can go up and down"""
+    
+    kind = 'gauge'
+    
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+    
+    def set(self, value):
+        self.value = value
+    
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+    
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+    
+    def samples(self, name, labels):
+        yield name, labels, self.value
+    
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    """Latency distribution over fixed buckets (seconds)"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, buckets=None):
+        self.buckets = tuple(sorted(buckets or METRICS_LATENCY_BUCKETS))
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.lock = threading.Lock()
+    
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+    
+    def time(self):
+        """Context manager that observes the elapsed time of its block"""
+        return _Timer(self)
+    
+    def quantile(self, q, counts=None, count=None):
+        """Approximate quantile, interpolated within the containing bucket"""
+        if counts is None:
+            with self.lock:
+                counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                if index == len(self.buckets):
+                    return self.buckets[-1]  # Beyond the last bound, report the bound
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+    
+    def samples(self, name, labels):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield f"{name}_bucket", labels + (('le', _format_value(float(bound))),), cumulative
+        yield f"{name}_sum", labels, total
+        yield f"{name}_count", labels, count
+    
+    def snapshot(self):
+        with self.lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'mean_ms': round(total / count * 1000, 3) if count else None,
+            'p50_ms': self._ms(self.quantile(0.50, counts, count)),
+            'p95_ms': self._ms(self.quantile(0.95, counts, count)),
+            'p99_ms': self._ms(self.quantile(0.99, counts, count))
+        }
+    
+    @staticmethod
+    def _ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+    
+    def __init__(self, histogram):
+        self.histogram = histogram
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named metrics with optional labels, rendered as Prometheus text or JSON"""
+    
+    def __init__(self):
+        self.families = {}  # name -> (kind, help, {labels: metric})
+        self.collectors = []
+        self.lock = threading.Lock()
+    
+    def _get(self, metric_class, name, help_text, labels, **kwargs):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = (metric_class.kind, help_text, {})
+            elif family[0] != metric_class.kind:
+                raise ValueError(f"Metric {name} already registered as a {family[0]}")
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = metric_class(**kwargs)
+            return metric
+    
+    def counter(self, name, help_text, **labels):
+        return self._get(Counter, name, help_text, labels)
+    
+    def gauge(self, name, help_text, **labels):
+        return self._get(Gauge, name, help_text, labels)
+    
+    def histogram(self, name, help_text, buckets=None, **labels):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+    
+    def register_collector(self, collect):
+        """Add a callable returning {name: (help, value)} gauges read at scrape time"""
+        with self.lock:
+            self.collectors.append(collect)
+    
+    def _collected(self):
+        gauges = {}
+        for collect in list(self.collectors):
+            try:
+                gauges.update(collect())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+        return gauges
+    
+    def render_prometheus(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self.lock:
+            families = sorted((name, kind, help_text, list(metrics.items()))
+                              for name, (kind, help_text, metrics) in self.families.items())
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(metrics, key=lambda item: item[0]):
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    lines.append(f"{sample_name}{_format_labels(sample_labels)} {_format_value(value)}")
+        for name, (help_text, value) in sorted(self._collected().items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+    
+    def snapshot(self):
+        """JSON-friendly view: {name: value} or {name: {"label=value,...": value}}"""
+        result = {}
+        with self.lock:
+            families = [(name, list(metrics.items())) for name, (_, _, metrics) in self.families.items()]
+        for name, metrics in sorted(families):
+            if len(metrics) == 1 and not metrics[0][0]:
+                result[name] = metrics[0][1].snapshot()
+            else:
+                result[name] = {','.join(f"{key}={value}" for key, value in labels): metric.snapshot()
+                                for labels, metric in sorted(metrics, key=lambda item: item[0])}
+        for name, (_, value) in self._collected().items():
+            result[name] = value
+        return result
+
+
+REGISTRY = MetricsRegistry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def timed(name, help_text, **labels):
+    """Decorator observing the wrapped call's latency in a histogram"""
+    def decorator(func):
+        metric = histogram(name, help_text, **labels)
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metric.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def stage_timer(stage):
+    """Histogram for one recognition pipeline stage"""
+    return histogram('recognition_stage_seconds', 'Recognition pipeline stage latency', stage=stage)
+
+
+def timed_query(func):
+    """Decorator for database calls, latency per module and method"""
+    return timed('db_query_seconds', 'Database call latency',
+                 module=func.__module__, method=func.__name__)(func)
\ No newline at end of file
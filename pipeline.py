@@ -0,0 +1,84 @@
+import time
+
+import cv2
+
+from metrics import stage_timer
+
+mark_seconds = stage_timer('mark')
+
+PIPELINE_STAGES = ('capture', 'detect', 'quality', 'encode', 'match', 'mark')
+
+
+class RecognitionPipeline:
+    """Detect -> quality gate -> encode -> match -> mark, with per-stage timing"""
+    
+    def __init__(self, engine, attendance_manager):
+        self.engine = engine
+        self.attendance_manager = attendance_manager
+    
+    def process(self, frame, timings=None, trace=None):
+        """Run one BGR frame through the pipeline, returns a result per detected face
+        
+        timings: optional dict, stage seconds are added to it
+        trace: optional tracing.FrameTrace, receives a span per stage (and per face for encoding)
+        """
+        if timings is None:
+            timings = {}
+        
+        start = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        face_locations = self.engine.detect(rgb_frame)
+        detected = time.perf_counter()
+        if trace is not None:
+            trace.add_span('detect', start, detected, faces=len(face_locations))
+        
+        # Low-quality faces are skipped; the same person is tried again on the next frame
+        face_locations, rejected = self.engine.filter_quality(rgb_frame, face_locations)
+        checked = time.perf_counter()
+        if trace is not None and rejected:
+            trace.add_span('quality', detected, checked, rejected=[reason for _, reason, _ in rejected])
+        
+        if trace is None:
+            face_encodings = self.engine.encode(rgb_frame, face_locations)
+        else:
+            # One call per face so each encode gets its own span
+            face_encodings = []
+            for index, face_location in enumerate(face_locations):
+                face_start = time.perf_counter()
+                face_encodings.extend(self.engine.encode(rgb_frame, [face_location]))
+                trace.add_span('encode', face_start, time.perf_counter(), face=index)
+        encoded = time.perf_counter()
+        
+        matches = self.engine.match(face_encodings)
+        matched = time.perf_counter()
+        if trace is not None and face_encodings:
+            trace.add_span('match', encoded, matched, gallery=len(self.engine.gallery))
+        
+        results = []
+        for (student_id, distance), face_location in zip(matches, face_locations):
+            result = {
+                'student_id': student_id,
+                'face_location': face_location,
+                'confidence': 1 - distance if student_id else 0
+            }
+            if student_id:
+                write_start = time.perf_counter()
+                result['marked'], result['message'] = self.attendance_manager.mark_student_attendance(student_id)
+                if trace is not None:
+                    trace.add_span('attendance_write', write_start, time.perf_counter(),
+                                   student_id=student_id, success=result['marked'])
+                    if result['marked']:
+                        trace.mark_committed()
+            results.append(result)
+        marked = time.perf_counter()
+        if results:
+            mark_seconds.observe(marked - matched)
+        
+        for face_location, reason, _ in rejected:
+            results.append({'student_id': None, 'face_location': face_location, 'confidence': 0, 'skipped': reason})
+        
+        for stage, seconds in (('detect', detected - start), ('quality', checked - detected),
+                               ('encode', encoded - checked), ('match', matched - encoded),
+                               ('mark', marked - matched)):
+            timings[stage] = timings.get(stage, 0.0) + seconds
+        return results
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Recognition for thin clients
+Browsers and edge devices that detect (and optionally encode) faces themselves post only the faces
+to /api/recognize, instead of the server decoding their video:
+  - application/octet-stream: packed embeddings, uint32 count then count x 128 float32, little-endian
+    (the gallery service's encoding format)
+  - multipart/form-data: JPEG face crops as files named 'crops'
+  - JSON: {"embeddings": [[128 floats], ...], "crops": [base64 JPEG, ...]}
+Crops are encoded whole, so they should be tight face boxes; the client's detector stands in for
+the server's quality gate.
+"""
+
+import base64
+import binascii
+import struct
+
+import cv2
+import numpy as np
+
+import metrics
+from gallery import ENCODING_SIZE
+from gallery_service import unpack_encodings
+
+recognize_seconds = metrics.histogram('remote_recognize_seconds', 'Decode, encode, match and mark time per /api/recognize call')
+
+
+def remote_faces(source):
+    return metrics.counter('remote_recognize_faces_total', 'Faces received from thin clients', source=source)
+
+
+class RecognizeError(ValueError):
+    """Malformed recognition payload"""
+
+
+def parse_embeddings(payload):
+    """(n, 128) float32 array from the packed binary format"""
+    try:
+        encodings, end = unpack_encodings(payload, 0)
+    except (struct.error, ValueError):
+        raise RecognizeError("Truncated or malformed embedding payload")
+    if end != len(payload):
+        raise RecognizeError("Trailing bytes after the last embedding")
+    return check_embeddings(encodings)
+
+
+def check_embeddings(encodings):
+    if not np.isfinite(encodings).all():
+        raise RecognizeError("Embeddings must be finite numbers")
+    return encodings
+
+
+def parse_json(body):
+    """(embeddings array, list of JPEG bytes) from a JSON request body"""
+    if not isinstance(body, dict):
+        raise RecognizeError("Expected a JSON object with 'embeddings' and/or 'crops'")
+    try:
+        encodings = np.asarray(body.get('embeddings') or [], dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    except (TypeError, ValueError):
+        raise RecognizeError(f"'embeddings' must be a list of {ENCODING_SIZE}-number lists")
+    crops = []
+    for index, crop in enumerate(body.get('crops') or []):
+        try:
+            crops.append(base64.b64decode(crop.split(',', 1)[-1], validate=True))  # Data URLs allowed
+        except (AttributeError, binascii.Error):
+            raise RecognizeError(f"Crop {index} is not base64")
+    return check_embeddings(encodings), crops
+
+
+def decode_crops(blobs):
+    """BGR image per JPEG crop, None where it can't be decoded"""
+    images = []
+    for blob in blobs:
+        image = cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_COLOR) if blob else None
+        images.append(image if image is not None and image.size else None)
+    return images
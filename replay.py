@@ -0,0 +1,246 @@
+"""
+Offline replay of recorded footage through the recognition pipeline
+Processes the file as fast as the CPU allows, split into chunks across worker
+processes, and marks attendance at the time each student appears in the video: on each day of
+footage, the earliest sighting inside the attendance window
+Usage:
+    python replay.py recording.mp4 --start "2026-10-19 08:00:00" [--workers 4] [--stride 5]
+    python replay.py recording.mp4 --dry-run
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import cv2
+
+from camera import CameraManager
+from pipeline import PIPELINE_STAGES
+
+_pipeline = None
+_recorder = None
+
+
+class GallerySource:
+    """Pre-loaded (student_id, face_encoding) rows, in place of a database connection"""
+    
+    def __init__(self, rows):
+        self.rows = rows
+    
+    def get_face_encodings(self):
+        return self.rows
+    
+    def close(self):
+        pass
+
+
+class SightingRecorder:
+    """Stands in for AttendanceManager inside workers, keeps each student's first sighting per minute
+    
+    Attendance windows are set in whole minutes, so the first sighting of a wall-clock minute is
+    the one that can pass the window check; later ones in the same minute add nothing.
+    """
+    
+    def __init__(self):
+        self.start_timestamp = 0.0  # Wall-clock time of the video's first frame
+        self.frame_time = None
+        self.sightings = {}         # student_id -> {minute: video offset}
+    
+    def mark_student_attendance(self, student_id):
+        minutes = self.sightings.setdefault(student_id, {})
+        minute = int((self.start_timestamp + self.frame_time) // 60)
+        if minute not in minutes or self.frame_time < minutes[minute]:
+            minutes[minute] = self.frame_time
+        return False, "Sighting recorded"
+
+
+def _init_worker(gallery_rows):
+    """Build one recognition pipeline per worker process"""
+    global _pipeline, _recorder
+    from face_utils import FaceRecognitionEngine
+    from pipeline import RecognitionPipeline
+    
+    _recorder = SightingRecorder()
+    _pipeline = RecognitionPipeline(FaceRecognitionEngine(db=GallerySource(gallery_rows)), _recorder)
+
+
+def _replay_chunk(job):
+    """Worker: run every stride-th frame of [start_frame, end_frame) through the pipeline"""
+    video_path, start_frame, end_frame, stride, fps, start_timestamp = job
+    _recorder.sightings = {}
+    _recorder.start_timestamp = start_timestamp
+    timings = {}
+    decoded = processed = faces = 0
+    
+    camera = CameraManager(source=video_path)
+    if not camera.open():
+        raise RuntimeError(f"Cannot open video {video_path}")
+    try:
+        camera.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        for index in range(start_frame, end_frame):
+            if index % stride:
+                if not camera.grab():
+                    break
+                continue
+            
+            frame, _ = camera.read()
+            if frame is None:
+                break
+            decoded += 1
+            
+            # Container timestamp of this frame, falling back to the nominal frame rate
+            position_ms = camera.cap.get(cv2.CAP_PROP_POS_MSEC)
+            _recorder.frame_time = position_ms / 1000 if position_ms > 0 or index == 0 else index / fps
+            
+            faces += len(_pipeline.process(frame, timings))
+            processed += 1
+    finally:
+        camera.cap.release()
+    
+    return {
+        'decoded': decoded,
+        'processed': processed,
+        'faces': faces,
+        'sightings': _recorder.sightings,
+        'timings': timings
+    }
+
+
+class VideoReplay:
+    """Parallel offline replay of one video file"""
+    
+    def __init__(self, video_path, start_time, workers=None, stride=1, chunks_per_worker=2):
+        self.video_path = video_path
+        self.start_time = start_time
+        self.workers = workers or os.cpu_count() or 1
+        self.stride = max(1, stride)
+        self.chunks_per_worker = chunks_per_worker
+        
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError(f"Cannot open video {video_path}")
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+    
+    def chunks(self):
+        """Contiguous frame ranges, a few per worker so slow chunks balance out"""
+        if self.frame_count <= 0:
+            return []
+        count = max(1, min(self.workers * self.chunks_per_worker, self.frame_count))
+        size = -(-self.frame_count // count)
+        return [(start, min(start + size, self.frame_count)) for start in range(0, self.frame_count, size)]
+    
+    def recognize(self, gallery_rows):
+        """Run all chunks across the process pool, returns each student's sighting offsets (first per minute,
+        ascending) and stats"""
+        stats = {'frames': self.frame_count, 'decoded': 0, 'processed': 0, 'faces': 0,
+                 'stage_seconds': dict.fromkeys(PIPELINE_STAGES, 0.0)}
+        by_minute = {}
+        start_timestamp = self.start_time.timestamp()
+        jobs = [(self.video_path, start, end, self.stride, self.fps, start_timestamp) for start, end in self.chunks()]
+        
+        start = time.perf_counter()
+        # spawn: workers must not inherit the parent's database connection
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(gallery_rows,)) as pool:
+            for result in pool.map(_replay_chunk, jobs):
+                for key in ('decoded', 'processed', 'faces'):
+                    stats[key] += result[key]
+                for stage, seconds in result['timings'].items():
+                    stats['stage_seconds'][stage] = stats['stage_seconds'].get(stage, 0.0) + seconds
+                for student_id, minutes in result['sightings'].items():
+                    merged = by_minute.setdefault(student_id, {})
+                    for minute, offset in minutes.items():
+                        if minute not in merged or offset < merged[minute]:
+                            merged[minute] = offset
+        
+        sightings = {student_id: sorted(minutes.values()) for student_id, minutes in by_minute.items()}
+        wall = time.perf_counter() - start
+        stats['wall_seconds'] = round(wall, 3)
+        stats['frames_per_sec'] = round(stats['processed'] / wall, 2) if wall else 0.0
+        stats['speedup'] = round(self.frame_count / self.fps / wall, 2) if wall else 0.0  # Video seconds per second
+        stats['stage_seconds'] = {stage: round(seconds, 3) for stage, seconds in stats['stage_seconds'].items()}
+        return sightings, stats
+    
+    def days(self, offsets):
+        """Sighting times grouped by date, ascending"""
+        by_day = {}
+        for offset in offsets:
+            seen_at = self.start_time + timedelta(seconds=offset)
+            by_day.setdefault(seen_at.date(), []).append(seen_at)
+        return by_day
+    
+    def commit(self, attendance_manager, sightings):
+        """Mark attendance per student and day at the earliest sighting inside the attendance window;
+        existing records are left untouched"""
+        outcomes = {}
+        marks = []
+        for student_id, offsets in sightings.items():
+            for day, times in self.days(offsets).items():
+                # Sightings before the window opens (or after it closes) don't count for the day
+                seen_at = next((at for at in times if attendance_manager.is_attendance_time(at)[0]), None)
+                if seen_at is None:
+                    outcomes.setdefault(attendance_manager.is_attendance_time(times[0])[1], []).append(
+                        {'student_id': student_id, 'time': times[0].isoformat(timespec='seconds')})
+                else:
+                    marks.append((seen_at, student_id))
+        
+        for seen_at, student_id in sorted(marks):
+            success, message = attendance_manager.mark_student_attendance(student_id, at=seen_at)
+            outcomes.setdefault('marked' if success else message, []).append(
+                {'student_id': student_id, 'time': seen_at.isoformat(timespec='seconds')})
+        return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage through the attendance pipeline")
+    parser.add_argument('video', help="Video file to process")
+    parser.add_argument('--start', help="Wall-clock time of the first frame (YYYY-MM-DD HH:MM:SS), "
+                                        "defaults to the file's modification time minus its duration")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--stride', type=int, default=1, help="Process every Nth frame")
+    parser.add_argument('--dry-run', action='store_true', help="Report sightings without marking attendance")
+    args = parser.parse_args()
+    
+    from db import DatabaseManager
+    from attendance import AttendanceManager
+    
+    db = DatabaseManager()
+    try:
+        gallery_rows = db.get_face_encodings()
+        
+        if args.start:
+            start_time = datetime.strptime(args.start, '%Y-%m-%d %H:%M:%S')
+            replay = VideoReplay(args.video, start_time, workers=args.workers, stride=args.stride)
+        else:
+            replay = VideoReplay(args.video, None, workers=args.workers, stride=args.stride)
+            duration = replay.frame_count / replay.fps
+            replay.start_time = datetime.fromtimestamp(os.path.getmtime(args.video) - duration)
+        
+        print(f"Replaying {replay.frame_count} frames from {replay.start_time} "
+              f"with {replay.workers} workers against {len(gallery_rows)} known faces...")
+        sightings, stats = replay.recognize(gallery_rows)
+        report = {'stats': stats, 'sightings': len(sightings)}
+        
+        if args.dry_run:
+            report['students'] = {student_id: [times[0].isoformat(timespec='seconds')
+                                               for times in replay.days(offsets).values()]
+                                  for student_id, offsets in sightings.items()}
+        else:
+            report['attendance'] = replay.commit(AttendanceManager(db=db), sightings)
+    finally:
+        db.close()
+    
+    print(json.dumps(report, indent=2))
+    print(f"Processed {stats['processed']} frames at {stats['frames_per_sec']} frames/sec "
+          f"({stats['speedup']}x real time)")
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request, Response
+
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_GZIP_MIN_BYTES
+
+
+class CachedResponse:
+    """Pre-serialized JSON body and optional gzip variant, each with its own ETag"""
+    
+    def __init__(self, body, version):
+        self.body = body
+        self.version = version
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzip_body = None
+        self.gzip_etag = f"{self.etag}-gz"  # A different representation needs its own strong validator
+        if len(body) >= RESPONSE_CACHE_GZIP_MIN_BYTES:
+            compressed = gzip.compress(body, compresslevel=6)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+
+
+class ResponseCache:
+    """Versioned cache of read-only JSON API responses"""
+    
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bytes_served = 0
+        self.bytes_saved = 0
+    
+    def bump(self, *namespaces):
+        """Invalidate every cached response in the given namespaces"""
+        with self.lock:
+            for namespace in namespaces:
+                self.versions[namespace] = self.versions.get(namespace, 0) + 1
+    
+    def respond(self, namespace, build):
+        """Serve the cached response for this route and query, building it on a miss"""
+        key = (namespace, request.path, tuple(sorted(request.args.items(multi=True))))
+        
+        with self.lock:
+            version = self.versions.get(namespace, 0)
+            cached = self.entries.get(key)
+            if cached is not None and cached.version == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                cached = None
+                self.misses += 1
+        
+        if cached is None:
+            body = current_app.json.dumps(build()).encode('utf-8')
+            cached = CachedResponse(body, version)
+            with self.lock:
+                self.entries[key] = cached
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        
+        return self._make_response(cached)
+    
+    def _make_response(self, cached):
+        """Build a 200/304 response honouring If-None-Match and Accept-Encoding"""
+        use_gzip = cached.gzip_body is not None and 'gzip' in request.accept_encodings
+        etag = cached.gzip_etag if use_gzip else cached.etag
+        if request.if_none_match.contains(etag):
+            with self.lock:
+                self.not_modified += 1
+                self.bytes_saved += len(cached.gzip_body if use_gzip else cached.body)
+            response = Response(status=304)
+        elif use_gzip:
+            with self.lock:
+                self.bytes_served += len(cached.gzip_body)
+                self.bytes_saved += len(cached.body) - len(cached.gzip_body)
+            response = Response(cached.gzip_body, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            with self.lock:
+                self.bytes_served += len(cached.body)
+            response = Response(cached.body, mimetype='application/json')
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'  # Always revalidate
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    
+    def stats(self):
+        """Hit ratio and bandwidth metrics"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'not_modified': self.not_modified,
+                'bytes_served': self.bytes_served,
+                'bytes_saved': self.bytes_saved,
+                'versions': dict(self.versions)
+            }
\ No newline at end of file
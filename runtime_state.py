@@ -0,0 +1,151 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from types import MappingProxyType
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process state is available
+    fcntl = None
+
+from config import RUNTIME_STATE_SHARED_PATH, RUNTIME_STATE_SHARED_BYTES
+
+HEADER = struct.Struct('<QI')  # sequence (odd while a write is in progress), payload length
+READ_ATTEMPTS = 100            # Lock-free read attempts before waiting on the writers' flock
+READ_RETRY_SECONDS = 0.001
+
+
+class SharedStateFile:
+    """JSON values in a memory-mapped file shared by every worker process
+
+    Writers serialize on an flock and bump the sequence around each write; readers copy
+    without locking and retry if the sequence moved underneath them. A writer killed mid-write
+    leaves the sequence odd; the next one to take the flock resets the values.
+    """
+
+    def __init__(self, path, size=RUNTIME_STATE_SHARED_BYTES):
+        if fcntl is None:
+            raise RuntimeError("Shared runtime state needs fcntl (Unix)")
+        self.size = size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+
+    def sequence(self):
+        return HEADER.unpack_from(self.map, 0)[0]
+
+    def read(self):
+        """(sequence, values) from a consistent copy"""
+        for _ in range(READ_ATTEMPTS):
+            sequence, length = HEADER.unpack_from(self.map, 0)
+            if sequence % 2 == 0:
+                data = self.map[HEADER.size:HEADER.size + length]
+                if self.sequence() == sequence:
+                    return sequence, json.loads(data) if length else {}
+            time.sleep(READ_RETRY_SECONDS)  # Write in progress
+
+        # Still mid-write: wait for the writer, or recover from one that died
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            return self._read_locked()
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _read_locked(self):
+        sequence, length = HEADER.unpack_from(self.map, 0)
+        if sequence % 2:
+            # Holding the flock proves no writer is active, so the last one died mid-write and its
+            # payload is torn; start over empty and let keys fall back to their initial values
+            HEADER.pack_into(self.map, 0, sequence + 1, 0)
+            return sequence + 1, {}
+        data = self.map[HEADER.size:HEADER.size + length]
+        return sequence, json.loads(data) if length else {}
+
+    def write(self, changes, only_if_empty=False):
+        """Merge changes into the stored values, returns the new (sequence, values)"""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            sequence, values = self._read_locked()
+            if only_if_empty and sequence:
+                return sequence, values
+            values.update(changes)
+            data = json.dumps(values, default=str).encode('utf-8')
+            if len(data) > self.size - HEADER.size:
+                raise ValueError(f"Shared state of {len(data)} bytes exceeds RUNTIME_STATE_SHARED_BYTES")
+
+            HEADER.pack_into(self.map, 0, sequence + 1, 0)
+            self.map[HEADER.size:HEADER.size + len(data)] = data
+            HEADER.pack_into(self.map, 0, sequence + 2, len(data))
+            return sequence + 2, json.loads(data)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self.map.close()
+        os.close(self.fd)
+
+
+class RuntimeState:
+    """App state published as immutable snapshots
+
+    Reads return the current snapshot without locking; writes copy it, apply the change and
+    swap the new snapshot in, so a reader never sees a half-applied update. Values stored in
+    the state must not be mutated in place; assign a new value instead.
+    With a shared path, shared_keys are kept in a SharedStateFile so every worker process
+    sees the same values (JSON-serializable values only); other keys stay per process.
+    """
+
+    def __init__(self, initial, shared_keys=(), path=RUNTIME_STATE_SHARED_PATH):
+        self.lock = threading.Lock()
+        self.shared_keys = frozenset(shared_keys)
+        self.store = SharedStateFile(path) if path and self.shared_keys else None
+        self.local = dict(initial)
+        self.sequence = None
+        self.current = MappingProxyType(dict(initial))
+        if self.store is not None:
+            # The first process to start seeds the shared values, later ones adopt them
+            sequence, values = self.store.write({key: initial.get(key) for key in self.shared_keys},
+                                                only_if_empty=True)
+            self._publish(sequence, values)
+
+    def _publish(self, sequence, shared_values):
+        snapshot = dict(self.local)
+        snapshot.update((key, value) for key, value in shared_values.items() if key in self.shared_keys)
+        self.current = MappingProxyType(snapshot)
+        self.sequence = sequence
+
+    def snapshot(self):
+        """Read-only mapping of the whole state, consistent across keys"""
+        if self.store is not None and self.store.sequence() != self.sequence:
+            with self.lock:
+                self._publish(*self.store.read())
+        return self.current
+
+    def __getitem__(self, key):
+        return self.snapshot()[key]
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def update(self, changes=None, **kwargs):
+        """Apply several changes as one snapshot swap"""
+        changes = dict(changes or {}, **kwargs)
+        with self.lock:
+            if self.store is None:
+                self.local.update(changes)
+                self.current = MappingProxyType(dict(self.local))
+                return
+
+            shared = {key: value for key, value in changes.items() if key in self.shared_keys}
+            self.local.update((key, value) for key, value in changes.items() if key not in self.shared_keys)
+            if shared:
+                self._publish(*self.store.write(shared))
+            else:
+                self._publish(*self.store.read())
@@ -1,5 +1,6 @@
 // Enhanced Admin Panel JavaScript
 let statusCheckInterval;
+let eventSource = null;
 let currentUsers = [];
 let currentSchedules = [];
 
@@ -11,8 +12,8 @@ document.addEventListener('DOMContentLoaded', function() {
     loadSchedules();
     loadAttendanceRecords();
     
-    // Start status checking
-    statusCheckInterval = setInterval(checkSystemStatus, 3000);
+    // Start status updates
+    connectEvents();
     
     // Setup form handlers
     setupFormHandlers();
@@ -133,24 +134,58 @@ function loadStatistics() {
         .catch(error => console.error('Error loading attendance count:', error));
 }
 
+function applySystemStatus(data) {
+    // Update registration panel
+    if ('new_user_detected' in data) {
+        const registrationPanel = document.getElementById('registration-panel');
+        registrationPanel.style.display = data.new_user_detected ? 'block' : 'none';
+    }
+    
+    // Update camera status
+    if ('camera_running' in data) {
+        document.getElementById('camera-status-stat').textContent = data.camera_running ? 'ON' : 'OFF';
+    }
+    
+    if ('registered_users' in data) {
+        document.getElementById('total-users').textContent = data.registered_users || 0;
+    }
+}
+
 function checkSystemStatus() {
     fetch('/api/status')
         .then(response => response.json())
-        .then(data => {
-            // Update registration panel
-            const registrationPanel = document.getElementById('registration-panel');
-            if (data.new_user_detected) {
-                registrationPanel.style.display = 'block';
-            } else {
-                registrationPanel.style.display = 'none';
-            }
-            
-            // Update camera status
-            document.getElementById('camera-status-stat').textContent = data.camera_running ? 'ON' : 'OFF';
-        })
+        .then(applySystemStatus)
         .catch(error => console.error('Error checking status:', error));
 }
 
+function stopPolling() {
+    if (statusCheckInterval) {
+        clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+    }
+}
+
+// Subscribe to pushed status updates, poll only while the stream is down
+function connectEvents() {
+    if (!window.EventSource) {
+        statusCheckInterval = setInterval(checkSystemStatus, 3000);
+        return;
+    }
+    
+    eventSource = new EventSource('/api/events');
+    ['status', 'registration_needed', 'registration_resolved', 'camera'].forEach(type => {
+        eventSource.addEventListener(type, event => applySystemStatus(JSON.parse(event.data)));
+    });
+    eventSource.addEventListener('attendance_marked', loadStatistics);
+    eventSource.onopen = stopPolling;
+    eventSource.onerror = function() {
+        // The browser reconnects on its own; poll meanwhile
+        if (!statusCheckInterval) {
+            statusCheckInterval = setInterval(checkSystemStatus, 3000);
+        }
+    };
+}
+
 // User Management
 function loadUsers() {
     fetch('/api/users')
@@ -173,6 +208,7 @@ function displayUsers(users) {
     
     usersGrid.innerHTML = users.map(user => `
         <div class="user-card">
+            ${thumbnailUrl(user.face_image_path) ? `<img class="user-thumb" src="/${thumbnailUrl(user.face_image_path)}" alt="" loading="lazy">` : ''}
             <h4>${user.name}</h4>
             <p><strong>ID:</strong> ${user.user_id}</p>
             <p><strong>Role:</strong> ${user.role}</p>
@@ -189,6 +225,12 @@ function displayUsers(users) {
     `).join('');
 }
 
+// Thumbnails exist only for images saved by the content-addressed image store
+function thumbnailUrl(imagePath) {
+    const match = /^(face_images\/[0-9a-f]{2}\/[0-9a-f]{2}\/[0-9a-f]{40})\.(jpg|webp)$/.exec(imagePath || '');
+    return match ? `${match[1]}_thumb.${match[2]}` : null;
+}
+
 function updateUserFilter(users) {
     const userFilter = document.getElementById('user-filter');
     userFilter.innerHTML = '<option value="">All Users</option>' +
@@ -421,6 +463,23 @@ function deleteAttendanceRecord(recordId) {
     });
 }
 
+// Poll a background enrollment job until it finishes
+function followEnrollment(jobId, onFinished) {
+    fetch(`/api/enrollments/${jobId}`)
+    .then(response => response.json())
+    .then(job => {
+        if (['completed', 'rejected', 'failed'].includes(job.status)) {
+            onFinished(job);
+        } else {
+            setTimeout(() => followEnrollment(jobId, onFinished), 1000);
+        }
+    })
+    .catch(error => {
+        console.error('Error checking enrollment:', error);
+        setTimeout(() => followEnrollment(jobId, onFinished), 3000);
+    });
+}
+
 // Form Handlers
 function setupFormHandlers() {
     // Registration form
@@ -437,7 +496,20 @@ function setupFormHandlers() {
         })
         .then(response => response.json())
         .then(result => {
-            if (result.success) {
+            if (result.success && result.job_id) {
+                // Frames are captured and encoded in the background
+                alert(result.message);
+                followEnrollment(result.job_id, job => {
+                    if (job.status === 'completed') {
+                        alert('User registered successfully!');
+                        this.reset();
+                        loadUsers();
+                        loadStatistics();
+                    } else {
+                        alert('Registration failed: ' + job.message);
+                    }
+                });
+            } else if (result.success) {
                 alert('User registered successfully!');
                 this.reset();
                 loadUsers();
@@ -470,7 +542,15 @@ function setupFormHandlers() {
         })
         .then(response => response.json())
         .then(result => {
-            if (result.success) {
+            if (result.success && result.job_id) {
+                alert(result.message);
+                closeModal('add-user-modal');
+                followEnrollment(result.job_id, job => {
+                    alert(job.status === 'completed' ? 'User added successfully!' : 'Failed to add user: ' + job.message);
+                    loadUsers();
+                    loadStatistics();
+                });
+            } else if (result.success) {
                 alert(`User ${isUpdate ? 'updated' : 'added'} successfully!`);
                 closeModal('add-user-modal');
                 loadUsers();
@@ -559,7 +639,8 @@ window.onclick = function(event) {
 
 // Cleanup on page unload
 window.addEventListener('beforeunload', function() {
-    if (statusCheckInterval) {
-        clearInterval(statusCheckInterval);
+    stopPolling();
+    if (eventSource) {
+        eventSource.close();
     }
 });
\ No newline at end of file
@@ -1,15 +1,29 @@
 // Student view JavaScript
 let statusCheckInterval;
 let lastRecognitionTime = 0;
+let eventSource = null;
+let currentStatus = {};
 
-// Check system status and update UI
+// Server-sent events that carry (part of) the /api/status payload
+const STATUS_EVENTS = [
+    'status', 'recognition', 'recognition_cleared', 'registration_needed',
+    'registration_resolved', 'window_open', 'window_close', 'window_updated', 'camera'
+];
+
+// Update UI from a status payload
+function applyStatus(data) {
+    updateAttendanceStatus(data.attendance_status);
+    updateStudentInfo(data.last_recognition);
+    updateSystemMessage(data);
+}
+
+// Check system status and update UI (polling fallback)
 function checkStatus() {
     fetch('/api/status')
         .then(response => response.json())
         .then(data => {
-            updateAttendanceStatus(data.attendance_status);
-            updateStudentInfo(data.last_recognition);
-            updateSystemMessage(data);
+            currentStatus = data;
+            applyStatus(data);
         })
         .catch(error => {
             console.error('Error checking status:', error);
@@ -17,6 +31,41 @@ function checkStatus() {
         });
 }
 
+// Merge a pushed event into the current status
+function handleStatusEvent(event) {
+    Object.assign(currentStatus, JSON.parse(event.data));
+    applyStatus(currentStatus);
+}
+
+function startPolling(interval = 2000) {
+    if (statusCheckInterval) return;
+    checkStatus();
+    statusCheckInterval = setInterval(checkStatus, interval);
+}
+
+function stopPolling() {
+    if (statusCheckInterval) {
+        clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+    }
+}
+
+// Subscribe to pushed status updates, poll only while the stream is down
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    
+    eventSource = new EventSource('/api/events');
+    STATUS_EVENTS.forEach(type => eventSource.addEventListener(type, handleStatusEvent));
+    eventSource.onopen = stopPolling;
+    eventSource.onerror = function() {
+        // The browser reconnects on its own; keep the UI fresh meanwhile
+        startPolling();
+    };
+}
+
 // Update attendance status display
 function updateAttendanceStatus(attendanceStatus) {
     const statusElement = document.getElementById('attendance-status');
@@ -113,9 +162,8 @@ function showSystemMessage(message, type = 'info') {
 function initializeApp() {
     console.log('Face Recognition Attendance System - Student View');
     
-    // Start status checking
-    checkStatus();
-    statusCheckInterval = setInterval(checkStatus, 2000);
+    // Start status updates
+    connectEvents();
     
     // Handle video feed errors
     const videoFeed = document.getElementById('video-feed');
@@ -131,8 +179,9 @@ function initializeApp() {
 
 // Cleanup function
 function cleanup() {
-    if (statusCheckInterval) {
-        clearInterval(statusCheckInterval);
+    stopPolling();
+    if (eventSource) {
+        eventSource.close();
     }
 }
 
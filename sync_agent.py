@@ -0,0 +1,251 @@
+"""
+Edge sync agent
+Uploads attendance and local user/face changes from the kiosk's SQLite database to the central
+MySQL database in batches, then pulls roster, face sample and schedule changes using change
+watermarks. The kiosk keeps working on its local database while the central one is unreachable.
+Usage:
+    python sync_agent.py [--once]
+"""
+
+import argparse
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+import metrics
+
+sync_rounds = metrics.histogram('sync_round_seconds', 'Duration of a full push/pull sync round')
+sync_failures = metrics.counter('sync_failures_total', 'Sync rounds that stopped on a central database error')
+
+EPOCH = datetime(1970, 1, 2)  # Watermark before any change (TIMESTAMP columns start at 1970-01-01 00:00:01 UTC)
+
+
+def synced_rows(direction, kind):
+    return metrics.counter('sync_rows_total', 'Rows copied between the edge and central databases',
+                           direction=direction, kind=kind)
+
+
+class SyncError(Exception):
+    """The central database could not be reached or rejected a batch"""
+
+
+def central_database():
+    """Connection to the central MySQL database, raises SyncError while it is unreachable"""
+    from db_enhanced import DatabaseManager
+    try:
+        central = DatabaseManager()
+    except Exception as e:
+        raise SyncError(f"central database unavailable: {e}")
+    if central.connection is None:
+        raise SyncError("central database unavailable")
+    return central
+
+
+class SyncAgent:
+    """Background push/pull between a SQLiteDatabaseManager and the central database"""
+    
+    def __init__(self, local, connect_central=central_database, interval=config.SYNC_INTERVAL_SECONDS,
+                 batch_size=config.SYNC_BATCH_SIZE, overlap=config.SYNC_OVERLAP_SECONDS, on_pull=None):
+        self.local = local
+        self.on_pull = on_pull  # Called with the round's counts when pulled rows changed local state (e.g. to reload caches)
+        self.connect_central = connect_central
+        self.interval = interval
+        self.batch_size = batch_size
+        self.overlap = timedelta(seconds=overlap)
+        self.central = None
+        self.lock = threading.Lock()  # One round at a time (background loop and /api/sync)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_success = None
+        self.last_error = None
+        self.last_round = {}
+        metrics.REGISTRY.register_collector(lambda: {
+            'sync_pending_attendance': ('Attendance records not yet uploaded',
+                                        self.local.get_sync_backlog().get('attendance', 0)),
+            'sync_last_success_age_seconds': ('Seconds since the last complete sync round',
+                                              time.time() - self.last_success if self.last_success else -1)
+        })
+    
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name='sync-agent', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval + 5)
+    
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.sync_once()
+            self.stop_event.wait(self.interval)
+    
+    def sync_once(self):
+        """Run one push/pull round, returns rows copied per kind or None if the round failed"""
+        with self.lock, sync_rounds.time():
+            try:
+                if self.central is None:
+                    self.central = self.connect_central()
+                else:
+                    self.central.connect()
+                    if self.central.connection is None:
+                        raise SyncError("central database unavailable")
+                
+                # Users first: central attendance and face samples reference them
+                counts = {
+                    'users_pushed': self.push_users(),
+                    'face_samples_pushed': self.push_face_samples(),
+                    'attendance_pushed': self.push_attendance(),
+                    'attendance_deletions_pushed': self.push_attendance_deletions(),
+                    'users_pulled': self.pull_changes('users', self.central.get_users_changed_since,
+                                                      self.local.apply_central_users),
+                    'schedules_pulled': self.pull_changes('schedules', self.central.get_schedules_changed_since,
+                                                          self.local.apply_central_schedules),
+                    'face_samples_pulled': self.pull_face_samples()
+                }
+            except Exception as e:
+                sync_failures.inc()
+                self.last_error = f"{time.strftime('%Y-%m-%d %H:%M:%S')}: {e}"
+                print(f"Sync failed, retrying in {self.interval}s: {e}")
+                return None
+            
+            self.last_success = time.time()
+            self.last_error = None
+            self.last_round = counts
+            if self.on_pull and any(count for kind, count in counts.items() if kind.endswith('_pulled')):
+                self.on_pull(counts)
+            return counts
+    
+    def _batches(self, fetch):
+        """Yield batches from fetch(limit) until a short one"""
+        while True:
+            batch = fetch(self.batch_size)
+            if batch:
+                yield batch
+            if len(batch) < self.batch_size:
+                return
+    
+    def push_users(self):
+        pushed = 0
+        for users in self._batches(self.local.get_unsynced_users):
+            if not self.central.upsert_users(users):
+                raise SyncError("user upload rejected")
+            self.local.mark_users_synced(users)
+            pushed += len(users)
+        synced_rows('push', 'users').inc(pushed)
+        return pushed
+    
+    def push_face_samples(self):
+        pushed = 0
+        for user_ids in self._batches(self.local.get_changed_sample_users):
+            # Clear the change flags first so an edit during the upload is flagged again
+            self.local.clear_sample_changes(user_ids)
+            for index, user_id in enumerate(user_ids):
+                if not self.central.set_user_face_samples(user_id, self.local.get_user_face_samples(user_id)):
+                    self.local.flag_sample_changes(user_ids[index:])
+                    raise SyncError("face sample upload rejected")
+                pushed += 1
+        synced_rows('push', 'face_samples').inc(pushed)
+        return pushed
+    
+    def push_attendance(self):
+        pushed = 0
+        for rows in self._batches(self.local.get_unsynced_attendance):
+            if not self.central.upsert_attendance([row[1:] for row in rows]):
+                raise SyncError("attendance upload rejected")
+            self.local.mark_attendance_synced(rows)
+            pushed += len(rows)
+        synced_rows('push', 'attendance').inc(pushed)
+        return pushed
+    
+    def push_attendance_deletions(self):
+        pushed = 0
+        for rows in self._batches(self.local.get_attendance_deletions):
+            if not self.central.delete_attendance_entries([row[1:] for row in rows]):
+                raise SyncError("attendance deletion rejected")
+            self.local.clear_attendance_deletions([row[0] for row in rows])
+            pushed += len(rows)
+        synced_rows('push', 'attendance_deletions').inc(pushed)
+        return pushed
+    
+    def pull_changes(self, kind, fetch, apply):
+        """Copy rows changed since the stored (updated_at) watermark, oldest first; returns how many
+        changed local rows
+        
+        Each round re-reads the last SYNC_OVERLAP_SECONDS so rows committed late with an older
+        updated_at are not skipped; apply() leaves rows it already has unchanged and doesn't count them.
+        """
+        key = f'{kind}_watermark'
+        stored = self.local.get_sync_state(key)
+        since = datetime.fromisoformat(stored) - self.overlap if stored else EPOCH
+        last_id = 0
+        pulled = 0
+        while True:
+            rows = fetch(since, last_id, self.batch_size)
+            if rows is None:
+                raise SyncError(f"{kind} download failed")
+            if rows:
+                pulled += apply(rows)
+                since, last_id = rows[-1]['updated_at'], rows[-1]['id']
+                self.local.set_sync_state(key, since.isoformat(sep=' '))
+            if len(rows) < self.batch_size:
+                break
+        synced_rows('pull', kind).inc(pulled)
+        return pulled
+    
+    def pull_face_samples(self):
+        """Replace the local samples of every user whose central samples changed"""
+        after_id = int(self.local.get_sync_state('face_samples_watermark', 0))
+        pulled = 0
+        while True:
+            changes = self.central.get_face_sample_changes(after_id, self.batch_size)
+            if changes is None:
+                raise SyncError("face sample download failed")
+            for user_id, newest in changes:
+                samples = self.central.get_user_face_samples(user_id)
+                if samples is None:
+                    raise SyncError("face sample download failed")
+                if self.local.apply_central_face_samples(user_id, samples):
+                    pulled += 1
+                after_id = max(after_id, newest)
+                self.local.set_sync_state('face_samples_watermark', str(after_id))
+            if len(changes) < self.batch_size:
+                break
+        synced_rows('pull', 'face_samples').inc(pulled)
+        return pulled
+    
+    def status(self):
+        return {
+            'online': self.last_error is None and self.last_success is not None,
+            'last_success': datetime.fromtimestamp(self.last_success).isoformat() if self.last_success else None,
+            'last_error': self.last_error,
+            'last_round': self.last_round,
+            'pending': self.local.get_sync_backlog(),
+            'watermarks': {key: self.local.get_sync_state(f'{key}_watermark')
+                           for key in ('users', 'schedules', 'face_samples')}
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the edge SQLite database with the central database")
+    parser.add_argument('--once', action='store_true', help="Run one round and exit")
+    args = parser.parse_args()
+    
+    from db_sqlite import SQLiteDatabaseManager
+    agent = SyncAgent(SQLiteDatabaseManager(config.SQLITE_PATH))
+    if args.once:
+        print(agent.sync_once())
+        return
+    agent.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        agent.stop()
+
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Gallery storage tests: samples added to an int8 gallery after load() are matched with the same
+accuracy as float32, however far outside the range fitted at load time they fall
+Run with: python -m pytest test_gallery.py
+"""
+
+import numpy as np
+
+from gallery import ENCODING_SIZE, FaceGallery, pack_encoding
+
+PERSON_SPREAD = 0.055  # Like dlib encodings: people ~0.9 apart
+MAX_ERROR = 0.01       # int8 rounding costs well under this in distance
+
+
+def people(count, seed, spread=PERSON_SPREAD):
+    return np.random.default_rng(seed).normal(0, spread, (count, ENCODING_SIZE)).astype(np.float32)
+
+
+def distance_error(gallery, reference, queries):
+    got = np.array([distance for _, distance in gallery.match(queries)])
+    want = np.array([distance for _, distance in reference.match(queries)])
+    return float(np.max(np.abs(got - want)))
+
+
+def test_int8_add_after_load_keeps_distances():
+    loaded = people(3, seed=0, spread=PERSON_SPREAD / 4)  # Small initial gallery, narrow fitted range
+    added = people(20, seed=1)
+    gallery = FaceGallery(dtype='int8')
+    reference = FaceGallery(dtype='float32')
+    for target in (gallery, reference):
+        target.load([(f"L{index}", pack_encoding(encoding)) for index, encoding in enumerate(loaded)])
+        for index, encoding in enumerate(added):
+            target.add(f"A{index}", encoding)
+    
+    queries = added + np.random.default_rng(2).normal(0, 0.015, added.shape).astype(np.float32)
+    assert distance_error(gallery, reference, queries) < MAX_ERROR
+    assert [identity for identity, _ in gallery.match(queries)] == [f"A{index}" for index in range(len(added))]
+    assert distance_error(gallery, reference, loaded) < MAX_ERROR
+
+
+def test_int8_add_to_empty_gallery():
+    gallery = FaceGallery(dtype='int8')
+    reference = FaceGallery(dtype='float32')
+    added = people(5, seed=3, spread=PERSON_SPREAD * 4)  # Beyond the default range assumed before fitting
+    for target in (gallery, reference):
+        for index, encoding in enumerate(added):
+            target.add(f"A{index}", encoding)
+    assert distance_error(gallery, reference, added) < MAX_ERROR
\ No newline at end of file
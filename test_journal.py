@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Attendance journal tests: marks survive a database outage, are replayed once it is back, and a
+journal reopened after a crash drops its torn tail and deletes segments behind the checkpoint
+Run with: python -m pytest test_journal.py
+"""
+
+import os
+import time
+
+import config
+from db_enhanced import DatabaseManager
+from journal import AttendanceJournal, JournalReplayer, read_segment
+
+MARKS = [('S001', '2026-10-19', '08:01:00', 1), ('S002', '2026-10-19', '08:02:00', 1),
+         ('S003', '2026-10-19', '08:03:00', 1)]
+
+
+class Connection:
+    def is_connected(self):
+        return True
+
+
+class RecordingDatabase:
+    """Stands in for MySQL once it is reachable again"""
+    
+    def __init__(self):
+        self.connection = Connection()
+        self.rows = []
+    
+    def upsert_attendance(self, rows):
+        self.rows.extend(rows)
+        return True
+
+
+def unreachable_database(monkeypatch):
+    """A DatabaseManager that was connected at startup, with MySQL gone since"""
+    monkeypatch.setattr(config, 'DB_CONFIG', dict(config.DB_CONFIG, host='127.0.0.1', port=1, connection_timeout=1))
+    db = DatabaseManager.__new__(DatabaseManager)
+    db.connection = None
+    db.journal = None
+    db.archive = None
+    db.attendance_version = 0
+    return db
+
+
+def test_replay_survives_outage(tmp_path, monkeypatch):
+    journal = AttendanceJournal(str(tmp_path))
+    for user_id, day, at, schedule_id in MARKS:
+        journal.append(user_id, day, at, schedule_id)
+    
+    replayer = JournalReplayer(journal, unreachable_database(monkeypatch), batch_size=2, interval=0.05)
+    assert replayer.replay_once() is False
+    assert journal.stats()['depth'] == len(MARKS)
+    
+    # The background loop keeps retrying through the outage instead of dying
+    replayer.start()
+    time.sleep(0.3)
+    assert replayer.thread.is_alive()
+    replayer.stop()
+    assert journal.stats()['depth'] == len(MARKS)
+    
+    database = RecordingDatabase()
+    replayer.db = database
+    while replayer.replay_once():
+        pass
+    assert journal.stats()['depth'] == 0
+    assert [row[0] for row in database.rows] == [mark[0] for mark in MARKS]
+    assert database.rows[0] == ('S001', '2026-10-19', '08:01:00', 'Present', 1)
+    journal.close()
+
+
+def test_mark_survives_journal_write_error(tmp_path, monkeypatch):
+    journal = AttendanceJournal(str(tmp_path))
+    
+    def disk_full(*args):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(journal, 'append_many', disk_full)
+    db = unreachable_database(monkeypatch)
+    db.journal = journal
+    # Neither the journal nor MySQL took the mark: reported as failed instead of raising
+    assert db.mark_attendance('S001', 1) is False
+    journal.close()
+
+
+def test_reopen_truncates_torn_tail_and_checkpoints(tmp_path):
+    directory = str(tmp_path)
+    journal = AttendanceJournal(directory, segment_bytes=200)  # Roll after about two records
+    seqs = [journal.append(user_id, day, at, schedule_id) for user_id, day, at, schedule_id in MARKS * 2]
+    journal.commit(seqs[:3])
+    journal.close()
+    segments = sorted(path for path in os.listdir(directory) if path.startswith('journal-'))
+    assert len(segments) > 2
+    
+    # A crash in the middle of a write leaves half a record at the end of the last segment
+    last = os.path.join(directory, segments[-1])
+    good_size = os.path.getsize(last)
+    with open(last, 'ab') as f:
+        f.write(b'\x40\x00\x00\x00\x01\x02\x03\x04{"user_id": "S0')
+    
+    journal = AttendanceJournal(directory, segment_bytes=200)
+    assert os.path.getsize(last) == good_size
+    assert all(end <= good_size for _, _, end in read_segment(last))
+    assert journal.stats()['depth'] == len(seqs)  # Nothing was checkpointed before the crash
+    assert journal.next_seq == seqs[-1] + 1
+    
+    journal.commit(seqs[:4])
+    journal.checkpoint()
+    with open(os.path.join(directory, 'checkpoint')) as f:
+        assert int(f.read()) == seqs[3]
+    remaining = [first for first, _ in journal.segments]
+    assert remaining[0] <= seqs[4]
+    assert all(os.path.exists(path) for _, path in journal.segments)
+    assert not any(os.path.exists(os.path.join(directory, name)) for name in segments
+                   if int(name[8:-4]) < remaining[0])
+    
+    journal.commit(seqs)
+    journal.checkpoint()
+    assert len(journal.segments) == 1
+    assert journal.stats()['depth'] == 0
+    journal.close()
+    
+    # Reopening after the checkpoint replays nothing
+    journal = AttendanceJournal(directory, segment_bytes=200)
+    assert journal.stats()['depth'] == 0
+    journal.close()
\ No newline at end of file
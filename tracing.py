@@ -0,0 +1,140 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+import cv2
+
+import metrics
+from config import TRACE_RING_SIZE, TRACE_SLOW_FRAME_MS, TRACE_SLOW_FRAMES_KEPT, TRACE_THUMB_WIDTH
+
+end_to_end_seconds = metrics.histogram('frame_end_to_end_seconds', 'Capture to end of processing, per frame')
+capture_to_commit_seconds = metrics.histogram('frame_capture_to_commit_seconds',
+                                              'Capture to attendance write committed')
+slow_frames_total = metrics.counter('slow_frames_total', 'Frames over the slow-frame threshold')
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attrs', 'start')
+    
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs['error'] = str(exc)
+        self.trace.add_span(self.name, self.start, time.perf_counter(), **self.attrs)
+        return False
+
+
+class FrameTrace:
+    """Stage spans for one frame, timed relative to its capture"""
+    
+    def __init__(self, frame_id, capture_time=None):
+        self.frame_id = frame_id
+        self.capture_time = capture_time or time.time()  # Wall clock, from the camera
+        self.started = time.perf_counter()
+        # Time the frame waited between capture and processing; span offsets start from capture
+        self.queued_ms = max(0.0, (time.time() - self.capture_time) * 1000)
+        self.spans = []
+        self.committed_at = None
+        self.total_ms = None
+    
+    def span(self, name, **attrs):
+        """Context manager recording one stage"""
+        return _Span(self, name, attrs)
+    
+    def add_span(self, name, start, end, **attrs):
+        """Record a stage from perf_counter start/end values"""
+        self.spans.append({
+            'name': name,
+            'start_ms': round(self.queued_ms + (start - self.started) * 1000, 3),
+            'duration_ms': round((end - start) * 1000, 3),
+            **attrs
+        })
+    
+    def mark_committed(self):
+        """Attendance write committed for this frame"""
+        if self.committed_at is None:
+            self.committed_at = time.time()
+            capture_to_commit_seconds.observe(self.committed_at - self.capture_time)
+    
+    def to_dict(self):
+        return {
+            'frame_id': self.frame_id,
+            'capture_time': self.capture_time,
+            'queued_ms': round(self.queued_ms, 3),
+            'total_ms': self.total_ms,
+            'capture_to_commit_ms': round((self.committed_at - self.capture_time) * 1000, 3)
+            if self.committed_at else None,
+            'spans': self.spans
+        }
+
+
+class FrameTracer:
+    """Bounded ring of recent frame traces, plus the slowest frames with thumbnails"""
+    
+    def __init__(self, ring_size=TRACE_RING_SIZE, slow_ms=TRACE_SLOW_FRAME_MS, slow_kept=TRACE_SLOW_FRAMES_KEPT):
+        self.slow_ms = slow_ms
+        self.ring = deque(maxlen=ring_size)
+        self.slow = deque(maxlen=slow_kept)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+    
+    def start(self, capture_time=None):
+        """Begin a trace for a frame captured at capture_time (epoch seconds)"""
+        return FrameTrace(next(self.ids), capture_time)
+    
+    def finish(self, trace, frame=None):
+        """Close a trace, keeping it (and a thumbnail of frame) if it was slow"""
+        end = time.time()
+        trace.total_ms = round((end - trace.capture_time) * 1000, 3)
+        end_to_end_seconds.observe(end - trace.capture_time)
+        
+        thumbnail = None
+        slow = trace.total_ms >= self.slow_ms
+        if slow:
+            slow_frames_total.inc()
+            if frame is not None:
+                thumbnail = self._thumbnail(frame)
+        
+        with self.lock:
+            self.ring.append(trace)
+            if slow:
+                self.slow.append((trace, thumbnail))
+        return trace
+    
+    @staticmethod
+    def _thumbnail(frame):
+        try:
+            scale = TRACE_THUMB_WIDTH / frame.shape[1]
+            small = cv2.resize(frame, (TRACE_THUMB_WIDTH, max(1, int(frame.shape[0] * scale))),
+                               interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, 70])
+            return buffer.tobytes() if ret else None
+        except Exception as e:
+            print(f"Error creating trace thumbnail: {e}")
+            return None
+    
+    def recent(self, limit=50):
+        with self.lock:
+            traces = list(self.ring)[-limit:]
+        return [trace.to_dict() for trace in reversed(traces)]
+    
+    def slow_frames(self):
+        with self.lock:
+            slow = list(self.slow)
+        return [dict(trace.to_dict(), has_thumbnail=thumbnail is not None) for trace, thumbnail in reversed(slow)]
+    
+    def thumbnail(self, frame_id):
+        with self.lock:
+            for trace, thumbnail in self.slow:
+                if trace.frame_id == frame_id:
+                    return thumbnail
+        return None
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+Unknown-face store
+Faces the matcher can't identify are clustered online instead of forgotten. Each encoding joins the
+nearest cluster centroid within UNKNOWN_CLUSTER_DISTANCE (leader clustering) or starts a new
+cluster. Centroids sit in one preallocated matrix, so a lookup is a single matrix-vector product
+however full the store is, and once UNKNOWN_MAX_CLUSTERS are in use the least recently seen cluster
+is evicted. Each cluster keeps its UNKNOWN_BEST_SIGHTINGS sharpest crops with their encodings, asks
+for registration once, and can be enrolled as a whole.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+from enrollment import frame_score
+from face_quality import FaceQualityGate
+from gallery import ENCODING_SIZE
+from image_store import get_image_store
+
+lookup_seconds = metrics.stage_timer('unknown_cluster')
+sightings_added = metrics.counter('unknown_face_sightings_total', 'Unrecognized faces added to the unknown-face store')
+clusters_created = metrics.counter('unknown_clusters_created_total', 'Unknown-face clusters started')
+clusters_evicted = metrics.counter('unknown_clusters_evicted_total', 'Unknown-face clusters evicted to stay within capacity')
+
+
+class UnknownCluster:
+    """One unrecognized person: sighting counts and best crops (the centroid lives in the store)"""
+    
+    def __init__(self, cluster_id, slot, now):
+        self.cluster_id = cluster_id
+        self.slot = slot                # Row in the store's centroid matrix
+        self.sightings = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.status = 'new'             # prompted, ignored or enrolling
+        self.best = []                  # Min-heap of (score, seq, encoding, JPEG crop)
+    
+    def to_dict(self):
+        return {
+            'cluster_id': self.cluster_id,
+            'status': self.status,
+            'sightings': self.sightings,
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'crops': len(self.best)
+        }
+
+
+class UnknownFaceStore:
+    """Bounded, thread-safe store of unknown-face clusters"""
+    
+    def __init__(self, distance=config.UNKNOWN_CLUSTER_DISTANCE, max_clusters=config.UNKNOWN_MAX_CLUSTERS,
+                 best_sightings=config.UNKNOWN_BEST_SIGHTINGS, prompt_sightings=config.UNKNOWN_PROMPT_SIGHTINGS,
+                 quality_gate=None):
+        self.distance = distance
+        self.max_clusters = max_clusters
+        self.best_sightings = best_sightings
+        self.prompt_sightings = prompt_sightings
+        self.quality_gate = quality_gate or FaceQualityGate(use_landmarks=False)
+        self.centroids = np.zeros((max_clusters, ENCODING_SIZE), dtype=np.float32)
+        self.norms = np.full(max_clusters, np.inf, dtype=np.float32)  # Free slots never match
+        self.last_seen = np.zeros(max_clusters)
+        self.slots = [None] * max_clusters  # Cluster per centroid row
+        self.used = 0                       # Rows below this have held a cluster
+        self.free = []                      # Freed rows below used
+        self.clusters = {}                  # cluster_id -> cluster
+        self.ids = itertools.count(1)
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.clusters)
+    
+    def _nearest(self, encoding):
+        """(cluster or None, distance) of the closest centroid"""
+        if not self.clusters:
+            return None, float('inf')
+        centroids = self.centroids[:self.used]
+        squared = self.norms[:self.used] - 2.0 * (centroids @ encoding) + float(encoding @ encoding)
+        slot = int(np.argmin(squared))
+        return self.slots[slot], float(np.sqrt(max(squared[slot], 0.0)))
+    
+    def _create(self, encoding, now):
+        if not self.free and self.used == self.max_clusters:
+            self._remove(self.slots[int(np.argmin(self.last_seen))])
+            clusters_evicted.inc()
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = self.used
+            self.used += 1
+        cluster = UnknownCluster(next(self.ids), slot, now)
+        self.slots[slot] = cluster
+        self.clusters[cluster.cluster_id] = cluster
+        self.centroids[slot] = encoding
+        self.norms[slot] = encoding @ encoding
+        clusters_created.inc()
+        return cluster
+    
+    def _remove(self, cluster):
+        self.slots[cluster.slot] = None
+        self.norms[cluster.slot] = np.inf
+        self.free.append(cluster.slot)
+        del self.clusters[cluster.cluster_id]
+    
+    def observe(self, encoding, frame=None, face_location=None):
+        """Add one unrecognized face, returns the id of the cluster it joined or started
+        
+        frame/face_location: BGR frame and (top, right, bottom, left) box, to keep the crop if it is
+        among the cluster's sharpest
+        """
+        encoding = np.asarray(encoding, dtype=np.float32)
+        now = time.time()
+        with self.lock:
+            with lookup_seconds.time():
+                cluster, distance = self._nearest(encoding)
+            if cluster is None or distance > self.distance:
+                cluster = self._create(encoding, now)
+            else:
+                # Running mean, every sighting weighs the same
+                slot = cluster.slot
+                self.centroids[slot] += (encoding - self.centroids[slot]) / (cluster.sightings + 1)
+                self.norms[slot] = self.centroids[slot] @ self.centroids[slot]
+            cluster.sightings += 1
+            cluster.last_seen = now
+            self.last_seen[cluster.slot] = now
+        sightings_added.inc()
+        
+        if frame is not None:
+            self._keep_crop(cluster, encoding, frame, face_location)
+        return cluster.cluster_id
+    
+    def _keep_crop(self, cluster, encoding, frame, face_location):
+        _, scores = self.quality_gate.score(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), face_location)
+        score = frame_score(scores)
+        with self.lock:
+            if len(cluster.best) >= self.best_sightings and score <= cluster.best[0][0]:
+                return
+        
+        # Compressed outside the lock, and only when the crop makes the cut
+        ret, buffer = cv2.imencode('.jpg', get_image_store().crop(frame, face_location),
+                                   [cv2.IMWRITE_JPEG_QUALITY, config.FACE_IMAGE_QUALITY])
+        if not ret:
+            return
+        entry = (score, next(self.seq), encoding, buffer.tobytes())
+        with self.lock:
+            if len(cluster.best) < self.best_sightings:
+                heapq.heappush(cluster.best, entry)
+            else:
+                heapq.heappushpop(cluster.best, entry)
+    
+    def claim_prompt(self, cluster_ids):
+        """First of the clusters due a registration prompt (seen often enough, never prompted), or None"""
+        with self.lock:
+            for cluster_id in cluster_ids:
+                cluster = self.clusters.get(cluster_id)
+                if cluster is not None and cluster.status == 'new' and cluster.sightings >= self.prompt_sightings:
+                    cluster.status = 'prompted'
+                    return cluster_id
+        return None
+    
+    def list(self):
+        """All clusters, most recently seen first"""
+        with self.lock:
+            clusters = [cluster.to_dict() for cluster in self.clusters.values()]
+        return sorted(clusters, key=lambda cluster: cluster['last_seen'], reverse=True)
+    
+    def get(self, cluster_id):
+        with self.lock:
+            cluster = self.clusters.get(cluster_id)
+            return cluster.to_dict() if cluster is not None else None
+    
+    def crop(self, cluster_id, index):
+        """JPEG bytes of a cluster's index-th best crop, None if there is none"""
+        with self.lock:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                return None
+            best = sorted(cluster.best, key=lambda entry: entry[:2], reverse=True)
+        return best[index][3] if 0 <= index < len(best) else None
+    
+    def dismiss(self, cluster_id):
+        """Never prompt for this cluster again, e.g. a visitor"""
+        with self.lock:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                return False
+            cluster.status = 'ignored'
+            return True
+    
+    def start_enrollment(self, cluster_id):
+        """(encodings, BGR image) template of a cluster, marking it enrolling; None if missing or already enrolling
+        
+        The encodings are the best sightings plus the centroid, the image the sharpest crop
+        """
+        with self.lock:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None or cluster.status == 'enrolling':
+                return None
+            cluster.status = 'enrolling'
+            best = sorted(cluster.best, key=lambda entry: entry[:2], reverse=True)
+            encodings = [entry[2] for entry in best] + [self.centroids[cluster.slot].copy()]
+        image = cv2.imdecode(np.frombuffer(best[0][3], dtype=np.uint8), cv2.IMREAD_COLOR) if best else None
+        return encodings, image
+    
+    def finish_enrollment(self, cluster_id, registered):
+        """Drop an enrolled cluster, or let it be enrolled again after a rejected or failed job"""
+        with self.lock:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                return
+            if registered:
+                self._remove(cluster)
+            else:
+                cluster.status = 'prompted'
\ No newline at end of file